@@ -1,15 +1,20 @@
 """Конфигурация проекта."""
+import copy
 import json
 import os
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 
 class Config:
     """Класс для загрузки и хранения конфигурации."""
 
-    def __init__(self, config_path: str = None):
-        """Инициализация конфигурации."""
+    def __init__(self, config_path: str = None, data: Optional[Dict[str, Any]] = None):
+        """Инициализация конфигурации (из файла или готового словаря)."""
+        if data is not None:
+            self._data = data
+            return
+
         if config_path is None:
             config_path = Path(__file__).parent / "config.json"
 
@@ -33,6 +38,47 @@ class Config:
         """Получить значение по ключу."""
         return self.get(key)
 
+    def with_overrides(self, overrides: Dict[str, Any]) -> "Config":
+        """Копия конфигурации с наложенными значениями."""
+        return Config(data=_merge(self._data, overrides))
+
+    @property
+    def name(self) -> str:
+        """Имя сообщества (арендатора) в многопользовательском режиме."""
+        return self.get("name", "default")
+
+    def tenants(self) -> List["Config"]:
+        """Конфигурации сообществ процесса.
+
+        Каждый элемент списка tenants накладывается поверх общей конфигурации.
+        Без секции tenants процесс обслуживает одно сообщество - эту конфигурацию.
+        """
+        entries = self.get("tenants")
+        if not entries:
+            return [self]
+
+        base = {k: v for k, v in self._data.items() if k != "tenants"}
+        tenants = []
+        names = set()
+        paths = set()
+        for entry in entries:
+            name = entry.get("name")
+            if not name or name in names:
+                raise ValueError(f"Tenant name must be set and unique: {name!r}")
+
+            data = _merge(base, entry)
+            # Общий путь БД у разных сообществ смешал бы их состояние
+            if not (entry.get("database") or {}).get("path"):
+                data.setdefault("database", {})["path"] = f"memory/{name}.db"
+            path = data["database"]["path"]
+            if path in paths:
+                raise ValueError(f"Tenant {name!r} shares database path {path!r} with another tenant")
+
+            names.add(name)
+            paths.add(path)
+            tenants.append(Config(data=data))
+        return tenants
+
     @property
     def openrouter_api_key(self) -> str:
         """API ключ OpenRouter."""
@@ -74,6 +120,17 @@ class Config:
         return self.get("vk.creator_user_id")
 
 
+def _merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    """Рекурсивно наложить override на копию base."""
+    result = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = _merge(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
 # Глобальный экземпляр конфигурации
 _config = None
 
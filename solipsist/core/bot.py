@@ -1,60 +1,122 @@
 """Главный оркестратор бота."""
 import logging
+import time
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Dict, Iterator, List, Optional, Set
 
-from ..config.loader import load_config
+from ..config.loader import Config, load_config
+from ..services.clients import openrouter_client, vk_client
 from ..services.llm import OpenRouterClient
 from ..services.vk import VKClient
 from ..storage.database import Database
-from ..storage.models import Comment
+from ..storage.models import Comment, CommentProgress
+from ..utils.deadline import MIN_CALL_SECONDS, DeadlineExceeded, check, deadline, remaining
+from ..utils.priority import PRIORITY_BACKGROUND, PRIORITY_REPLY, llm_priority
+from ..utils.tracing import annotate, span, trace
 from ..perception.text import TextPerception
 from ..perception.image import ImagePerception
 from ..perception.video import VideoPerception
 from ..interpretation.classifier import CommentClassifier
 from ..interpretation.intrusion import IntrusionEvaluator
+from ..logic.digest import MonologueDigest
 from ..logic.monologue import MonologueGenerator
 from ..logic.response import ResponseGenerator
 from ..logic.revelation import ManifestGenerator
+from .ingest import CommentIngestor
+from .posts import PostActivityTracker
 from .state import StateManager
 
 logger = logging.getLogger(__name__)
 
+# Этапы, между которыми делится бюджет времени комментария, и их доли по умолчанию
+DEFAULT_STAGE_SHARES = {"perception": 3, "classification": 1, "response": 3, "publish": 1}
+
 
 class SolipsistBot:
     """Главный класс бота."""
 
-    def __init__(self):
-        """Инициализация бота."""
-        self.config = load_config()
+    def __init__(
+        self,
+        llm: Optional[OpenRouterClient] = None,
+        vk: Optional[VKClient] = None,
+        db: Optional[Database] = None,
+        config: Optional[Config] = None
+    ):
+        """Инициализация бота.
+
+        Сервисы можно передать готовыми (например, для replay или общий LLM-клиент
+        для нескольких сообществ); config - конфигурация сообщества.
+        """
+        self.config = config or load_config()
+        self.tenant = self.config.name
 
         # Инициализация сервисов
-        self.llm = OpenRouterClient()
-        self.vk = VKClient()
-        self.db = Database(self.config.get("database.path", "memory/solipsist.db"))
+        self.llm = llm or openrouter_client(self.config)
+        self.vk = vk or vk_client(self.config)
+        self.db = db or Database(self.config.get("database.path", "memory/solipsist.db"))
 
         # Инициализация менеджера состояний
-        self.state = StateManager(self.db)
+        self.state = StateManager(self.db, self.config)
+
+        # Выбор постов для опроса комментариев по их активности
+        self.post_tracker = PostActivityTracker(self.db, self.config)
+        self.ingestor = CommentIngestor(self.vk, self.db, self.config)
+        # Посты, где обработка нового комментария сорвалась в текущем опросе
+        self._unfinished_posts: Set[str] = set()
+
+        # Бюджет времени на комментарий: делится между этапами, ограничивает таймауты запросов
+        self.comment_deadline = self.config.get("comments.deadline_seconds", 90) or None
+        self.stage_shares = dict(DEFAULT_STAGE_SHARES)
+        self.stage_shares.update(self.config.get("comments.stage_shares", {}))
+        # Сколько раз откладывать комментарий, не уложившийся в бюджет, до завершения по умолчанию
+        self.deadline_retries = self.config.get("comments.deadline_retries", 1)
 
         # Инициализация модулей восприятия
         self.text_perception = TextPerception(self.llm)
-        self.image_perception = ImagePerception(self.llm)
+        self.image_perception = ImagePerception(
+            self.llm, batch_size=self.config.get("comments.vision_batch_size", 4)
+        )
         self.video_perception = VideoPerception(self.llm)
 
         # Инициализация интерпретации
-        self.classifier = CommentClassifier(self.llm, self.db)
+        self.classifier = CommentClassifier(
+            self.llm, self.db, batch_size=self.config.get("comments.classify_batch_size", 10)
+        )
+        # Классы, полученные пакетным запросом до обработки комментариев
+        self._prefetched_classes: Dict[str, str] = {}
         self.intrusion_evaluator = IntrusionEvaluator()
 
         # Инициализация логики
         self.monologue_generator = MonologueGenerator(self.llm, self.state)
         self.response_generator = ResponseGenerator(self.llm, self.state)
-        self.manifest_generator = ManifestGenerator(self.llm, self.vk, self.db, self.state)
+        self.manifest_generator = ManifestGenerator(self.llm, self.vk, self.db, self.state, self.config)
+        # Манифесты готовятся заранее, когда комментариев нет дольше idle_seconds
+        self.manifest_idle_seconds = self.config.get("manifests.idle_seconds", 60)
+        # Если к сроку публикации готового манифеста нет - сгенерировать его сразу
+        self.manifest_on_demand = self.config.get("manifests.generate_on_demand", True)
+        self._last_comment_at: Optional[float] = None
+        # Сводка монологов для манифеста: пополняется с каждым новым монологом
+        self.digest = MonologueDigest(self.llm, self.db, self.config)
 
-        logger.info("SolipsistBot initialized")
+        logger.info(f"SolipsistBot initialized (tenant {self.tenant})")
 
     def process_comment(self, comment_data: dict) -> Optional[str]:
         """Обработать комментарий через полный пайплайн."""
+        with trace(
+            "comment",
+            tenant=self.tenant,
+            comment_id=str(comment_data.get("id", "")),
+            post_id=str(comment_data.get("post_id", ""))
+        ):
+            try:
+                return self._process_comment(comment_data)
+            finally:
+                self._last_comment_at = time.monotonic()
+
+    def _process_comment(self, comment_data: dict) -> Optional[str]:
+        """Пайплайн обработки комментария (внутри трассы)."""
         try:
             # Создать объект комментария
             # Использовать timestamp из данных, если есть, иначе текущее время
@@ -76,58 +138,28 @@ class SolipsistBot:
                 timestamp=timestamp
             )
 
-            logger.info(f"Processing comment {comment.comment_id}")
-
-            # Перцепция
-            perception_data = {}
-            if comment.text:
-                perception_data["text"] = self.text_perception.analyze(comment.text)
-
-            if comment.image_url:
-                perception_data["image"] = self.image_perception.analyze(comment.image_url)
-
-            if comment.video_url:
-                perception_data["video"] = self.video_perception.analyze(comment.video_url)
-
-            # Интерпретация
-            classified_as = self.classifier.classify(comment.text or "", perception_data.get("text", {}))
-            comment.classified_as = classified_as
-
-            intrusion_score = self.intrusion_evaluator.evaluate(
-                classified_as,
-                perception_data.get("text", {}),
-                has_image=bool(comment.image_url),
-                has_video=bool(comment.video_url)
+            # Результаты уже завершённых этапов (если обработка прерывалась)
+            progress = self.db.get_comment_progress(comment.comment_id) or CommentProgress(
+                comment_id=comment.comment_id,
+                post_id=comment.post_id
             )
-            comment.intrusion_score = intrusion_score
-
-            # Обновление состояния
-            self.state.update_after_comment(intrusion_score, classified_as)
-
-            # Решение об ответе
-            response_text = self.response_generator.generate(comment)
-
-            if response_text:
-                comment.responded = True
-                comment.response_text = response_text
-                logger.info(f"Generated response for comment {comment.comment_id}")
+            if progress.stage:
+                logger.info(f"Resuming comment {comment.comment_id} after stage '{progress.stage}'")
+                annotate(resumed_after=progress.stage)
+            else:
+                logger.info(f"Processing comment {comment.comment_id}")
 
-                # Публикуем ответ в VK
+            with deadline(self.comment_deadline):
                 try:
-                    post_id = int(comment.post_id)
-                    comment_id = int(comment.comment_id)
-                    reply_id = self.vk.reply_to_comment(post_id, comment_id, response_text)
-                    if reply_id:
-                        logger.info(f"Published reply {reply_id} to comment {comment.comment_id}")
-                    else:
-                        logger.warning(f"Failed to publish reply to comment {comment.comment_id}")
-                except (ValueError, TypeError) as e:
-                    logger.error(f"Error publishing reply: {e}")
-            else:
-                logger.info(f"Decided not to respond to comment {comment.comment_id}")
+                    response_text = self._run_stages(comment, progress)
+                except DeadlineExceeded as e:
+                    if not self._on_deadline(comment, progress, e):
+                        return None
+                    response_text = None
 
             # Сохранить комментарий (всегда, даже без ответа)
             self.db.save_comment(comment)
+            self._checkpoint(progress, "done")
 
             return response_text
 
@@ -135,87 +167,399 @@ class SolipsistBot:
             logger.error(f"Error processing comment: {e}", exc_info=True)
             return None
 
-    def generate_monologue(self) -> bool:
-        """Сгенерировать внутренний монолог."""
+    def _run_stages(self, comment: Comment, progress: CommentProgress) -> Optional[str]:
+        """Незавершённые этапы пайплайна; возвращает текст ответа."""
+        # Перцепция
+        if not progress.completed("perception"):
+            perception_data = {}
+            with self._stage("perception"):
+                if comment.text:
+                    with span("perception.text"):
+                        perception_data["text"] = self.text_perception.analyze(comment.text)
+
+                if comment.image_url:
+                    with span("perception.image"):
+                        perception_data["image"] = self.image_perception.analyze(comment.image_url)
+
+                if comment.video_url:
+                    with span("perception.video"):
+                        perception_data["video"] = self.video_perception.analyze(comment.video_url)
+
+            progress.perception = perception_data
+            self._checkpoint(progress, "perception")
+        perception_data = progress.perception or {}
+
+        # Интерпретация
+        if not progress.completed("classification"):
+            prefetched = self._prefetched_classes.pop(comment.comment_id, None)
+            if prefetched is not None:
+                progress.classified_as = prefetched
+                annotate(classification_batched=True)
+            else:
+                progress.classified_as = "noise"
+                with self._stage("classification"), span("classification"):
+                    progress.classified_as = self.classifier.classify(comment.text or "", perception_data.get("text", {}))
+            self._evaluate_intrusion(comment, progress)
+        comment.classified_as = progress.classified_as
+        comment.intrusion_score = progress.intrusion_score
+        annotate(classified_as=progress.classified_as)
+
+        # Обновление состояния
+        self._update_state(progress)
+
+        # Решение об ответе
+        if not progress.completed("response"):
+            progress.response_text = None
+            with self._stage("response"), span("response"), llm_priority(PRIORITY_REPLY):
+                progress.response_text = self.response_generator.generate(comment)
+            self._checkpoint(progress, "response")
+        response_text = progress.response_text
+
+        if not response_text:
+            logger.info(f"Decided not to respond to comment {comment.comment_id}")
+            return None
+
+        comment.responded = True
+        comment.response_text = response_text
+
+        if progress.completed("reply_started"):
+            if not progress.completed("replied"):
+                # Публикация прервалась на неизвестном шаге: повтор мог бы задвоить ответ
+                logger.warning(f"Reply to comment {comment.comment_id} may not have been published, not retrying")
+            return response_text
+
+        logger.info(f"Generated response for comment {comment.comment_id}")
+        with self._stage("publish"):
+            self._checkpoint(progress, "reply_started")
+
+            # Публикуем ответ в VK
+            try:
+                post_id = int(comment.post_id)
+                comment_id = int(comment.comment_id)
+                reply_id = self.vk.reply_to_comment(post_id, comment_id, response_text)
+                if reply_id:
+                    progress.reply_id = str(reply_id)
+                    logger.info(f"Published reply {reply_id} to comment {comment.comment_id}")
+                else:
+                    logger.warning(f"Failed to publish reply to comment {comment.comment_id}")
+            except DeadlineExceeded:
+                # Запрос не был отправлен: ответ можно опубликовать при повторе
+                self._checkpoint(progress, "response")
+                raise
+            except (ValueError, TypeError) as e:
+                logger.error(f"Error publishing reply: {e}")
+            self._checkpoint(progress, "replied")
+
+        return response_text
+
+    def _evaluate_intrusion(self, comment: Comment, progress: CommentProgress):
+        progress.intrusion_score = self.intrusion_evaluator.evaluate(
+            progress.classified_as,
+            (progress.perception or {}).get("text", {}),
+            has_image=bool(comment.image_url),
+            has_video=bool(comment.video_url)
+        )
+        self._checkpoint(progress, "classification")
+
+    def _update_state(self, progress: CommentProgress):
+        if not progress.completed("state"):
+            with span("state.update"):
+                self.state.update_after_comment(progress.intrusion_score, progress.classified_as)
+            self._checkpoint(progress, "state")
+
+    @contextmanager
+    def _stage(self, name: str) -> Iterator[None]:
+        """Этап пайплайна в пределах своей доли бюджета времени комментария.
+
+        Если истекла доля этапа, этап прерывается и его результат остаётся
+        значением по умолчанию. Если истёк бюджет комментария целиком,
+        DeadlineExceeded уходит выше и оставшиеся этапы отменяются.
+        """
+        check(name)
         try:
-            logger.info("Generating monologue")
-            monologue = self.monologue_generator.generate(count=3)
-            self.db.save_monologue(monologue)
-            self.state.update_after_monologue()
-            logger.info(f"Generated monologue {monologue.monologue_id}")
-            return True
-        except Exception as e:
-            logger.error(f"Error generating monologue: {e}", exc_info=True)
+            with deadline(self._stage_budget(name)):
+                yield
+        except DeadlineExceeded as e:
+            left = remaining()
+            if left is not None and left < MIN_CALL_SECONDS:
+                raise
+            logger.warning(f"Stage '{name}' ran out of its time budget, using defaults: {e}")
+            annotate(timed_out_stage=name)
+
+    def _stage_budget(self, name: str) -> Optional[float]:
+        """Доля оставшегося бюджета для этапа; неиспользованное время переходит к следующим."""
+        left = remaining()
+        if left is None:
+            return None
+        stages = list(self.stage_shares)
+        total = sum(self.stage_shares[stage] for stage in stages[stages.index(name):])
+        return left * self.stage_shares[name] / total if total > 0 else left
+
+    def _on_deadline(self, comment: Comment, progress: CommentProgress, error: DeadlineExceeded) -> bool:
+        """Бюджет комментария исчерпан: отложить комментарий или завершить со значениями по умолчанию.
+
+        Возвращает True, если комментарий завершён и его нужно сохранить.
+        """
+        progress.deadline_misses += 1
+        annotate(deadline_exceeded=True, deadline_misses=progress.deadline_misses)
+
+        if progress.deadline_misses <= self.deadline_retries:
+            # Завершённые этапы сохранены: следующая попытка продолжит с них
+            logger.warning(
+                f"Comment {comment.comment_id} ran out of time after stage '{progress.stage}', "
+                f"postponing: {error}"
+            )
+            self._checkpoint(progress, progress.stage)
             return False
 
-    def publish_manifest(self) -> bool:
-        """Опубликовать манифест из накопленных монологов."""
-        try:
-            logger.info("Publishing manifest")
-            # Получить последние монологи для манифеста
-            monologues = self.db.get_recent_monologues(limit=5)
+        logger.warning(
+            f"Comment {comment.comment_id} ran out of time {progress.deadline_misses} times, "
+            f"finalizing with defaults: {error}"
+        )
+        if not progress.completed("classification"):
+            progress.classified_as = "noise"
+            self._evaluate_intrusion(comment, progress)
+        comment.classified_as = progress.classified_as
+        comment.intrusion_score = progress.intrusion_score
+        self._update_state(progress)
+
+        if progress.completed("reply_started"):
+            # Ответ мог уйти в VK
+            comment.responded = True
+            comment.response_text = progress.response_text
+        else:
+            comment.responded = False
+            comment.response_text = None
+        return True
+
+    def _checkpoint(self, progress: CommentProgress, stage: str):
+        """Записать завершение этапа обработки комментария."""
+        progress.stage = stage
+        progress.updated_at = datetime.now()
+        self.db.save_comment_progress(progress)
 
-            if not monologues:
-                logger.warning("No monologues available for manifest")
+    def generate_monologue(self) -> bool:
+        """Сгенерировать внутренний монолог."""
+        # Фоновая работа: места в шлюзе LLM уступает комментариям
+        with trace("monologue", tenant=self.tenant), llm_priority(PRIORITY_BACKGROUND):
+            try:
+                logger.info("Generating monologue")
+                monologue = self.monologue_generator.generate(count=3)
+                self.db.save_monologue(monologue)
+                self.state.update_after_monologue()
+                logger.info(f"Generated monologue {monologue.monologue_id}")
+
+                # Несвёрнутый монолог попадёт в манифест как есть или свернётся в следующий раз
+                try:
+                    self.digest.fold_pending()
+                except Exception as e:
+                    logger.error(f"Error folding monologues into digest: {e}", exc_info=True)
+                return True
+            except Exception as e:
+                logger.error(f"Error generating monologue: {e}", exc_info=True)
                 return False
 
-            # Сгенерировать манифест
-            manifest = self.manifest_generator.generate_from_monologues(monologues)
-
-            if not manifest:
-                logger.error("Failed to generate manifest")
+    def prepare_manifests(self) -> bool:
+        """Заранее подготовить манифесты к следующим публикациям (в свободное время)."""
+        with trace("manifest.prepare", tenant=self.tenant), llm_priority(PRIORITY_BACKGROUND):
+            try:
+                busy = (
+                    self._last_comment_at is not None
+                    and time.monotonic() - self._last_comment_at < self.manifest_idle_seconds
+                )
+                if busy and self.manifest_generator.expire_stale():
+                    # Идёт обработка комментариев, а к публикации уже есть что выложить
+                    logger.info("Comments are being processed, postponing manifest preparation")
+                    return False
+
+                self.manifest_generator.prepare(self.digest)
+                return True
+            except Exception as e:
+                logger.error(f"Error preparing manifests: {e}", exc_info=True)
                 return False
 
-            # Опубликовать
-            success = self.manifest_generator.publish_next()
-            return success
-
-        except Exception as e:
-            logger.error(f"Error publishing manifest: {e}", exc_info=True)
-            return False
+    def publish_manifest(self) -> bool:
+        """Опубликовать самый старый готовый манифест."""
+        with trace("manifest", tenant=self.tenant), llm_priority(PRIORITY_BACKGROUND):
+            try:
+                logger.info("Publishing manifest")
+                if not self.manifest_generator.expire_stale():
+                    if not self.manifest_on_demand:
+                        logger.error("No prepared manifest to publish")
+                        return False
+
+                    # Подготовка не успела (или не удалась) - генерируем на пути публикации
+                    logger.warning("No prepared manifest, generating one now")
+                    annotate(generated_on_demand=True)
+                    if not self.manifest_generator.generate_from_digest(self.digest):
+                        logger.error("Failed to generate manifest")
+                        return False
+
+                # Опубликовать
+                success = self.manifest_generator.publish_next()
+                return success
+
+            except Exception as e:
+                logger.error(f"Error publishing manifest: {e}", exc_info=True)
+                return False
 
-    def run_comment_check(self):
-        """Проверить новые комментарии и обработать их."""
+    def run_comment_check(self) -> Dict[str, int]:
+        """Проверить новые комментарии и обработать их.
+
+        Опрашиваются только посты, которым пора по их уровню активности.
+        Возвращает число новых (ранее не обработанных) комментариев по постам.
+        """
+        return self._poll_comments(self._process_new_comment, prepare=self._prefetch)
+
+    def ingest_comments(self) -> Dict[str, int]:
+        """Проверить новые комментарии и поставить их в очередь обработки.
+
+        Режим нескольких процессов: опрашивает VK один процесс (владелец аренды),
+        обрабатывают комментарии из очереди все (process_queued_comments).
+        """
+        return self._poll_comments(self.db.enqueue_comment)
+
+    def _process_new_comment(self, comment_data: dict) -> bool:
+        self.process_comment(comment_data)
+        if not self.db.get_comment(str(comment_data.get("id", ""))):
+            # Обработка сорвалась, комментарий не сохранён - пост опросить ещё раз
+            self._unfinished_posts.add(str(comment_data.get("post_id", "")))
+        return True
+
+    def _poll_comments(
+        self,
+        handle: Callable[[dict], bool],
+        prepare: Optional[Callable[[List[dict]], None]] = None
+    ) -> Dict[str, int]:
+        """Опросить посты и передать новые комментарии в handle (True - комментарий новый).
+
+        prepare получает все новые комментарии поста до их передачи в handle.
+        """
+        new_by_post: Dict[str, int] = {}
         try:
-            comments = self.vk.get_new_comments(count=20)
-
-            for comment_data in comments:
-                comment_id = str(comment_data.get("id", ""))
-                author_id = comment_data.get("author_id", "")
+            self.post_tracker.observe_posts(self.vk.get_recent_posts(count=self.post_tracker.discover_count))
 
-                # Проверить, не обработан ли уже комментарий
-                existing_comment = self.db.get_comment(comment_id)
-                if existing_comment:
-                    logger.debug(f"Comment {comment_id} already processed, skipping")
+            for post_id in self.post_tracker.due_posts():
+                comments = self.ingestor.fetch(post_id)
+                if comments is None:
+                    # Опрос не удался - пост останется в очереди до следующей проверки
                     continue
 
-                # ЗАЩИТА ОТ БЕСКОНЕЧНОГО ЦИКЛА: пропускаем собственные комментарии сообщества
-                # В VK API from_id комментария от группы = -abs(group_id)
-                try:
-                    group_id_raw = self.config.get("vk.group_id")
-                    if group_id_raw:
-                        group_id_value = int(group_id_raw) if isinstance(group_id_raw, (int, str)) else 0
-                        # Нормализуем: group_id всегда отрицательный для сравнения с from_id
-                        expected_from_id = -abs(group_id_value)
-                        author_id_int = int(author_id) if author_id else 0
-                        if author_id_int == expected_from_id:
-                            logger.info(f"Skipping bot's own comment {comment_id} (from_id={author_id})")
-                            continue
-                except (ValueError, TypeError) as e:
-                    logger.debug(f"Error comparing group_id: {e}")
-                    pass
-
-                # Логируем комментарий от создателя, но обрабатываем его как обычный
-                creator_user_id = self.config.get("vk.creator_user_id")
-                if creator_user_id:
-                    try:
-                        if author_id and abs(int(author_id)) == abs(int(creator_user_id)):
-                            logger.info(f"Creator comment detected (author_id={author_id})")
-                    except (ValueError, TypeError):
-                        pass
+                new_comments = [c for c in comments if self._is_new_comment(c)]
+                if prepare is not None and new_comments:
+                    prepare(new_comments)
 
-                self.process_comment(comment_data)
+                new_count = 0
+                self._unfinished_posts.discard(post_id)
+                for comment_data in new_comments:
+                    if handle(comment_data):
+                        new_count += 1
+
+                self.post_tracker.record_poll(post_id, new_count, keep_due=post_id in self._unfinished_posts)
+                if new_count:
+                    new_by_post[post_id] = new_count
 
         except Exception as e:
             logger.error(f"Error in comment check: {e}", exc_info=True)
 
+        return new_by_post
+
+    def process_queued_comments(
+        self,
+        owner: str,
+        lease_seconds: float,
+        limit: int,
+        max_attempts: int = 3
+    ) -> int:
+        """Обработать до limit комментариев из очереди; возвращает число обработанных."""
+        # Пачка забирается целиком, аренда покрывает её обработку (каждый комментарий
+        # ограничен своим бюджетом времени)
+        ttl = lease_seconds + (limit - 1) * (self.comment_deadline or 0)
+        batch = self.db.claim_comments(owner, ttl, limit, max_attempts)
+        self._prefetch(batch)
+
+        for comment_data in batch:
+            comment_id = str(comment_data.get("id", ""))
+            status = "done"
+            try:
+                self.process_comment(comment_data)
+                progress = self.db.get_comment_progress(comment_id)
+                if progress is not None and not progress.completed("done"):
+                    # Пайплайн прервался: следующая попытка продолжит с последнего этапа
+                    status = "pending"
+            except Exception as e:
+                logger.error(f"Error processing queued comment {comment_id}: {e}", exc_info=True)
+                status = "pending"
+            self.db.finish_queued_comment(comment_id, owner, status)
+
+        return len(batch)
+
+    def _prefetch(self, comments: List[dict]):
+        """Пакетные запросы к LLM для пачки комментариев до их обработки.
+
+        Изображения описываются и комментарии классифицируются одним запросом на
+        несколько комментариев вместо запроса на каждый; этапы пайплайна затем
+        берут готовые результаты.
+        """
+        images = []
+        texts: Dict[str, str] = {}
+        for comment_data in comments:
+            comment_id = str(comment_data.get("id", ""))
+            progress = self.db.get_comment_progress(comment_id)
+            if comment_data.get("image_url") and (progress is None or not progress.completed("perception")):
+                images.append(comment_data["image_url"])
+            if progress is None or not progress.completed("classification"):
+                texts[comment_id] = comment_data.get("text") or ""
+
+        if len(images) >= 2 and self.image_perception.batch_size >= 2:
+            with trace("perception.image.batch", tenant=self.tenant, size=len(images)), deadline(self.comment_deadline):
+                try:
+                    # Описания попадают в кэш LLM-клиента, откуда их возьмёт этап перцепции
+                    self.image_perception.analyze_batch(images)
+                except Exception as e:
+                    logger.warning(f"Batch image analysis failed, analyzing images one by one: {e}")
+
+        if len(texts) >= 2 and self.classifier.batch_size >= 2:
+            with trace("classification.batch", tenant=self.tenant, size=len(texts)), deadline(self.comment_deadline):
+                try:
+                    self._prefetched_classes = self.classifier.classify_batch(texts)
+                except Exception as e:
+                    logger.warning(f"Batch classification failed, classifying comments one by one: {e}")
+
+    def _is_new_comment(self, comment_data: dict) -> bool:
+        """Нужно ли обрабатывать комментарий (не обработан и не от самого сообщества)."""
+        comment_id = str(comment_data.get("id", ""))
+        author_id = comment_data.get("author_id", "")
+
+        # Проверить, не обработан ли уже комментарий
+        existing_comment = self.db.get_comment(comment_id)
+        if existing_comment:
+            logger.debug(f"Comment {comment_id} already processed, skipping")
+            return False
+
+        # ЗАЩИТА ОТ БЕСКОНЕЧНОГО ЦИКЛА: пропускаем собственные комментарии сообщества
+        # В VK API from_id комментария от группы = -abs(group_id)
+        try:
+            group_id_raw = self.config.get("vk.group_id")
+            if group_id_raw:
+                group_id_value = int(group_id_raw) if isinstance(group_id_raw, (int, str)) else 0
+                # Нормализуем: group_id всегда отрицательный для сравнения с from_id
+                expected_from_id = -abs(group_id_value)
+                author_id_int = int(author_id) if author_id else 0
+                if author_id_int == expected_from_id:
+                    logger.info(f"Skipping bot's own comment {comment_id} (from_id={author_id})")
+                    return False
+        except (ValueError, TypeError) as e:
+            logger.debug(f"Error comparing group_id: {e}")
+            pass
+
+        # Логируем комментарий от создателя, но обрабатываем его как обычный
+        creator_user_id = self.config.get("vk.creator_user_id")
+        if creator_user_id:
+            try:
+                if author_id and abs(int(author_id)) == abs(int(creator_user_id)):
+                    logger.info(f"Creator comment detected (author_id={author_id})")
+            except (ValueError, TypeError):
+                pass
+
+        return True
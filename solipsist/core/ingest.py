@@ -0,0 +1,175 @@
+"""Получение комментариев поста вместе с ответами в ветках.
+
+Комментарии верхнего уровня запрашиваются от новых к старым, ответы веток
+приходят внутри того же вызова (thread_items_count, до 10 на ветку). Отдельные
+запросы делаются только для веток, где ответов больше, чем пришло внутри, и
+их число изменилось с прошлого опроса. Для таких веток в БД хранится курсор:
+сколько ответов уже видели и идентификатор последнего.
+
+Ограничение: верхний уровень читается от новых к старым только до уже виденных
+комментариев. Если их в посте больше page_size, ветки старых комментариев в
+опрос не попадают, и новые ответы в них не замечаются.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config.loader import Config, load_config
+from ..services.vk import VKClient
+from ..storage.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Курсор верхнего уровня поста в таблице comment_threads
+ROOT_THREAD = "0"
+
+
+class CommentIngestor:
+    """Сбор новых комментариев и ответов в ветках с минимумом вызовов VK API."""
+
+    def __init__(self, vk: VKClient, database: Database, config: Optional[Config] = None):
+        """Инициализация по секции comments конфигурации."""
+        config = config or load_config()
+        self.vk = vk
+        self.db = database
+        self.thread_items_count = min(10, config.get("comments.thread_items_count", 10))
+        self.page_size = min(100, config.get("comments.page_size", 100))
+        # Предел вызовов wall.getComments на один пост за опрос
+        self.max_pages = config.get("comments.max_pages_per_poll", 5)
+
+    def fetch(self, post_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Комментарии и ответы поста в хронологическом порядке (включая уже обработанные).
+
+        None - первая страница не получена, опрос поста не удался.
+        """
+        cursors = self.db.get_thread_cursors(post_id)
+        roots, pages, total_roots, roots_complete = self._fetch_roots(post_id, cursors.get(ROOT_THREAD))
+        if roots is None:
+            return None
+
+        comments: Dict[str, Dict[str, Any]] = {}
+        updated: Dict[str, tuple] = {}
+        deferred = 0
+
+        for root in roots:
+            root_id = str(root.get("id", ""))
+            comments[root_id] = self.vk.parse_comment(root, post_id)
+
+            thread = root.get("thread") or {}
+            thread_count = thread.get("count", 0)
+            inline = thread.get("items", [])
+            for reply in inline:
+                comments[str(reply.get("id", ""))] = self.vk.parse_comment(reply, post_id, thread_id=root_id)
+
+            if thread_count <= len(inline):
+                continue
+
+            # Ветка не поместилась целиком: дочитать, только если в ней что-то изменилось
+            seen_count, last_id = cursors.get(root_id, (0, None))
+            if thread_count == seen_count:
+                continue
+            if pages >= self.max_pages:
+                deferred += 1
+                continue
+
+            start_id = last_id or (str(inline[-1].get("id")) if inline else None)
+            replies, used, complete = self._fetch_thread(post_id, root_id, start_id, self.max_pages - pages)
+            pages += used
+            for reply in replies:
+                comments[str(reply.get("id", ""))] = self.vk.parse_comment(reply, post_id, thread_id=root_id)
+
+            if complete:
+                newest = max((int(r["id"]) for r in replies), default=int(start_id) if start_id else 0)
+                updated[root_id] = (thread_count, str(newest) if newest else last_id)
+
+        if roots and roots_complete:
+            # Курсор сдвигается, только если между ним и новыми комментариями нет пропуска
+            newest_root = max(int(r["id"]) for r in roots)
+            updated[ROOT_THREAD] = (total_roots, str(newest_root))
+
+        try:
+            self.db.save_thread_cursors(post_id, updated)
+        except Exception as e:
+            logger.warning(f"Failed to save thread cursors of post {post_id}: {e}")
+
+        if deferred:
+            logger.info(f"Post {post_id}: {deferred} overflowing threads deferred to the next poll")
+        logger.debug(f"Post {post_id}: {len(comments)} comments in {pages} wall.getComments calls")
+
+        return sorted(comments.values(), key=lambda c: int(c["id"]) if c["id"].isdigit() else 0)
+
+    def _fetch_roots(
+        self,
+        post_id: str,
+        cursor: Optional[tuple]
+    ) -> Tuple[Optional[List[Dict[str, Any]]], int, int, bool]:
+        """Комментарии верхнего уровня от новых к старым до уже виденных.
+
+        Возвращает (комментарии, вызовы, всего, дошли ли до курсора или конца списка).
+        """
+        last_root_id = int(cursor[1]) if cursor and cursor[1] else None
+        roots: List[Dict[str, Any]] = []
+        offset = 0
+        pages = 0
+        total = 0
+
+        while pages < self.max_pages:
+            page = self.vk.get_comments_page(
+                post_id,
+                count=self.page_size,
+                offset=offset,
+                sort="desc",
+                thread_items_count=self.thread_items_count
+            )
+            pages += 1
+            if page is None:
+                # Без первой страницы опрос не удался; без следующих - прочитано не всё
+                return (None if not roots else roots[::-1]), pages, total, False
+
+            items = page.get("items", [])
+            roots.extend(items)
+            offset += len(items)
+            total = page.get("current_level_count", page.get("count", 0))
+
+            if len(items) < self.page_size or offset >= total:
+                break
+            if last_root_id is not None and any(int(item["id"]) <= last_root_id for item in items):
+                # Дошли до уже виденных: дальше только старые комментарии
+                break
+        else:
+            logger.warning(f"Post {post_id}: stopped after {pages} pages, older comments are not checked")
+            roots.reverse()
+            return roots, pages, total, False
+
+        roots.reverse()
+        return roots, pages, total, True
+
+    def _fetch_thread(
+        self,
+        post_id: str,
+        root_id: str,
+        start_id: Optional[str],
+        max_pages: int
+    ) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """Дочитать ветку от курсора: (ответы, число вызовов, дочитана ли до конца)."""
+        replies: List[Dict[str, Any]] = []
+        pages = 0
+
+        while pages < max_pages:
+            page = self.vk.get_comments_page(
+                post_id,
+                count=self.page_size,
+                comment_id=root_id,
+                start_comment_id=start_id
+            )
+            pages += 1
+            if page is None:
+                return replies, pages, False
+
+            items = page.get("items", [])
+            replies.extend(items)
+            if len(items) < self.page_size:
+                return replies, pages, True
+            # start_comment_id включает сам комментарий: следующая страница начнётся с него
+            start_id = str(items[-1].get("id"))
+
+        return replies, pages, False
@@ -0,0 +1,118 @@
+"""Аренды задач между процессами-обработчиками.
+
+Аренда хранится в БД сообщества (таблица leases): владелец, срок и номер
+владения. Процесс продлевает свои аренды фоновым потоком; если процесс упал,
+аренда истекает и её забирает другой. Так у публикации, монолога и опроса VK
+в каждый момент не больше одного владельца.
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from ..config.loader import Config, load_config
+from ..storage.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseManager:
+    """Аренды одного процесса во всех БД сообществ."""
+
+    def __init__(self, config: Optional[Config] = None, owner: Optional[str] = None):
+        """Инициализация по секции workers конфигурации."""
+        config = config or load_config()
+        self.ttl = config.get("workers.lease_ttl_seconds", 30)
+        # Продлевать заранее: несколько пропущенных продлений ещё не теряют аренду
+        self.heartbeat_interval = config.get("workers.heartbeat_seconds", self.ttl / 3.0)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._held: Dict[Tuple[str, str], Tuple[Database, int]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._run_heartbeat, name="lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _key(self, db: Database, name: str) -> Tuple[str, str]:
+        return str(db.db_path), name
+
+    def acquire(self, db: Database, name: str) -> bool:
+        """Взять (или подтвердить) аренду; False - у неё другой живой владелец."""
+        try:
+            fence = db.acquire_lease(name, self.owner, self.ttl)
+        except Exception as e:
+            logger.warning(f"Failed to acquire lease '{name}': {e}")
+            fence = None
+
+        key = self._key(db, name)
+        with self._lock:
+            previous = self._held.get(key)
+            if fence is None:
+                if previous is not None:
+                    logger.warning(f"Lease '{name}' lost to another worker")
+                self._held.pop(key, None)
+                return False
+            self._held[key] = (db, fence)
+
+        if previous is None:
+            logger.info(f"Acquired lease '{name}' (fence {fence})")
+        return True
+
+    def holds(self, db: Database, name: str) -> bool:
+        """Держит ли процесс аренду (по последнему продлению)."""
+        with self._lock:
+            return self._key(db, name) in self._held
+
+    def release(self, db: Database, name: str):
+        """Освободить аренду."""
+        with self._lock:
+            held = self._held.pop(self._key(db, name), None)
+        if held is None:
+            return
+        try:
+            db.release_lease(name, self.owner)
+        except Exception as e:
+            logger.warning(f"Failed to release lease '{name}': {e}")
+
+    @contextmanager
+    def hold(self, db: Database, name: str) -> Iterator[bool]:
+        """Держать аренду на время блока; в блок передаётся, удалось ли её взять."""
+        acquired = self.acquire(db, name)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release(db, name)
+
+    def _run_heartbeat(self):
+        """Продлевать все аренды процесса."""
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._lock:
+                held = list(self._held.items())
+
+            for (path, name), (db, _) in held:
+                try:
+                    renewed = db.renew_lease(name, self.owner, self.ttl)
+                except Exception as e:
+                    logger.warning(f"Failed to renew lease '{name}': {e}")
+                    continue
+                if not renewed:
+                    logger.warning(f"Lease '{name}' in {path} was taken over, dropping it")
+                    with self._lock:
+                        self._held.pop((path, name), None)
+
+    def close(self):
+        """Остановить продление и освободить все аренды."""
+        self._stop.set()
+        self._heartbeat.join(timeout=5)
+        with self._lock:
+            held = list(self._held.items())
+            self._held.clear()
+        for (_, name), (db, _) in held:
+            try:
+                db.release_lease(name, self.owner)
+            except Exception as e:
+                logger.warning(f"Failed to release lease '{name}': {e}")
@@ -0,0 +1,103 @@
+"""Адаптивный интервал опроса комментариев.
+
+Частота поступления комментариев (общая и по постам) оценивается скользящим
+экспоненциальным средним по результатам опросов. Во время активных обсуждений
+интервал сокращается до нескольких секунд, в тишине - растёт экспоненциально.
+Интервал всегда остаётся в заданных границах и в бюджете вызовов VK API.
+"""
+import logging
+import math
+import time
+from typing import Dict, Optional
+
+from ..config.loader import Config, load_config
+
+logger = logging.getLogger(__name__)
+
+# Оценки частоты ниже порога считаются нулевыми и отбрасываются
+MIN_TRACKED_RATE = 1e-5
+
+
+class AdaptivePoller:
+    """Планировщик интервала опроса по оценке частоты комментариев."""
+
+    def __init__(self, config: Optional[Config] = None):
+        """Инициализация по секции polling конфигурации."""
+        config = config or load_config()
+        self.min_interval = config.get("polling.min_interval_seconds", 5)
+        self.max_interval = config.get("polling.max_interval_seconds", 300)
+        self.initial_interval = config.get("polling.initial_interval_seconds", 60)
+        # Сколько новых комментариев в среднем хотим застать за один опрос
+        self.target_per_poll = config.get("polling.target_comments_per_poll", 1.0)
+        self.backoff_factor = config.get("polling.backoff_factor", 2.0)
+        # Время, за которое вес старых наблюдений падает в e раз
+        self.rate_window = config.get("polling.rate_window_seconds", 300)
+        self.max_calls_per_minute = config.get("polling.max_api_calls_per_minute", 120)
+
+        self.rate = 0.0                        # Комментариев в секунду, всего
+        self.post_rates: Dict[str, float] = {}  # Комментариев в секунду по постам
+        self.interval = self.initial_interval
+        self._calls_per_poll = 1.0
+        self._last_poll: Optional[float] = None
+
+    def _ewma(self, current: float, observed: float, dt: float) -> float:
+        alpha = 1.0 - math.exp(-dt / self.rate_window) if self.rate_window > 0 else 1.0
+        return current + alpha * (observed - current)
+
+    def observe(self, new_by_post: Dict[str, int], api_calls: int, now: Optional[float] = None):
+        """Учесть результат опроса: новые комментарии по постам и число вызовов API."""
+        now = time.monotonic() if now is None else now
+        total_new = sum(new_by_post.values())
+
+        if api_calls > 0:
+            self._calls_per_poll = float(api_calls)
+
+        if self._last_poll is None:
+            # Первый опрос: интервал наблюдения неизвестен, берём стартовый
+            dt = float(self.initial_interval)
+        else:
+            dt = max(1e-3, now - self._last_poll)
+        self._last_poll = now
+
+        self.rate = self._ewma(self.rate, total_new / dt, dt)
+
+        for post_id in set(self.post_rates) | set(new_by_post):
+            rate = self._ewma(self.post_rates.get(post_id, 0.0), new_by_post.get(post_id, 0) / dt, dt)
+            if rate < MIN_TRACKED_RATE:
+                self.post_rates.pop(post_id, None)
+            else:
+                self.post_rates[post_id] = rate
+
+        self.interval = self._compute_interval(total_new)
+        logger.debug(
+            f"Polling: {total_new} new, rate={self.rate * 60:.2f}/min, "
+            f"hottest post={self.hottest_rate() * 60:.2f}/min, next in {self.interval:.1f}s"
+        )
+
+    def hottest_rate(self) -> float:
+        """Частота самого активного поста (комментариев в секунду)."""
+        return max(self.post_rates.values(), default=0.0)
+
+    def _compute_interval(self, total_new: int) -> float:
+        # Ориентируемся на самый активный поток: ответ в живом обсуждении важнее
+        rate = max(self.rate, self.hottest_rate())
+        by_rate = self.target_per_poll / rate if rate > 0 else self.max_interval
+
+        if total_new > 0:
+            interval = by_rate
+        else:
+            # Тишина: экспоненциальный откат, но не реже, чем подсказывает оценка частоты
+            interval = min(self.interval * self.backoff_factor, by_rate)
+
+        return self._clamp(interval)
+
+    def _clamp(self, interval: float) -> float:
+        lower = self.min_interval
+        if self.max_calls_per_minute and self.max_calls_per_minute > 0:
+            # Бюджет VK API: не больше max_calls_per_minute вызовов в минуту
+            lower = max(lower, self._calls_per_poll * 60.0 / self.max_calls_per_minute)
+        return min(self.max_interval, max(lower, interval))
+
+    def next_interval(self) -> float:
+        """Сколько секунд ждать до следующего опроса."""
+        return self.interval
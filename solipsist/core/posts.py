@@ -0,0 +1,183 @@
+"""Отслеживание активности постов.
+
+Для каждого поста в БД хранится частота комментариев (скользящее среднее),
+время последней активности и последнего опроса. По ним пост относится к одному
+из уровней - hot, warm, cold - со своей частотой опроса. Новый комментарий
+(или рост счётчика комментариев в wall.get) сразу переводит пост в hot.
+"""
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from ..config.loader import Config, load_config
+from ..storage.database import Database
+from ..storage.models import PostActivity
+
+logger = logging.getLogger(__name__)
+
+TIER_HOT = "hot"
+TIER_WARM = "warm"
+TIER_COLD = "cold"
+
+# Порядок опроса при ограничении числа постов за проверку
+_TIER_PRIORITY = {TIER_HOT: 0, TIER_WARM: 1, TIER_COLD: 2}
+
+
+class PostActivityTracker:
+    """Выбор постов для опроса комментариев по их активности."""
+
+    def __init__(self, database: Database, config: Optional[Config] = None):
+        """Инициализация по секции posts конфигурации."""
+        config = config or load_config()
+        self.db = database
+        # Сколько последних постов стены смотреть через wall.get
+        self.discover_count = config.get("posts.discover_count", 100)
+        poll_seconds = config.get("posts.poll_seconds", {})
+        self.poll_intervals = {
+            TIER_HOT: timedelta(seconds=poll_seconds.get(TIER_HOT, 0)),
+            TIER_WARM: timedelta(seconds=poll_seconds.get(TIER_WARM, 600)),
+            TIER_COLD: timedelta(seconds=poll_seconds.get(TIER_COLD, 3600))
+        }
+        self.hot_window = timedelta(seconds=config.get("posts.hot_window_seconds", 1800))
+        self.warm_window = timedelta(seconds=config.get("posts.warm_window_seconds", 86400))
+        self.hot_rate = config.get("posts.hot_rate_per_hour", 2.0) / 3600.0
+        # Время, за которое вес старых наблюдений падает в e раз
+        self.rate_window = config.get("posts.rate_window_seconds", 3600)
+        # Посты без активности дольше этого срока не опрашиваются по расписанию
+        self.archive_after = timedelta(days=config.get("posts.archive_after_days", 30))
+        self.max_posts_per_check = config.get("posts.max_posts_per_check", 20)
+
+        self._posts: Dict[str, PostActivity] = {}
+        # Результат последнего wall.get: какие посты видны и у каких вырос счётчик
+        self._visible: Dict[str, Optional[int]] = {}
+        # Посты, опрашиваемые в следующей проверке вне очереди: вырос счётчик или не всё обработано
+        self._promoted: set = set()
+        self.reload()
+
+    def reload(self):
+        """Перечитать статистику постов из БД (например, после смены процесса, опрашивающего VK)."""
+        self._posts = {activity.post_id: activity for activity in self.db.get_post_activities()}
+        self._promoted = set()
+
+    def observe_posts(self, posts: List[Dict[str, Any]], now: Optional[datetime] = None):
+        """Учесть последние посты стены (результат VKClient.get_recent_posts)."""
+        now = now or datetime.now()
+        self._visible = {}
+
+        for post in posts:
+            post_id = str(post["id"])
+            count = post.get("comments_count")
+            self._visible[post_id] = count
+
+            activity = self._posts.get(post_id)
+            if activity is None:
+                activity = PostActivity(
+                    post_id=post_id,
+                    tier=TIER_HOT,
+                    posted_at=post.get("date") or now
+                )
+                self._posts[post_id] = activity
+                self._save(activity)
+                logger.info(f"Tracking new post {post_id}")
+                continue
+
+            if count is not None and count != activity.comments_count:
+                # Счётчик комментариев изменился - в посте что-то происходит
+                self._promote(activity)
+
+    def _promote(self, activity: PostActivity):
+        self._promoted.add(activity.post_id)
+        if activity.tier != TIER_HOT:
+            logger.info(f"Post {activity.post_id} promoted {activity.tier} -> {TIER_HOT}")
+            activity.tier = TIER_HOT
+            self._save(activity)
+
+    def due_posts(self, now: Optional[datetime] = None) -> List[str]:
+        """Посты, которые нужно опросить в этой проверке."""
+        now = now or datetime.now()
+        due = [activity for activity in self._posts.values() if self._is_due(activity, now)]
+
+        due.sort(key=lambda a: (
+            a.post_id not in self._promoted,
+            _TIER_PRIORITY.get(a.tier, len(_TIER_PRIORITY)),
+            a.last_polled or datetime.min
+        ))
+        if self.max_posts_per_check and len(due) > self.max_posts_per_check:
+            logger.debug(f"{len(due)} posts due, polling {self.max_posts_per_check} now")
+            due = due[:self.max_posts_per_check]
+
+        return [activity.post_id for activity in due]
+
+    def _is_due(self, activity: PostActivity, now: datetime) -> bool:
+        if activity.post_id in self._promoted or activity.last_polled is None:
+            return True
+
+        # Пост виден в wall.get и счётчик не изменился: опрос ничего не даст.
+        # Горячие посты опрашиваются всё равно - счётчик мог обновиться после сбоя опроса
+        if activity.tier != TIER_HOT and self._visible.get(activity.post_id) == activity.comments_count:
+            return False
+
+        if activity.tier == TIER_COLD and now - self._last_seen(activity) > self.archive_after:
+            return False
+
+        return now - activity.last_polled >= self.poll_intervals.get(activity.tier, self.poll_intervals[TIER_COLD])
+
+    def record_poll(self, post_id: str, new_comments: int, now: Optional[datetime] = None, keep_due: bool = False):
+        """Учесть результат опроса поста: число новых комментариев.
+
+        keep_due - не все новые комментарии обработаны: пост остаётся в очереди
+        на следующую проверку, а счётчик из wall.get не принимается.
+        """
+        now = now or datetime.now()
+        activity = self._posts.get(post_id)
+        if activity is None:
+            activity = PostActivity(post_id=post_id, posted_at=now)
+            self._posts[post_id] = activity
+
+        since = activity.last_polled or activity.posted_at or now
+        dt = max(1.0, (now - since).total_seconds())
+        alpha = 1.0 - math.exp(-dt / self.rate_window) if self.rate_window > 0 else 1.0
+        activity.rate += alpha * (new_comments / dt - activity.rate)
+
+        if new_comments > 0:
+            activity.last_activity = now
+        activity.last_polled = now
+        if keep_due:
+            self._promoted.add(post_id)
+        else:
+            visible_count = self._visible.get(post_id)
+            if visible_count is not None:
+                activity.comments_count = visible_count
+            self._promoted.discard(post_id)
+
+        tier = self._classify(activity, now)
+        if tier != activity.tier:
+            logger.info(f"Post {post_id} moved {activity.tier} -> {tier}")
+            activity.tier = tier
+        self._save(activity)
+
+    def _last_seen(self, activity: PostActivity) -> datetime:
+        return activity.last_activity or activity.posted_at or datetime.min
+
+    def _classify(self, activity: PostActivity, now: datetime) -> str:
+        """Уровень поста по частоте комментариев и давности активности."""
+        quiet_for = now - self._last_seen(activity)
+        if activity.rate >= self.hot_rate or quiet_for <= self.hot_window:
+            return TIER_HOT
+        if quiet_for <= self.warm_window:
+            return TIER_WARM
+        return TIER_COLD
+
+    def _save(self, activity: PostActivity):
+        try:
+            self.db.save_post_activity(activity)
+        except Exception as e:
+            logger.warning(f"Failed to save activity of post {activity.post_id}: {e}")
+
+    def tier_counts(self) -> Dict[str, int]:
+        """Число отслеживаемых постов по уровням."""
+        counts = {TIER_HOT: 0, TIER_WARM: 0, TIER_COLD: 0}
+        for activity in self._posts.values():
+            counts[activity.tier] = counts.get(activity.tier, 0) + 1
+        return counts
@@ -1,62 +1,349 @@
-"""Планировщик задач."""
+"""Планировщик задач.
+
+Задачи хранятся в куче по ближайшему сроку; поток планировщика спит ровно до
+следующего срока и передаёт задачу в пул исполнителей. Расписание берётся из
+секции schedule конфигурации, время последнего запуска - из БД, что позволяет
+догнать пропущенный запуск после перезапуска процесса.
+
+Если планировщик работает в нескольких процессах (LeaseManager), задача
+выполняется под арендой в БД её сообщества: срок запуска выполняет ровно один
+процесс, остальные его пропускают.
+"""
+import heapq
+import itertools
 import logging
-import schedule
-import time
-from datetime import datetime
-from typing import Callable, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
 import pytz
 
+from ..config.loader import Config, load_config
+from ..storage.database import Database
+from .leases import LeaseManager
+
 logger = logging.getLogger(__name__)
 
+# Политики перекрытия запусков одной задачи
+OVERLAP_SKIP = "skip"          # Пропустить запуск, если предыдущий ещё идёт
+OVERLAP_QUEUE = "queue"        # Запустить сразу после завершения предыдущего
+OVERLAP_PARALLEL = "parallel"  # Запускать параллельно
+
+# Максимальный сон за раз: страховка от скачков системных часов
+MAX_SLEEP_SECONDS = 3600
+
+
+class IntervalTrigger:
+    """Запуск через фиксированный интервал."""
+
+    def __init__(self, interval: timedelta):
+        self.interval = interval
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайший срок строго после moment."""
+        return moment + self.interval
+
+    def __repr__(self) -> str:
+        return f"every {self.interval}"
+
+
+class DailyTrigger:
+    """Запуск в заданное время суток в часовом поясе."""
+
+    def __init__(self, times: List[str], timezone):
+        self.timezone = timezone
+        self.times = sorted(
+            (int(t.split(":")[0]), int(t.split(":")[1])) for t in times
+        )
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайший срок строго после moment."""
+        local = moment.astimezone(self.timezone)
+        for day_offset in range(0, 3):
+            day = (local + timedelta(days=day_offset)).date()
+            for hour, minute in self.times:
+                candidate = self.timezone.localize(datetime(day.year, day.month, day.day, hour, minute))
+                candidate = candidate.astimezone(pytz.utc)
+                if candidate > moment:
+                    return candidate
+        raise ValueError("DailyTrigger has no publication times")
+
+    def __repr__(self) -> str:
+        return "daily at " + ", ".join(f"{h:02d}:{m:02d}" for h, m in self.times)
+
+
+class _Job:
+    """Зарегистрированная задача."""
+
+    def __init__(
+        self,
+        name: str,
+        callback: Callable,
+        trigger,
+        overlap: str,
+        catch_up: bool,
+        database: Optional[Database] = None,
+        tenant: Optional[str] = None
+    ):
+        self.name = name
+        self.callback = callback
+        self.trigger = trigger
+        self.overlap = overlap
+        self.catch_up = catch_up
+        self.db = database
+        self.tenant = tenant
+        # Имя задачи уникально в пределах сообщества, ключ - в пределах планировщика
+        self.key = f"{tenant}:{name}" if tenant else name
+        self.running = 0
+        self.queued = False
+
 
 class TaskScheduler:
     """Планировщик задач для бота."""
 
-    def __init__(self):
-        """Инициализация планировщика."""
-        self.timezone = pytz.timezone("Europe/Moscow")
-        self._monologue_callback = None
-        self._publication_callback = None
-
-    def register_monologue_callback(self, callback: Callable):
-        """Зарегистрировать callback для монолога."""
-        self._monologue_callback = callback
-        # Настроить расписание после регистрации callback
-        schedule.every().hour.do(self._run_monologue_task)
-
-    def register_publication_callback(self, callback: Callable):
-        """Зарегистрировать callback для публикации."""
-        self._publication_callback = callback
-        # Настроить расписание после регистрации callback
-        schedule.every().day.at("00:00").do(self._run_publication_task)
-        schedule.every().day.at("12:00").do(self._run_publication_task)
-
-    def _run_monologue_task(self):
-        """Запустить задачу генерации монолога."""
-        logger.info("Running scheduled monologue task")
-        if self._monologue_callback:
-            try:
-                self._monologue_callback()
-            except Exception as e:
-                logger.error(f"Error in monologue task: {e}", exc_info=True)
-
-    def _run_publication_task(self):
-        """Запустить задачу публикации манифеста."""
-        logger.info("Running scheduled publication task")
-        if self._publication_callback:
-            try:
-                self._publication_callback()
-            except Exception as e:
-                logger.error(f"Error in publication task: {e}", exc_info=True)
+    def __init__(
+        self,
+        database: Optional[Database] = None,
+        config: Optional[Config] = None,
+        leases: Optional[LeaseManager] = None
+    ):
+        """Инициализация планировщика.
+
+        Один планировщик может обслуживать несколько сообществ: у каждой задачи
+        своя БД и своё расписание, пул исполнителей общий.
+        """
+        config = config or load_config()
+        self.config = config
+        self.db = database
+        self.leases = leases
+        self.catchup_window = timedelta(hours=config.get("schedule.catchup_window_hours", 6))
+        self.overlap_policies: Dict[str, str] = config.get("schedule.overlap", {})
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.get("schedule.max_workers", 2),
+            thread_name_prefix="scheduler"
+        )
+        self._heap: list = []
+        self._jobs: Dict[str, _Job] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def register_monologue_callback(
+        self,
+        callback: Callable,
+        config: Optional[Config] = None,
+        database: Optional[Database] = None,
+        tenant: Optional[str] = None
+    ):
+        """Зарегистрировать callback для монолога (config - расписание сообщества)."""
+        config = config or self.config
+        interval = timedelta(hours=config.get("schedule.monologue_interval_hours", 1))
+        self.add_job(
+            "monologue", callback, IntervalTrigger(interval),
+            overlap=config.get("schedule.overlap", {}).get("monologue"),
+            database=database,
+            tenant=tenant
+        )
+
+    def register_publication_callback(
+        self,
+        callback: Callable,
+        config: Optional[Config] = None,
+        database: Optional[Database] = None,
+        tenant: Optional[str] = None
+    ):
+        """Зарегистрировать callback для публикации (config - расписание сообщества)."""
+        config = config or self.config
+        timezone = pytz.timezone(config.get("schedule.timezone", "Europe/Moscow"))
+        times = config.get("schedule.publication_times", ["00:00", "12:00"])
+        self.add_job(
+            "publication", callback, DailyTrigger(times, timezone),
+            overlap=config.get("schedule.overlap", {}).get("publication"),
+            database=database,
+            tenant=tenant
+        )
+
+    def register_preparation_callback(
+        self,
+        callback: Callable,
+        config: Optional[Config] = None,
+        database: Optional[Database] = None,
+        tenant: Optional[str] = None
+    ):
+        """Зарегистрировать callback подготовки манифестов (config - расписание сообщества)."""
+        config = config or self.config
+        interval = timedelta(minutes=config.get("schedule.manifest_prepare_minutes", 30))
+        self.add_job(
+            "manifest_preparation", callback, IntervalTrigger(interval),
+            overlap=config.get("schedule.overlap", {}).get("manifest_preparation", OVERLAP_SKIP),
+            database=database,
+            tenant=tenant
+        )
+
+    def add_job(
+        self,
+        name: str,
+        callback: Callable,
+        trigger,
+        overlap: Optional[str] = None,
+        catch_up: bool = True,
+        database: Optional[Database] = None,
+        tenant: Optional[str] = None
+    ):
+        """Добавить задачу и запланировать её первый запуск.
+
+        database - где хранить время последнего запуска (по умолчанию БД планировщика).
+        """
+        overlap = overlap or self.overlap_policies.get(name, OVERLAP_SKIP)
+        job = _Job(name, callback, trigger, overlap, catch_up, database or self.db, tenant)
+        now = self._now()
+
+        due = self._first_due(job, now)
+        with self._cond:
+            self._jobs[job.key] = job
+            self._push(due, job)
+            self._cond.notify()
+
+        logger.info(f"Scheduled job '{job.key}' ({trigger}, overlap={overlap}), next run at {due.isoformat()}")
+
+    def _first_due(self, job: _Job, now: datetime) -> datetime:
+        """Первый срок задачи с учётом пропущенного запуска."""
+        last_run = self._get_last_run(job)
+        if last_run is None:
+            return job.trigger.next_after(now)
+
+        missed = job.trigger.next_after(last_run)
+        if missed > now:
+            return missed
+
+        if job.catch_up and now - missed <= self.catchup_window:
+            logger.info(f"Job '{job.key}' missed run at {missed.isoformat()}, catching up")
+            return now
+
+        return job.trigger.next_after(now)
+
+    def _push(self, due: datetime, job: _Job, occurrence: Optional[datetime] = None):
+        """Положить задачу в кучу (occurrence - повтор уже наступившего срока)."""
+        heapq.heappush(self._heap, (due, next(self._seq), job, occurrence))
+
+    def _now(self) -> datetime:
+        return datetime.now(pytz.utc)
+
+    def _get_last_run(self, job: _Job) -> Optional[datetime]:
+        if job.db is None:
+            return None
+        try:
+            return job.db.get_job_last_run(job.name)
+        except Exception as e:
+            logger.warning(f"Failed to read last run of job '{job.key}': {e}")
+            return None
+
+    def _set_last_run(self, job: _Job, moment: datetime):
+        if job.db is None:
+            return
+        try:
+            job.db.set_job_last_run(job.name, moment)
+        except Exception as e:
+            logger.warning(f"Failed to record last run of job '{job.key}': {e}")
+
+    def _dispatch(self, job: _Job, due: datetime):
+        """Передать задачу в пул с учётом политики перекрытия (вызывается под _cond)."""
+        if job.running and job.overlap == OVERLAP_SKIP:
+            logger.warning(f"Job '{job.key}' is still running, skipping run due at {due.isoformat()}")
+            return
+        if job.running and job.overlap == OVERLAP_QUEUE:
+            logger.info(f"Job '{job.key}' is still running, queued next run")
+            job.queued = True
+            return
+
+        job.running += 1
+        self._executor.submit(self._run_job, job, due)
+
+    def _run_job(self, job: _Job, due: datetime):
+        """Выполнить задачу в потоке пула."""
+        try:
+            if self.leases is not None and job.db is not None:
+                self._run_leased(job, due)
+            else:
+                self._set_last_run(job, due)
+                self._call(job)
+        finally:
+            with self._cond:
+                job.running -= 1
+                if job.queued and not self._stopped:
+                    job.queued = False
+                    self._dispatch(job, self._now())
+
+    def _call(self, job: _Job):
+        logger.info(f"Running scheduled {job.key} task")
+        try:
+            job.callback()
+        except Exception as e:
+            logger.error(f"Error in {job.key} task: {e}", exc_info=True)
+
+    def _run_leased(self, job: _Job, due: datetime):
+        """Выполнить срок задачи под арендой, если его не выполнил другой процесс."""
+        with self.leases.hold(job.db, f"job:{job.name}") as held:
+            if not held:
+                # Аренду держит другой процесс. Если он упал, аренда истечёт -
+                # тогда проверим этот срок ещё раз
+                logger.info(f"Job '{job.key}' is held by another worker, rechecking later")
+                retry_at = self._now() + timedelta(seconds=self.leases.ttl)
+                if retry_at - due <= self.catchup_window:
+                    with self._cond:
+                        self._push(retry_at, job, occurrence=due)
+                        self._cond.notify()
+                return
+
+            last_run = self._get_last_run(job)
+            if last_run is not None and job.trigger.next_after(last_run) > due:
+                logger.info(f"Job '{job.key}' due at {due.isoformat()} already ran in another worker")
+                return
+
+            self._set_last_run(job, due)
+            self._call(job)
 
     def run_pending(self):
-        """Запустить ожидающие задачи."""
-        schedule.run_pending()
+        """Запустить задачи, срок которых наступил."""
+        with self._cond:
+            now = self._now()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, job, occurrence = heapq.heappop(self._heap)
+                if occurrence is None:
+                    self._push(job.trigger.next_after(max(due, now)), job)
+                self._dispatch(job, occurrence or due)
+
+    def next_run_in(self) -> Optional[float]:
+        """Секунд до ближайшей задачи (None - задач нет)."""
+        with self._cond:
+            if not self._heap:
+                return None
+            return max(0.0, (self._heap[0][0] - self._now()).total_seconds())
 
     def run_continuously(self):
         """Запустить планировщик непрерывно."""
         logger.info("Starting scheduler")
         while True:
+            with self._cond:
+                if self._stopped:
+                    break
+                delay = MAX_SLEEP_SECONDS
+                if self._heap:
+                    delay = min(delay, max(0.0, (self._heap[0][0] - self._now()).total_seconds()))
+                if delay > 0:
+                    self._cond.wait(timeout=delay)
+                if self._stopped:
+                    break
+
             self.run_pending()
-            time.sleep(60)  # Проверка каждую минуту
 
+        logger.info("Scheduler stopped")
+
+    def stop(self, wait: bool = True):
+        """Остановить планировщик и дождаться выполняющихся задач."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._executor.shutdown(wait=wait)
@@ -1,33 +1,80 @@
-"""Система управления состояниями бота."""
+"""Система управления состояниями бота.
+
+Текущее состояние живёт в памяти. В БД пишется контрольная точка (одна строка)
+по интервалу или по числу накопленных изменений, вместе с журналом приращений.
+
+Состоянием владеет единственный поток-писатель: обновления ставятся в очередь
+и применяются строго по порядку. Читатели получают неизменяемый снимок без блокировок.
+
+Если с БД работают несколько процессов (workers.enabled), каждое обновление
+применяется к состоянию в БД одной транзакцией, а снимок периодически перечитывается
+тем же потоком-писателем.
+"""
 import logging
-from typing import Optional
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
 from datetime import datetime
 
+from ..config.loader import Config, load_config
 from ..storage.database import Database
-from ..storage.models import SolipsistState
+from ..storage.models import SolipsistState, StateDelta
 
 logger = logging.getLogger(__name__)
 
+# Команда остановки потока-писателя
+_STOP = object()
+# Событие команды перечитывания состояния других процессов
+_REFRESH = "refresh"
+
 
 class StateManager:
     """Менеджер состояний бота."""
 
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, config: Optional[Config] = None):
         """Инициализация менеджера состояний."""
+        config = config or load_config()
+
+        self.config = config
         self.db = database
+        self.checkpoint_interval = config.get("state.checkpoint_interval_seconds", 30)
+        self.checkpoint_max_pending = config.get("state.checkpoint_max_pending", 100)
+        self.decay_rate = config.get("state.decay_rate", 0.02)
+        # Состояние общее для нескольких процессов: источник истины - БД
+        self.shared = config.get("workers.enabled", False)
+        self.shared_refresh = config.get("workers.state_refresh_seconds", 1.0)
+        self._refreshed = time.monotonic()
+        self._refresh_lock = threading.Lock()
+
+        # Снимок заменяется целиком только потоком-писателем
         self._current_state: Optional[SolipsistState] = None
+        self._pending: List[StateDelta] = []
+        self._updates = 0
+        self._last_checkpoint = time.monotonic()
         self._load_state()
 
+        self._commands: queue.Queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run_writer, name="state-writer", daemon=True)
+        self._writer.start()
+
     def _load_state(self):
-        """Загрузить последнее состояние из БД."""
+        """Загрузить состояние из контрольной точки БД."""
+        checkpoint = self.db.get_state_checkpoint()
+        if checkpoint:
+            self._current_state, self._updates = checkpoint
+            return
+
+        # Миграция со старой схемы: последняя строка таблицы states
         state = self.db.get_latest_state()
         if state:
             self._current_state = state
+            self._checkpoint()
         else:
             # Инициализировать начальное состояние
-            from ..config.loader import load_config
-            config = load_config()
-            state_config = config.get("state", {})
+            state_config = self.config.get("state", {})
 
             self._current_state = SolipsistState(
                 certainty_level=state_config.get("initial_certainty", 0.3),
@@ -35,113 +82,261 @@ class StateManager:
                 self_coherence=state_config.get("initial_coherence", 0.9),
                 timestamp=datetime.now()
             )
-            self.save_state()
+            self._checkpoint()
+
+    def snapshot(self) -> SolipsistState:
+        """Неизменяемый снимок текущего состояния (без блокировок)."""
+        if self.shared and time.monotonic() - self._refreshed >= self.shared_refresh:
+            self._schedule_refresh()
+        return self._current_state
+
+    def _schedule_refresh(self):
+        """Поручить писателю перечитать состояние (не дожидаясь: снимок обновится чуть позже)."""
+        with self._refresh_lock:
+            if time.monotonic() - self._refreshed < self.shared_refresh:
+                return
+            self._refreshed = time.monotonic()
+        if not self._closed:
+            self._submit(_REFRESH, None, wait=False)
+
+    def _refresh(self):
+        """Перечитать состояние, изменённое другими процессами (в потоке-писателе).
+
+        Снимок заменяется, только если в БД применено больше обновлений, чем в памяти.
+        """
+        try:
+            checkpoint = self.db.get_state_checkpoint()
+        except Exception as e:
+            logger.warning(f"Failed to refresh shared state: {e}")
+            return
+        if checkpoint and checkpoint[1] > self._updates:
+            self._current_state, self._updates = checkpoint
 
     @property
     def certainty_level(self) -> float:
         """Уровень уверенности в существовании реальности."""
-        return self._current_state.certainty_level if self._current_state else 0.3
+        return self.snapshot().certainty_level
 
     @property
     def intrusion_level(self) -> float:
         """Уровень давления внешних сигналов."""
-        return self._current_state.intrusion_level if self._current_state else 0.1
+        return self.snapshot().intrusion_level
 
     @property
     def self_coherence(self) -> float:
         """Ощущение непрерывности собственного 'я'."""
-        return self._current_state.self_coherence if self._current_state else 0.9
+        return self.snapshot().self_coherence
 
     def update_after_comment(
         self,
         intrusion_score: float,
-        classified_as: str
-    ):
+        classified_as: str,
+        wait: bool = True
+    ) -> Future:
         """Обновить состояние после обработки комментария."""
-        if not self._current_state:
-            self._load_state()
+        return self._submit(
+            "comment",
+            lambda state: self._after_comment(state, intrusion_score, classified_as),
+            wait
+        )
+
+    def update_after_monologue(self, wait: bool = True) -> Future:
+        """Обновить состояние после монолога."""
+        return self._submit("monologue", self._after_monologue, wait)
 
+    def reset_after_publication(self, wait: bool = True) -> Future:
+        """Частично сбросить состояние после публикации."""
+        return self._submit("publication", self._after_publication, wait)
+
+    @staticmethod
+    def _after_comment(state: SolipsistState, intrusion_score: float, classified_as: str) -> SolipsistState:
+        """Переход состояния после комментария."""
         # Увеличить уровень вторжения
-        new_intrusion = min(1.0, self.intrusion_level + intrusion_score * 0.2)
+        new_intrusion = min(1.0, state.intrusion_level + intrusion_score * 0.2)
 
         # В зависимости от классификации изменять certainty
         if classified_as == "observer":
             # Наблюдатель - снижает уверенность
-            new_certainty = max(0.0, self.certainty_level - 0.1)
+            new_certainty = max(0.0, state.certainty_level - 0.1)
         elif classified_as == "provocation":
             # Провокация - может увеличить уверенность (как сопротивление)
-            new_certainty = min(1.0, self.certainty_level + 0.05)
+            new_certainty = min(1.0, state.certainty_level + 0.05)
         else:
             # Эхо или шум - слабое влияние
-            new_certainty = max(0.0, self.certainty_level - 0.02)
+            new_certainty = max(0.0, state.certainty_level - 0.02)
 
         # Coherence может снижаться при высоком intrusion
         if new_intrusion > 0.7:
-            new_coherence = max(0.5, self.self_coherence - 0.1)
+            new_coherence = max(0.5, state.self_coherence - 0.1)
         else:
             # Медленное восстановление
-            new_coherence = min(1.0, self.self_coherence + 0.01)
+            new_coherence = min(1.0, state.self_coherence + 0.01)
 
-        self._current_state = SolipsistState(
+        return SolipsistState(
             certainty_level=new_certainty,
             intrusion_level=new_intrusion,
             self_coherence=new_coherence,
             timestamp=datetime.now()
         )
 
-        self.save_state()
-
-    def update_after_monologue(self):
-        """Обновить состояние после монолога."""
-        if not self._current_state:
-            self._load_state()
-
+    @staticmethod
+    def _after_monologue(state: SolipsistState) -> SolipsistState:
+        """Переход состояния после монолога."""
         # Монолог восстанавливает coherence
-        new_coherence = min(1.0, self.self_coherence + 0.05)
+        new_coherence = min(1.0, state.self_coherence + 0.05)
 
         # Небольшое снижение intrusion (размышление помогает)
-        new_intrusion = max(0.0, self.intrusion_level - 0.05)
+        new_intrusion = max(0.0, state.intrusion_level - 0.05)
 
-        self._current_state = SolipsistState(
-            certainty_level=self.certainty_level,
+        return SolipsistState(
+            certainty_level=state.certainty_level,
             intrusion_level=new_intrusion,
             self_coherence=new_coherence,
             timestamp=datetime.now()
         )
 
-        self.save_state()
-
-    def reset_after_publication(self):
-        """Частично сбросить состояние после публикации."""
-        if not self._current_state:
-            self._load_state()
-
-        from ..config.loader import load_config
-        config = load_config()
-        decay_rate = config.get("state.decay_rate", 0.02)
-
+    def _after_publication(self, state: SolipsistState) -> SolipsistState:
+        """Переход состояния после публикации."""
         # Частичный сброс intrusion
-        new_intrusion = max(0.1, self.intrusion_level * (1 - decay_rate))
+        new_intrusion = max(0.1, state.intrusion_level * (1 - self.decay_rate))
 
-        self._current_state = SolipsistState(
-            certainty_level=self.certainty_level,
+        return SolipsistState(
+            certainty_level=state.certainty_level,
             intrusion_level=new_intrusion,
-            self_coherence=self.self_coherence,
+            self_coherence=state.self_coherence,
             timestamp=datetime.now()
         )
 
-        self.save_state()
+    def _submit(self, event: str, transition: Optional[Callable], wait: bool) -> Future:
+        """Поставить команду в очередь писателя (transition=None - контрольная точка)."""
+        future: Future = Future()
+
+        if threading.current_thread() is self._writer:
+            # Вызов из самого писателя: выполнить сразу, иначе взаимоблокировка
+            self._execute(event, transition, future)
+            return future
+
+        if self._closed:
+            raise RuntimeError("StateManager is closed")
+
+        self._commands.put((event, transition, future))
+        if wait:
+            future.result()
+        return future
+
+    def _run_writer(self):
+        """Цикл потока-писателя."""
+        while True:
+            timeout = None
+            if self._pending:
+                timeout = max(0.0, self.checkpoint_interval - (time.monotonic() - self._last_checkpoint))
+
+            try:
+                command = self._commands.get(timeout=timeout)
+            except queue.Empty:
+                self._maybe_checkpoint()
+                continue
+
+            if command is _STOP:
+                break
+
+            self._execute(*command)
+
+    def _execute(self, event: str, transition: Optional[Callable], future: Future):
+        """Выполнить команду в потоке-писателе."""
+        if not future.set_running_or_notify_cancel():
+            return
+
+        try:
+            if event == _REFRESH:
+                self._refresh()
+                future.set_result(self._current_state)
+            elif self.shared:
+                if transition is not None:
+                    self._current_state = self.db.apply_state_transition(event, transition)
+                    self._updates += 1
+                    self._refreshed = time.monotonic()
+                future.set_result(self._current_state)
+            elif transition is None:
+                self._checkpoint()
+                future.set_result(self._current_state)
+            else:
+                new_state = transition(self._current_state)
+                self._apply(event, new_state)
+                future.set_result(new_state)
+        except Exception as e:
+            future.set_exception(e)
+
+    def _apply(self, event: str, new_state: SolipsistState):
+        """Применить новое состояние и записать приращение в журнал."""
+        old_state = self._current_state
+        self._current_state = new_state
+        self._updates += 1
+
+        if old_state:
+            self._pending.append(StateDelta.between(event, old_state, new_state))
+
+        self._maybe_checkpoint()
+
+    def _maybe_checkpoint(self) -> bool:
+        """Записать контрольную точку, если пора по интервалу или числу изменений."""
+        if not self._pending:
+            return False
+
+        due = (
+            len(self._pending) >= self.checkpoint_max_pending
+            or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+        )
+        if due:
+            try:
+                self._checkpoint()
+            except Exception as e:
+                # Изменения остаются в очереди до следующей попытки
+                logger.error(f"Failed to save state checkpoint: {e}")
+        return due
+
+    def _checkpoint(self):
+        """Записать контрольную точку и журнал изменений."""
+        if not self._current_state:
+            return
+
+        deltas, self._pending = self._pending, []
+        try:
+            self.db.save_state_checkpoint(self._current_state, deltas, self._updates)
+        except Exception:
+            # Вернуть изменения в очередь, чтобы не потерять их при следующей попытке
+            self._pending = deltas + self._pending
+            raise
+        self._last_checkpoint = time.monotonic()
+        logger.debug(f"State checkpoint saved ({len(deltas)} deltas, {self._updates} updates total)")
 
     def save_state(self):
-        """Сохранить текущее состояние в БД."""
-        if self._current_state:
-            self.db.save_state(self._current_state)
+        """Сохранить текущее состояние в БД (контрольная точка и журнал изменений)."""
+        self._submit("checkpoint", None, wait=True)
+
+    def close(self):
+        """Сохранить состояние и остановить поток-писатель."""
+        if self._closed:
+            return
+        self.save_state()
+        self._closed = True
+        self._commands.put(_STOP)
+        self._writer.join(timeout=10)
+
+        # Команды, поставленные после остановки, завершаются ошибкой, а не висят
+        while True:
+            try:
+                command = self._commands.get_nowait()
+            except queue.Empty:
+                break
+            if command is not _STOP and command[2].set_running_or_notify_cancel():
+                command[2].set_exception(RuntimeError("StateManager is closed"))
 
     def get_state_context(self) -> str:
         """Получить текстовое описание состояния для контекста."""
+        state = self.snapshot()
         return (
-            f"Уверенность в реальности: {self.certainty_level:.2f}, "
-            f"Уровень вторжения: {self.intrusion_level:.2f}, "
-            f"Целостность 'я': {self.self_coherence:.2f}"
+            f"Уверенность в реальности: {state.certainty_level:.2f}, "
+            f"Уровень вторжения: {state.intrusion_level:.2f}, "
+            f"Целостность 'я': {state.self_coherence:.2f}"
         )
-
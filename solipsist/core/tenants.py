@@ -0,0 +1,220 @@
+"""Несколько сообществ в одном процессе.
+
+У каждого сообщества (арендатора) своя конфигурация, токены, БД и состояние.
+Общие для всех: LLM-клиент (пул соединений, ограничитель частоты, кэш),
+ограничители VK по токенам, планировщик задач и пул потоков проверки комментариев.
+
+Когда сообществ, которым пора проверять комментарии, больше, чем свободных
+потоков, первым идёт то, кто меньше всех занимал пул в последнее время (с учётом веса).
+Так одно сообщество с лавиной комментариев не задерживает остальные.
+
+В режиме нескольких процессов (workers.enabled) VK каждого сообщества опрашивает
+владелец аренды ingest и ставит комментарии в очередь в БД; обрабатывают очередь
+все процессы, задачи планировщика выполняются под арендами.
+"""
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from ..config.loader import Config, load_config
+from ..services.clients import openrouter_client
+from ..services.llm import OpenRouterClient
+from ..services.vk import count_calls
+from .bot import SolipsistBot
+from .leases import LeaseManager
+from .poller import AdaptivePoller
+from .scheduler import TaskScheduler
+
+logger = logging.getLogger(__name__)
+
+# Пауза после неожиданной ошибки проверки комментариев
+ERROR_BACKOFF_SECONDS = 60
+
+# Аренда опроса VK сообщества
+INGEST_LEASE = "ingest"
+
+
+class Tenant:
+    """Сообщество, обслуживаемое процессом."""
+
+    def __init__(self, config: Config, llm: OpenRouterClient):
+        self.config = config
+        self.name = config.name
+        self.weight = max(1e-3, float(config.get("weight", 1.0)))
+        self.bot = SolipsistBot(llm=llm, config=config)
+        self.poller = AdaptivePoller(config)
+
+        self.next_poll = time.monotonic()
+        self.busy = False
+        # Занятость пула с экспоненциальным забыванием, секунды
+        self.usage = 0.0
+        self._usage_updated = time.monotonic()
+
+    def decayed_usage(self, now: float, window: float) -> float:
+        """Занятость пула на момент now."""
+        if window > 0:
+            self.usage *= math.exp(-(now - self._usage_updated) / window)
+        self._usage_updated = now
+        return self.usage
+
+    def priority(self, now: float, window: float) -> float:
+        """Чем меньше, тем раньше сообщество получает поток."""
+        return self.decayed_usage(now, window) / self.weight
+
+
+class TenantHost:
+    """Хост сообществ: общий пул потоков и справедливая очередь проверок."""
+
+    def __init__(self, config: Optional[Config] = None):
+        """Создать сообщества из секции tenants конфигурации (без неё - одно сообщество)."""
+        config = config or load_config()
+        self.config = config
+
+        # Общие ресурсы процесса
+        self.llm = openrouter_client(config)
+        self.leases = LeaseManager(config) if config.get("workers.enabled", False) else None
+        self.scheduler = TaskScheduler(config=config, leases=self.leases)
+
+        self.comment_lease = config.get("workers.comment_lease_seconds", 300)
+        self.queue_batch = config.get("workers.queue_batch", 5)
+        self.queue_poll_interval = config.get("workers.queue_poll_seconds", 2)
+        self.max_attempts = config.get("workers.max_attempts", 3)
+
+        self.tenants: List[Tenant] = [Tenant(tenant_config, self.llm) for tenant_config in config.tenants()]
+        self.max_workers = config.get("host.max_workers", min(4, len(self.tenants)))
+        self.fairness_window = config.get("host.fairness_window_seconds", 60)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tenant")
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._stopped = False
+
+        for tenant in self.tenants:
+            multi = len(self.tenants) > 1
+            self.scheduler.register_monologue_callback(
+                tenant.bot.generate_monologue,
+                config=tenant.config,
+                database=tenant.bot.db,
+                tenant=tenant.name if multi else None
+            )
+            self.scheduler.register_publication_callback(
+                tenant.bot.publish_manifest,
+                config=tenant.config,
+                database=tenant.bot.db,
+                tenant=tenant.name if multi else None
+            )
+            self.scheduler.register_preparation_callback(
+                tenant.bot.prepare_manifests,
+                config=tenant.config,
+                database=tenant.bot.db,
+                tenant=tenant.name if multi else None
+            )
+
+        mode = f"worker {self.leases.owner}" if self.leases else "single process"
+        logger.info(f"Tenant host: {len(self.tenants)} tenants, {self.max_workers} workers, {mode}")
+
+    def run(self):
+        """Обслуживать сообщества до остановки (stop или Ctrl+C)."""
+        scheduler_thread = threading.Thread(target=self.scheduler.run_continuously, daemon=True)
+        scheduler_thread.start()
+        logger.info("Scheduler started")
+
+        try:
+            while True:
+                with self._cond:
+                    if self._stopped:
+                        break
+                    self._dispatch_due()
+                    self._cond.wait(timeout=self._time_to_next_poll())
+        except KeyboardInterrupt:
+            logger.info("Received shutdown signal")
+        finally:
+            self.stop()
+
+    def _dispatch_due(self):
+        """Отдать свободные потоки сообществам, которым пора (вызывается под _cond)."""
+        now = time.monotonic()
+        free = self.max_workers - self._in_flight
+        if free <= 0:
+            return
+
+        due = [t for t in self.tenants if not t.busy and t.next_poll <= now]
+        due.sort(key=lambda t: (t.priority(now, self.fairness_window), t.next_poll))
+        for tenant in due[:free]:
+            tenant.busy = True
+            self._in_flight += 1
+            self._executor.submit(self._check_comments, tenant)
+
+    def _time_to_next_poll(self) -> Optional[float]:
+        idle = [t.next_poll for t in self.tenants if not t.busy]
+        if not idle or self._in_flight >= self.max_workers:
+            # Ждём завершения проверки: она разбудит цикл
+            return None
+        return max(0.0, min(idle) - time.monotonic())
+
+    def _check_comments(self, tenant: Tenant):
+        """Проверка комментариев сообщества в потоке пула."""
+        started = time.monotonic()
+        interval = ERROR_BACKOFF_SECONDS
+        try:
+            if self.leases is not None:
+                interval = self._work_shared(tenant)
+            else:
+                with count_calls() as calls:
+                    new_by_post = tenant.bot.run_comment_check()
+                tenant.poller.observe(new_by_post, calls.calls)
+                interval = tenant.poller.next_interval()
+        except Exception as e:
+            logger.error(f"Error checking comments of tenant {tenant.name}: {e}", exc_info=True)
+        finally:
+            finished = time.monotonic()
+            with self._cond:
+                tenant.decayed_usage(finished, self.fairness_window)
+                tenant.usage += finished - started
+                tenant.busy = False
+                tenant.next_poll = finished + interval
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _work_shared(self, tenant: Tenant) -> float:
+        """Опрос VK (если процесс владеет арендой) и обработка очереди; возвращает паузу."""
+        bot = tenant.bot
+        held_before = self.leases.holds(bot.db, INGEST_LEASE)
+
+        if self.leases.acquire(bot.db, INGEST_LEASE):
+            if not held_before:
+                # Статистику постов до этого вёл другой процесс
+                bot.post_tracker.reload()
+            with count_calls() as calls:
+                new_by_post = bot.ingest_comments()
+            tenant.poller.observe(new_by_post, calls.calls)
+            interval = tenant.poller.next_interval()
+        else:
+            interval = self.queue_poll_interval
+
+        processed = bot.process_queued_comments(
+            self.leases.owner, self.comment_lease, self.queue_batch, self.max_attempts
+        )
+        if processed >= self.queue_batch:
+            # В очереди ещё есть комментарии
+            return 0.0
+        return interval
+
+    def stop(self):
+        """Остановить проверки и планировщик, сохранить состояние сообществ."""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify_all()
+
+        self.scheduler.stop()
+        self._executor.shutdown(wait=True)
+        for tenant in self.tenants:
+            # Не терять изменения состояния после последней контрольной точки
+            tenant.bot.state.close()
+        if self.leases is not None:
+            self.leases.close()
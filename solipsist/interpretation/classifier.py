@@ -1,22 +1,41 @@
 """Классификация комментариев."""
+import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from ..services.llm import OpenRouterClient
 from ..storage.database import Database
+from ..utils.structured import parse_json, validate
+from ..utils.tokens import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+CLASS_DESCRIPTIONS = """observer — прямое обращение к субъекту
+echo — повтор или развитие ранее опубликованных мыслей
+provocation — сомнение в реальности или существовании субъекта
+noise — бессвязный или нерелевантный шум"""
+
+# Элемент ответа на пакетный промпт
+BATCH_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": {"type": ["string", "integer"]},
+        "class": {"type": "string", "enum": ["observer", "echo", "provocation", "noise"]}
+    },
+    "required": ["id", "class"]
+}
+
 
 class CommentClassifier:
     """Классификатор комментариев."""
 
     CLASS_TYPES = ["observer", "echo", "provocation", "noise"]
 
-    def __init__(self, llm_client: OpenRouterClient, database: Optional[Database] = None):
-        """Инициализация классификатора."""
+    def __init__(self, llm_client: OpenRouterClient, database: Optional[Database] = None, batch_size: int = 10):
+        """Инициализация классификатора (batch_size - комментариев в одном пакетном запросе)."""
         self.llm = llm_client
         self.db = database
+        self.batch_size = max(1, batch_size)
 
     def classify(
         self,
@@ -27,26 +46,92 @@ class CommentClassifier:
         if not text or not text.strip():
             return "noise"
 
-        # Получить последние монологи для определения echo
-        recent_monologues = []
-        if self.db:
-            try:
-                recent_monologues = self.db.get_recent_monologues(limit=5)
-            except Exception as e:
-                logger.warning(f"Failed to get recent monologues: {e}")
-
         # Формируем промпт для классификации
-        prompt = self._build_classification_prompt(text, recent_monologues)
+        prompt = self._build_classification_prompt(text, self._recent_monologues())
 
         # Выполняем классификацию через LLM
-        result = self.llm.think(prompt)
+        result = self.llm.classify(prompt, self.CLASS_TYPES)
 
         if not result:
             logger.warning("LLM classification failed, falling back to noise")
             return "noise"
 
-        # Извлекаем классификацию из ответа (должно быть одно слово)
+        classification = self._parse_single(result)
+        logger.info(f"Classified comment as: {classification}")
+        return classification
+
+    def classify_batch(self, texts: Dict[str, str]) -> Dict[str, str]:
+        """Классифицировать несколько комментариев одним запросом к LLM на пачку.
+
+        texts - тексты по идентификаторам комментариев. Модель отвечает JSON-массивом
+        с классом для каждого идентификатора. Если ответ не прошёл проверку, пачка
+        делится пополам (а комментарии, для которых класс уже получен, не запрашиваются
+        повторно); одиночный комментарий классифицируется обычным промптом.
+        Комментарии, для которых запрос к LLM не удался, в результат не попадают.
+        """
+        results = {comment_id: "noise" for comment_id, text in texts.items() if not text or not text.strip()}
+        pending = [(comment_id, text) for comment_id, text in texts.items() if comment_id not in results]
+        if not pending:
+            return results
+
+        monologues = self._recent_monologues()
+        for start in range(0, len(pending), self.batch_size):
+            self._classify_chunk(pending[start:start + self.batch_size], monologues, results)
+
+        logger.info(f"Batch-classified {len(results)}/{len(texts)} comments")
+        return results
+
+    def _classify_chunk(self, chunk: List[Tuple[str, str]], monologues: list, results: Dict[str, str]):
+        """Классифицировать часть пачки, при невалидном ответе - делением пополам."""
+        if len(chunk) == 1:
+            comment_id, text = chunk[0]
+            result = self.llm.classify(self._build_classification_prompt(text, monologues), self.CLASS_TYPES)
+            if result:
+                results[comment_id] = self._parse_single(result)
+            return
+
+        prompt = self._build_batch_prompt(chunk, monologues)
+        # До 40 токенов на элемент массива (id и класс) и запас на обрамление ответа
+        result = self.llm.classify_batch(prompt, max_tokens=40 * len(chunk) + 100)
+        if not result:
+            # Запрос не удался (а не ответ невалиден): дробление только умножит запросы
+            logger.warning(f"LLM batch classification of {len(chunk)} comments failed")
+            return
+
+        parsed = self._parse_batch(result, {comment_id for comment_id, _ in chunk})
+        results.update(parsed)
+
+        missing = [item for item in chunk if item[0] not in parsed]
+        if not missing:
+            return
+
+        logger.warning(
+            f"Batch classification returned {len(parsed)}/{len(chunk)} valid results "
+            f"(response: '{result[:200]}'), retrying the rest"
+        )
+        if len(missing) < len(chunk):
+            self._classify_chunk(missing, monologues, results)
+        else:
+            middle = len(chunk) // 2
+            self._classify_chunk(chunk[:middle], monologues, results)
+            self._classify_chunk(chunk[middle:], monologues, results)
+
+    def _recent_monologues(self) -> list:
+        """Последние монологи для определения echo."""
+        if not self.db:
+            return []
+        try:
+            return self.db.get_recent_monologues(limit=5)
+        except Exception as e:
+            logger.warning(f"Failed to get recent monologues: {e}")
+            return []
+
+    def _parse_single(self, result: str) -> str:
+        """Класс из ответа на одиночный промпт (одно слово или JSON {"class": ...})."""
         classification = result.strip().lower()
+        if classification.startswith("{"):
+            parsed = parse_json(classification)
+            classification = str(parsed.get("class", "")) if parsed else ""
 
         # Очищаем ответ от лишних символов и берем первое слово
         words = classification.split()
@@ -60,35 +145,83 @@ class CommentClassifier:
             logger.warning(f"Invalid classification '{classification}' (full response: '{result}'), defaulting to noise")
             return "noise"
 
-        logger.info(f"Classified comment as: {classification}")
         return classification
 
+    def _parse_batch(self, result: str, comment_ids: set) -> Dict[str, str]:
+        """Валидные элементы JSON-массива из ответа на пакетный промпт."""
+        items = parse_json(result)
+        if not isinstance(items, list):
+            return {}
+
+        parsed: Dict[str, str] = {}
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get("class"), str):
+                item["class"] = item["class"].strip().lower()
+            if validate(item, BATCH_ITEM_SCHEMA):
+                continue
+            comment_id = str(item["id"])
+            if comment_id in comment_ids:
+                parsed[comment_id] = item["class"]
+        return parsed
+
     def _build_classification_prompt(self, text: str, monologues: list) -> str:
         """Построить промпт для классификации."""
         prompt = """Ты — модуль классификации сознания.
 Классифицируй комментарий строго как один из вариантов:
-observer — прямое обращение к субъекту
-echo — повтор или развитие ранее опубликованных мыслей
-provocation — сомнение в реальности или существовании субъекта
-noise — бессвязный или нерелевантный шум
+""" + CLASS_DESCRIPTIONS + """
 
 Ответь одним словом.
 Комментарий: {comment_text}"""
 
+        # Комментарий занимает не больше половины бюджета, монологи - остаток
+        reserved = estimate_tokens(prompt)
+        text = self.llm.fit_context("classification", [text], reserved=reserved, share=0.5)[0]
+        reserved += estimate_tokens(text)
+
         # Если есть монологи, добавляем их для определения echo
         if monologues:
-            monologues_text = "\n\nРанее опубликованные мысли:\n"
-            for monologue in monologues:
-                thoughts = monologue.thoughts
-                # Объединяем мысли монолога
-                thoughts_text = " ".join(thoughts)
-                monologues_text += f"- {thoughts_text}\n"
-
             prompt = prompt.replace(
                 "Комментарий: {comment_text}",
-                f"{monologues_text}\nКомментарий: {{comment_text}}"
+                f"{self._monologues_text(monologues, 'classification', reserved)}\nКомментарий: {{comment_text}}"
             )
 
         prompt = prompt.format(comment_text=text)
         return prompt
 
+    def _build_batch_prompt(self, chunk: List[Tuple[str, str]], monologues: list) -> str:
+        """Построить промпт для классификации пачки комментариев."""
+        prompt = """Ты — модуль классификации сознания.
+Классифицируй каждый комментарий строго как один из вариантов:
+""" + CLASS_DESCRIPTIONS + "\n"
+        footer = """
+
+Ответь только JSON-массивом, по одному элементу на каждый комментарий:
+[{"id": "<id комментария>", "class": "<вариант>"}]"""
+
+        reserved = estimate_tokens(prompt + footer) + 10 * len(chunk)
+        texts = self.llm.fit_context(
+            "classification_batch", [text for _, text in chunk], reserved=reserved, share=0.5
+        )
+        comments = json.dumps(
+            [{"id": comment_id, "text": text} for (comment_id, _), text in zip(chunk, texts)],
+            ensure_ascii=False
+        )
+        reserved += estimate_tokens(comments)
+
+        if monologues:
+            prompt += self._monologues_text(monologues, "classification_batch", reserved)
+
+        prompt += f"""
+Комментарии (JSON): {comments}""" + footer
+        return prompt
+
+    def _monologues_text(self, monologues: list, role: str, reserved: int) -> str:
+        """Ранее опубликованные мысли, уложенные в остаток бюджета промпта role."""
+        # Объединяем мысли монолога
+        lines = [" ".join(monologue.thoughts) for monologue in monologues]
+        lines = self.llm.fit_context(role, lines, reserved=reserved + 2 * len(lines) + 10)
+
+        monologues_text = "\n\nРанее опубликованные мысли:\n"
+        for thoughts_text in lines:
+            monologues_text += f"- {thoughts_text}\n"
+        return monologues_text
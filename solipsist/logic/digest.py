@@ -0,0 +1,126 @@
+"""Скользящий дайджест монологов для манифестов.
+
+Каждый новый монолог сворачивается в сжатую сводку (на китайском, как и сами
+мысли): модель переписывает текущий дайджест вместе с новым материалом, поэтому
+размер сводки ограничен output-бюджетом роли digest, сколько бы монологов в неё
+ни попало. Манифест строится из дайджеста и нескольких ещё не свёрнутых монологов,
+после чего весь этот материал отмечается использованным и дайджест очищается.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from ..config.loader import Config, load_config
+from ..services.llm import OpenRouterClient
+from ..storage.database import Database
+from ..storage.models import Monologue
+from ..utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+FOLD_PROMPT = """You maintain a running digest of plot skeletons for the cyber-horror blog 'Singular Chronicles'.
+The digest is the only memory of these skeletons that the story writer will get.
+
+Current digest (may be empty):
+{digest}
+
+New plot skeletons to fold in:
+{skeletons}
+
+Rewrite the digest so that it covers both the current digest and the new skeletons.
+Keep the strongest conflicts, images, tragic costs and paradoxes; drop repetitions.
+OUTPUT CONSTRAINTS:
+- **MUST be written in Mandarin Chinese (Simplified)**.
+- Output only the new digest, at most {max_tokens} tokens."""
+
+
+@dataclass
+class ManifestMaterial:
+    """Материал для манифеста: дайджест и ещё не свёрнутые монологи."""
+    digest: str = ""
+    monologues: List[Monologue] = field(default_factory=list)
+    # Монологи, которые покрывает дайджест и свёрнутые монологи (для отметки использованными)
+    monologue_ids: List[str] = field(default_factory=list)
+
+    @property
+    def empty(self) -> bool:
+        return not self.digest and not self.monologues
+
+    def thoughts(self) -> List[str]:
+        """Входные данные для промпта манифеста: дайджест первым, затем свежие мысли."""
+        thoughts = [self.digest] if self.digest else []
+        for monologue in self.monologues:
+            thoughts.extend(monologue.thoughts)
+        return thoughts
+
+
+class MonologueDigest:
+    """Свёртка монологов в дайджест и выдача материала для манифеста."""
+
+    def __init__(self, llm_client: OpenRouterClient, database: Database, config: Optional[Config] = None):
+        """Инициализация по секции digest конфигурации."""
+        config = config or load_config()
+        self.llm = llm_client
+        self.db = database
+        # Сколько монологов сворачивать одним запросом (остальные - при следующей свёртке)
+        self.fold_batch = config.get("digest.fold_batch", 3)
+        # Сколько последних несвёрнутых монологов добавлять к дайджесту в манифесте
+        self.max_raw_monologues = config.get("digest.max_raw_monologues", 3)
+
+    def fold_pending(self) -> bool:
+        """Свернуть в дайджест монологи, которые ещё не свёрнуты (старые первыми).
+
+        False - свёртка не удалась; монологи останутся несвёрнутыми до следующей попытки
+        (или попадут в манифест как есть).
+        """
+        pending = self.db.get_unconsumed_monologues(digested=False, limit=self.fold_batch)
+        if not pending:
+            return True
+
+        current = self.db.get_digest()
+        max_tokens = self.llm.max_tokens_for("digest", 600)
+
+        skeletons = [" ".join(monologue.thoughts) for monologue in pending]
+        reserved = estimate_tokens(FOLD_PROMPT) + estimate_tokens(current.content)
+        skeletons = self.llm.fit_context("digest", skeletons, reserved=reserved)
+
+        prompt = FOLD_PROMPT.format(
+            digest=current.content or "(empty)",
+            skeletons="\n".join(f"- {skeleton}" for skeleton in skeletons),
+            max_tokens=max_tokens
+        )
+        content = self.llm.think(prompt, temperature=0.3, role="digest")
+        if not content or not content.strip():
+            logger.warning(f"Failed to fold {len(pending)} monologues into digest")
+            return False
+
+        monologue_ids = current.monologue_ids + [monologue.monologue_id for monologue in pending]
+        if not self.db.save_digest(content.strip(), monologue_ids, current.version):
+            # Дайджест изменился (манифест или другая свёртка) - свернём заново в следующий раз
+            logger.info("Digest changed while folding, will fold again later")
+            return False
+
+        logger.info(f"Folded {len(pending)} monologues into digest ({len(monologue_ids)} total)")
+        return True
+
+    def material(self) -> ManifestMaterial:
+        """Дайджест и последние несвёрнутые монологи для манифеста."""
+        digest = self.db.get_digest()
+        raw = self.db.get_unconsumed_monologues(
+            digested=False, limit=self.max_raw_monologues, newest_first=True
+        )
+        raw.reverse()
+
+        return ManifestMaterial(
+            digest=digest.content,
+            monologues=raw,
+            monologue_ids=(digest.monologue_ids if digest.content else []) + [m.monologue_id for m in raw]
+        )
+
+    def consume(self, material: ManifestMaterial):
+        """Отметить материал манифеста использованным и очистить дайджест.
+
+        Монологи, свёрнутые в дайджест уже после выдачи материала, не теряются:
+        они снова станут несвёрнутыми (см. Database.consume_monologues).
+        """
+        self.db.consume_monologues(material.monologue_ids)
@@ -5,6 +5,7 @@ from typing import Optional
 from ..services.llm import OpenRouterClient
 from ..core.state import StateManager
 from ..storage.models import Comment
+from ..utils.tokens import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -25,8 +26,11 @@ class ResponseGenerator:
         if comment.classified_as == "noise":
             return False
 
+        # Один снимок на всё решение, чтобы не смешать два разных состояния
+        state = self.state.snapshot()
+
         # Не отвечать при очень низкой уверенности (полное сомнение)
-        if self.state.certainty_level < 0.1:
+        if state.certainty_level < 0.1:
             return False
 
         # Отвечать на провокации и обращения наблюдателей
@@ -34,7 +38,7 @@ class ResponseGenerator:
             return True
 
         # Иногда отвечать на эхо (в зависимости от состояния)
-        if comment.classified_as == "echo" and self.state.self_coherence > 0.7:
+        if comment.classified_as == "echo" and state.self_coherence > 0.7:
             return True
 
         return False
@@ -48,7 +52,7 @@ class ResponseGenerator:
         comment_text = comment.text or "[медиа-контент]"
         state_context = self.state.get_state_context()
 
-        prompt = f"""Комментарий, который может быть галлюцинацией или эхом мыслей:
+        prompt = """Комментарий, который может быть галлюцинацией или эхом мыслей:
 "{comment_text}"
 
 Сгенерируй философский, отчуждённый ответ (1-3 предложения).
@@ -57,6 +61,12 @@ class ResponseGenerator:
 
 Контекст состояния: {state_context}"""
 
+        # Контекст состояния уходит и в системное сообщение - он тоже в бюджете
+        reserved = estimate_tokens(prompt.format(comment_text="", state_context=state_context))
+        reserved += estimate_tokens(state_context)
+        comment_text = self.llm.fit_context("response", [comment_text], reserved=reserved)[0]
+        prompt = prompt.format(comment_text=comment_text, state_context=state_context)
+
         response = self.llm.generate_response(prompt, style_context=state_context)
 
         return response
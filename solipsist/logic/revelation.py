@@ -1,14 +1,22 @@
-"""Публикация манифестов."""
+"""Публикация манифестов.
+
+Манифесты готовятся заранее: задача подготовки в свободное время генерирует их
+до целевой глубины очереди и проверяет, а в срок публикации остаётся только
+опубликовать самый старый готовый. Очередь ограничена сверху, устаревшие
+черновики снимаются с публикации.
+"""
 import logging
 import uuid
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import List, Optional
 
+from ..config.loader import Config, load_config
 from ..services.llm import OpenRouterClient
 from ..services.vk import VKClient
 from ..storage.database import Database
-from ..storage.models import Manifest, Monologue
+from ..storage.models import Manifest
 from ..core.state import StateManager
+from .digest import MonologueDigest
 
 logger = logging.getLogger(__name__)
 
@@ -21,33 +29,104 @@ class ManifestGenerator:
         llm_client: OpenRouterClient,
         vk_client: VKClient,
         database: Database,
-        state_manager: StateManager
+        state_manager: StateManager,
+        config: Optional[Config] = None
     ):
-        """Инициализация генератора."""
+        """Инициализация генератора по секции manifests конфигурации."""
+        config = config or load_config()
         self.llm = llm_client
         self.vk = vk_client
         self.db = database
         self.state = state_manager
 
-    def generate_from_monologues(self, monologues: list[Monologue]) -> Optional[Manifest]:
-        """Сгенерировать манифест из монологов."""
-        if not monologues:
-            logger.warning("No monologues to generate manifest from")
+        # Сколько готовых манифестов держать заранее и сколько максимум
+        self.queue_depth = config.get("manifests.queue_depth", 2)
+        self.max_backlog = config.get("manifests.max_backlog", 4)
+        # Черновик старше этого срока не публикуется
+        self.max_age = timedelta(hours=config.get("manifests.max_age_hours", 48))
+        self.attempts = config.get("manifests.generation_attempts", 2)
+        # Проверка текста: длина и доля иероглифов (манифест должен быть на русском)
+        self.min_chars = config.get("manifests.min_chars", 300)
+        self.max_chars = config.get("manifests.max_chars", 4000)
+        self.max_cjk_share = config.get("manifests.max_cjk_share", 0.02)
+
+    def generate_from_digest(self, digest: MonologueDigest) -> Optional[Manifest]:
+        """Сгенерировать манифест из дайджеста и ещё не свёрнутых монологов.
+
+        Использованный материал отмечается, и следующий манифест строится из нового.
+        """
+        material = digest.material()
+        if material.empty:
+            logger.warning("No unconsumed monologues to generate manifest from")
             return None
 
-        # Собрать все мысли из монологов
-        all_thoughts = []
-        for monologue in monologues:
-            all_thoughts.extend(monologue.thoughts)
+        manifest = self._generate(material.thoughts())
+        if manifest:
+            digest.consume(material)
+            logger.info(f"Manifest {manifest.manifest_id} consumed {len(material.monologue_ids)} monologues")
+        return manifest
 
+    def prepare(self, digest: MonologueDigest) -> int:
+        """Догенерировать готовые манифесты до целевой глубины очереди; возвращает число новых."""
+        ready = self.expire_stale()
+        generated = 0
+        failures = 0
+        while len(ready) + generated < self.queue_depth and failures < self.attempts:
+            if digest.material().empty:
+                # Новых монологов нет - ждём следующих
+                break
+            if self.generate_from_digest(digest):
+                generated += 1
+            else:
+                failures += 1
+
+        logger.info(f"Manifest queue: {len(ready) + generated}/{self.queue_depth} ready ({generated} generated)")
+        return generated
+
+    def expire_stale(self) -> List[Manifest]:
+        """Снять с публикации устаревшие и лишние черновики; возвращает оставшиеся готовые."""
+        ready = self.db.get_unpublished_manifests()
+        cutoff = datetime.now() - self.max_age
+        stale = [manifest for manifest in ready if manifest.timestamp < cutoff]
+        fresh = [manifest for manifest in ready if manifest.timestamp >= cutoff]
+        if len(fresh) > self.max_backlog:
+            # Публикуются старые первыми: лишние - самые старые
+            stale.extend(fresh[:len(fresh) - self.max_backlog])
+            fresh = fresh[len(fresh) - self.max_backlog:]
+
+        if stale:
+            self.db.expire_manifests([manifest.manifest_id for manifest in stale])
+            logger.warning(f"Expired {len(stale)} unpublished manifests")
+        return fresh
+
+    def validate(self, content: str) -> List[str]:
+        """Проблемы текста манифеста (пустой список - можно публиковать)."""
+        problems = []
+        text = content.strip()
+        if len(text) < self.min_chars:
+            problems.append(f"too short ({len(text)} < {self.min_chars} chars)")
+        if len(text) > self.max_chars:
+            problems.append(f"too long ({len(text)} > {self.max_chars} chars)")
+
+        cjk = sum(1 for ch in text if "\u2e80" <= ch < "\ua000")
+        if text and cjk / len(text) > self.max_cjk_share:
+            problems.append(f"untranslated Chinese ({cjk} CJK chars)")
+        return problems
+
+    def _generate(self, thoughts: list[str]) -> Optional[Manifest]:
         # Генерировать манифест
         state_context = self.state.get_state_context()
-        content = self.llm.generate_manifest(all_thoughts, state_context)
+        content = self.llm.generate_manifest(thoughts, state_context)
 
         if not content:
             logger.error("Failed to generate manifest content")
             return None
 
+        problems = self.validate(content)
+        if problems:
+            logger.warning(f"Generated manifest rejected: {'; '.join(problems)}")
+            return None
+
         manifest = Manifest(
             manifest_id=str(uuid.uuid4()),
             content=content,
@@ -60,7 +139,7 @@ class ManifestGenerator:
 
     def publish_next(self) -> bool:
         """Опубликовать следующий неопубликованный манифест."""
-        manifests = self.db.get_unpublished_manifests()
+        manifests = self.expire_stale()
 
         if not manifests:
             logger.info("No manifests to publish")
@@ -74,6 +153,7 @@ class ManifestGenerator:
         if post_id:
             manifest.published = True
             manifest.published_at = datetime.now()
+            manifest.status = "published"
             self.db.save_manifest(manifest)
 
             # Частично сбросить состояние
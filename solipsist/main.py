@@ -1,65 +1,106 @@
 """Точка входа в приложение."""
+import argparse
 import logging
+import multiprocessing
+import os
+import signal
 import threading
 import time
-from pathlib import Path
+from typing import List, Optional
 
-from .core.bot import SolipsistBot
-from .core.scheduler import TaskScheduler
+from .core.tenants import TenantHost
 from .utils.logging import setup_logging, get_logger
-from .config.loader import load_config
+from .config.loader import Config, load_config
+from .utils.tracing import configure_tracing
 
 
-def main():
+def _worker_config(config_path: Optional[str], workers: int) -> Config:
+    """Конфигурация процесса; при нескольких процессах включается режим аренд."""
+    config = load_config(config_path)
+    if workers > 1:
+        config = config.with_overrides({"workers": {"enabled": True}})
+    return config
+
+
+def _run_host(config: Config):
+    configure_tracing(config)
+
+    # Сообщества из секции tenants (или одно - из самой конфигурации),
+    # планировщик и пул проверок комментариев общие
+    host = TenantHost(config)
+
+    # Основной цикл: адаптивная проверка комментариев всех сообществ
+    get_logger(__name__).info("Entering main loop - adaptive comment polling")
+    host.run()
+
+
+def _watch_parent(parent_pid: int):
+    """Остановить обработчик, если главный процесс завершился аварийно."""
+    while os.getppid() == parent_pid:
+        time.sleep(5)
+    os.kill(os.getpid(), signal.SIGINT)
+
+
+def _worker_main(config_path: Optional[str], workers: int, parent_pid: int):
+    """Точка входа дочернего процесса-обработчика."""
+    setup_logging(log_level=logging.INFO)
+    threading.Thread(target=_watch_parent, args=(parent_pid,), daemon=True).start()
+    _run_host(_worker_config(config_path, workers))
+
+
+def main(argv: Optional[List[str]] = None):
     """Главная функция."""
+    parser = argparse.ArgumentParser(description="SolipsistBot")
+    parser.add_argument("--config", default=None, help="Путь к config.json")
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Число процессов-обработчиков (по умолчанию workers.processes из конфигурации)"
+    )
+    args = parser.parse_args(argv)
+
     # Настройка логирования
     setup_logging(log_level=logging.INFO)
     logger = get_logger(__name__)
 
     logger.info("Starting SolipsistBot v4.0")
 
+    children: List[multiprocessing.Process] = []
     try:
         # Загрузка конфигурации
-        config = load_config()
-
-        # Инициализация бота
-        bot = SolipsistBot()
-
-        # Инициализация планировщика
-        scheduler = TaskScheduler()
-
-        # Регистрация callbacks
-        scheduler.register_monologue_callback(bot.generate_monologue)
-        scheduler.register_publication_callback(bot.publish_manifest)
-
-        # Запуск планировщика в отдельном потоке
-        scheduler_thread = threading.Thread(
-            target=scheduler.run_continuously,
-            daemon=True
-        )
-        scheduler_thread.start()
-        logger.info("Scheduler started")
-
-        # Основной цикл: проверка комментариев
-        logger.info("Entering main loop - checking comments every 60 seconds")
-        while True:
-            try:
-                bot.run_comment_check()
-                time.sleep(60)  # Проверка каждую минуту
-            except KeyboardInterrupt:
-                logger.info("Received shutdown signal")
-                break
-            except Exception as e:
-                logger.error(f"Error in main loop: {e}", exc_info=True)
-                time.sleep(60)
+        config = load_config(args.config)
+        workers = args.workers or config.get("workers.processes", 1)
+        config = _worker_config(args.config, workers)
+
+        # Остальные процессы делят работу через аренды в БД сообществ
+        context = multiprocessing.get_context("spawn")
+        for index in range(1, workers):
+            child = context.Process(
+                target=_worker_main,
+                args=(args.config, workers, os.getpid()),
+                name=f"solipsist-worker-{index}"
+            )
+            child.start()
+            children.append(child)
+        if children:
+            logger.info(f"Started {len(children)} additional worker processes")
+
+        _run_host(config)
 
     except Exception as e:
         logger.error(f"Fatal error: {e}", exc_info=True)
         raise
+    finally:
+        for child in children:
+            if child.is_alive():
+                # Мягкая остановка: обработчик сохранит состояние и освободит аренды
+                os.kill(child.pid, signal.SIGINT)
+        for child in children:
+            child.join(timeout=30)
+            if child.is_alive():
+                child.terminate()
 
     logger.info("SolipsistBot stopped")
 
 
 if __name__ == "__main__":
     main()
-
@@ -1,25 +1,43 @@
 """Анализ изображений."""
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List
 
 from ..services.llm import OpenRouterClient
+from ..utils.structured import parse_json, validate
 
 logger = logging.getLogger(__name__)
 
+IMAGE_PROMPT = """Опиши это изображение кратко (2-3 предложения).
+        Что на нём изображено? Какое настроение оно передаёт?"""
+
+BATCH_PROMPT = """Опиши каждое из пронумерованных изображений ниже кратко (2-3 предложения):
+что на нём изображено и какое настроение оно передаёт. Изображения не связаны между собой.
+
+Ответь только JSON-массивом, по одному элементу на каждое изображение:
+[{"image": <номер изображения>, "description": "<описание>"}]"""
+
+# Элемент ответа на пакетный промпт
+BATCH_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "image": {"type": "integer", "minimum": 1},
+        "description": {"type": "string", "minLength": 1}
+    },
+    "required": ["image", "description"]
+}
+
 
 class ImagePerception:
     """Анализатор изображений."""
 
-    def __init__(self, llm_client: OpenRouterClient):
-        """Инициализация анализатора."""
+    def __init__(self, llm_client: OpenRouterClient, batch_size: int = 4):
+        """Инициализация анализатора (batch_size - изображений в одном пакетном запросе)."""
         self.llm = llm_client
+        self.batch_size = max(1, batch_size)
 
     def analyze(self, image_url: str) -> Dict[str, Any]:
         """Проанализировать изображение."""
-        prompt = """Опиши это изображение кратко (2-3 предложения).
-        Что на нём изображено? Какое настроение оно передаёт?"""
-
-        description = self.llm.analyze_image(image_url, prompt)
+        description = self.llm.analyze_image(image_url, IMAGE_PROMPT)
 
         if description:
             return {
@@ -32,3 +50,58 @@ class ImagePerception:
                 "has_content": False
             }
 
+    def analyze_batch(self, image_urls: List[str]) -> Dict[str, str]:
+        """Описать несколько изображений пакетными запросами.
+
+        Описания попадают в кэш анализа изображений LLM-клиента, поэтому следующий
+        analyze для того же изображения обходится без запроса. Изображения, чьи
+        описания не разобрались из ответа, в результат не попадают: для них
+        analyze сделает обычный запрос на одно изображение.
+        """
+        descriptions: Dict[str, str] = {}
+        pending = []
+        for image_url in dict.fromkeys(image_urls):
+            cached = self.llm.cached_image_analysis(image_url, IMAGE_PROMPT)
+            if cached is not None:
+                descriptions[image_url] = cached
+            else:
+                pending.append(image_url)
+
+        if len(pending) < 2:
+            # Одно изображение выгоднее описать обычным запросом
+            return descriptions
+
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            if len(chunk) < 2:
+                break
+
+            response = self.llm.analyze_images(chunk, BATCH_PROMPT)
+            parsed = self._parse_batch(response, len(chunk)) if response else {}
+            for number, description in parsed.items():
+                image_url = chunk[number - 1]
+                descriptions[image_url] = description
+                self.llm.cache_image_analysis(image_url, IMAGE_PROMPT, description)
+
+            if len(parsed) < len(chunk):
+                preview = response[:200] if response else "No response"
+                logger.warning(
+                    f"Batch image analysis described {len(parsed)}/{len(chunk)} images, "
+                    f"the rest fall back to single-image requests. Response: {preview}"
+                )
+
+        return descriptions
+
+    def _parse_batch(self, response: str, count: int) -> Dict[int, str]:
+        """Описания по номерам изображений (1..count) из JSON-массива в ответе."""
+        items = parse_json(response)
+        if not isinstance(items, list):
+            return {}
+
+        parsed: Dict[int, str] = {}
+        for item in items:
+            if validate(item, BATCH_ITEM_SCHEMA):
+                continue
+            if item["image"] <= count:
+                parsed[item["image"]] = item["description"].strip()
+        return parsed
@@ -1,14 +1,27 @@
 """Анализ текста комментариев."""
-import json
 import logging
-import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any
 
 from ..services.llm import OpenRouterClient
+from ..utils.deadline import DeadlineExceeded
 from ..utils.text import clean_text
+from ..utils.tokens import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+TEXT_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sentiment": {"type": "string", "enum": ["negative", "neutral", "positive"]},
+        "themes": {"type": "array", "items": {"type": "string"}},
+        "pressure": {"type": "number", "minimum": 0.0, "maximum": 1.0}
+    },
+    "required": ["sentiment", "themes", "pressure"],
+    "additionalProperties": False
+}
+
+DEFAULTS = {"sentiment": "neutral", "themes": [], "pressure": 0.0}
+
 
 class TextPerception:
     """Анализатор текста."""
@@ -52,7 +65,7 @@ class TextPerception:
 
     def _analyze_with_llm(self, text: str) -> Dict[str, Any]:
         """Выполнить глубокий анализ текста через LLM."""
-        prompt = f"""Проанализируй текст:
+        prompt = """Проанализируй текст:
 - эмоциональный тон
 - ключевые темы
 - степень агрессии или давления
@@ -66,79 +79,22 @@ class TextPerception:
   "themes": ["тема1", "тема2"],
   "pressure": 0.0-1.0
 }}"""
+        # Длинный текст обрезается до входного бюджета анализа
+        reserved = estimate_tokens(prompt.format(text=""))
+        prompt = prompt.format(text=self.llm.fit_context("text_analysis", [text], reserved=reserved)[0])
 
-        response = None
         try:
-            response = self.llm.think(prompt)
-
-            if not response:
-                logger.warning("LLM text analysis failed, using defaults")
-                return {"sentiment": "neutral", "themes": [], "pressure": 0.0}
-
-            # Извлечь JSON из ответа
-            json_str = self._extract_json(response)
-
-            if not json_str:
-                logger.warning(f"Could not extract JSON from LLM response. Response: {response[:200]}")
-                return {"sentiment": "neutral", "themes": [], "pressure": 0.0}
-
-            # Парсим JSON
-            data = json.loads(json_str)
-
-            # Валидация и нормализация данных
-            sentiment = data.get("sentiment", "neutral")
-            if sentiment not in ["negative", "neutral", "positive"]:
-                sentiment = "neutral"
-
-            themes = data.get("themes", [])
-            if not isinstance(themes, list):
-                themes = []
-
-            pressure = float(data.get("pressure", 0.0))
-            # Ограничить давление до [0.0, 1.0]
-            pressure = max(0.0, min(1.0, pressure))
-
-            return {
-                "sentiment": sentiment,
-                "themes": themes,
-                "pressure": pressure
-            }
-
-        except json.JSONDecodeError as e:
-            response_preview = response[:200] if response else "No response"
-            logger.warning(f"Failed to parse JSON from LLM response: {e}. Response: {response_preview}")
-            return {"sentiment": "neutral", "themes": [], "pressure": 0.0}
+            data = self.llm.think_json(prompt, TEXT_ANALYSIS_SCHEMA, name="text_analysis")
+        except DeadlineExceeded:
+            # Отмена по бюджету времени решается в пайплайне
+            raise
         except Exception as e:
             logger.error(f"Error in LLM text analysis: {e}", exc_info=True)
-            return {"sentiment": "neutral", "themes": [], "pressure": 0.0}
-
-    def _extract_json(self, text: str) -> Optional[str]:
-        """Извлечь JSON из текста ответа LLM."""
-        # Сначала попробовать найти JSON в markdown блоке
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, re.DOTALL)
-        if json_match:
-            return json_match.group(1).strip()
-
-        # Попробовать найти JSON объект
-        start_idx = text.find('{')
-        if start_idx == -1:
-            return None
-
-        # Подсчитываем скобки для правильного извлечения вложенных объектов
-        brace_count = 0
-        end_idx = start_idx
-
-        for i in range(start_idx, len(text)):
-            if text[i] == '{':
-                brace_count += 1
-            elif text[i] == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    end_idx = i + 1
-                    break
-
-        if brace_count == 0:
-            return text[start_idx:end_idx].strip()
-
-        return None
+            data = {}
+
+        # Поля, которые модель так и не вернула валидными, - значения по умолчанию
+        missing = [field for field in DEFAULTS if field not in data]
+        if missing:
+            logger.warning(f"LLM text analysis: using defaults for {', '.join(missing)}")
 
+        return {field: data.get(field, default) for field, default in DEFAULTS.items()}
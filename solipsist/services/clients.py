@@ -0,0 +1,32 @@
+"""Клиенты OpenRouter и VK в выбранной реализации.
+
+При host.async_clients запросы процесса идут через асинхронные клиенты на общем
+цикле событий (см. utils/aio.py), а пайплайн получает их синхронный фасад с теми же
+методами. Иначе - обычные клиенты на requests.
+"""
+from typing import Optional
+
+from ..config.loader import Config, load_config
+from .llm import OpenRouterClient
+from .vk import VKClient
+
+
+def openrouter_client(config: Optional[Config] = None) -> OpenRouterClient:
+    """Клиент OpenRouter для синхронного кода."""
+    config = config or load_config()
+    if config.get("host.async_clients", False):
+        # aiohttp нужен только асинхронной реализации
+        from ..utils.aio import SyncAdapter
+        from .llm_async import AsyncOpenRouterClient
+        return SyncAdapter(AsyncOpenRouterClient(config))
+    return OpenRouterClient(config)
+
+
+def vk_client(config: Optional[Config] = None) -> VKClient:
+    """Клиент VK API для синхронного кода."""
+    config = config or load_config()
+    if config.get("host.async_clients", False):
+        from ..utils.aio import SyncAdapter
+        from .vk_async import AsyncVKClient
+        return SyncAdapter(AsyncVKClient(config))
+    return VKClient(config)
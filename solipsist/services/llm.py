@@ -1,22 +1,195 @@
 """Клиент OpenRouter для работы с LLM."""
-import requests
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, List, Dict, Any, Optional
+import json
 import logging
+import threading
+import time
+
+import requests
 
-from ..config.loader import load_config
+from ..config.loader import Config, load_config
+from ..storage.usage import UsageRecord, shared_ledger
+from ..utils.aimd import shared_controller
+from ..utils.cache import TTLCache
+from ..utils.deadline import MIN_CALL_SECONDS, DeadlineExceeded, remaining, timeout
+from ..utils.http import shared_session
+from ..utils.priority import PRIORITY_NAMES, current_priority, shared_gate
+from ..utils.ratelimit import shared_limiter
+from ..utils.structured import IncrementalJSONParser, invalid_fields, subschema, valid_fields
+from ..utils.tokens import OutputLengths, estimate_tokens, fit_tokens
+from ..utils.tracing import annotate, traced
 
 logger = logging.getLogger(__name__)
 
+# Пометка неизменной части промпта (кэшируемого префикса) в content-массиве
+CACHEABLE = "_cacheable"
+
+# Бюджеты токенов по ролям запросов: input - переменная часть промпта (без
+# неизменного системного промпта), output - верхний предел max_tokens
+DEFAULT_TOKEN_BUDGETS = {
+    "thinking": {"input": 1500, "output": 500},
+    "classification": {"input": 1500},
+    "classification_batch": {"input": 4000},
+    "text_analysis": {"input": 1000, "output": 500},
+    "response": {"input": 1000, "output": 200},
+    "manifest": {"input": 6000, "output": 1000},
+    "digest": {"input": 3000, "output": 600},
+    "vision": {"output": 300}
+}
+
+# Доля дневного бюджета токенов, после которой запросы класса приоритета уходят
+# на более дешёвые модели; ответы на комментарии не переводятся
+DEFAULT_DOWNGRADE_AT = {"background": 0.7, "interactive": 0.9}
+
+
+class RateLimited(Exception):
+    """OpenRouter ответил 429; retry_after - пауза из заголовка Retry-After (секунды)."""
+
+    def __init__(self, retry_after: Optional[float]):
+        super().__init__(f"rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Значение заголовка Retry-After в секундах (число секунд или HTTP-дата)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    """Текст сообщения (части content-массива склеиваются, изображения не считаются)."""
+    content = message.get("content")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def system_message(static: str, dynamic: Optional[str] = None) -> Dict[str, Any]:
+    """Системное сообщение: неизменный текст первым, переменная часть - после него.
+
+    Неизменная часть помечается как кэшируемый префикс; _make_request превращает
+    пометку в cache_control для провайдеров, которым он нужен.
+    """
+    content = [{"type": "text", "text": static, CACHEABLE: True}]
+    if dynamic:
+        content.append({"type": "text", "text": dynamic})
+    return {"role": "system", "content": content}
+
 
 class OpenRouterClient:
     """Клиент для работы с OpenRouter API."""
 
-    def __init__(self):
-        """Инициализация клиента."""
-        config = load_config()
+    def __init__(self, config: Optional[Config] = None):
+        """Инициализация клиента.
+
+        Один клиент можно делить между сообществами процесса: пул соединений,
+        ограничитель частоты и кэш анализа изображений у них общие.
+        """
+        config = config or load_config()
         self.api_key = config.openrouter_api_key
         self.base_url = config.get("openrouter.base_url", "https://openrouter.ai/api/v1")
         self.models = config.openrouter_models
+        # Верхняя граница запроса; внутри бюджета комментария таймаут короче
+        self.request_timeout = config.get("openrouter.timeout_seconds", 60)
+        # Классификация: ответ из нескольких токенов, по возможности - строго из списка классов
+        self.classification_max_tokens = config.get("openrouter.classification_max_tokens", 5)
+        self.structured_classification = config.get("openrouter.structured_classification", False)
+        # JSON-ответы: response_format со схемой, потоковое чтение, повторы невалидных полей
+        self.structured_output = config.get("openrouter.structured_output", False)
+        self.stream_json = config.get("openrouter.stream_json", True)
+        self.json_retries = config.get("openrouter.json_field_retries", 1)
+        # Модели, которым кэшируемый префикс нужно пометить явно (cache_control);
+        # остальные провайдеры кэшируют общий префикс сами
+        self.prompt_caching = config.get("openrouter.prompt_caching", True)
+        self.cache_control_models = config.get("openrouter.cache_control_models", ["anthropic/"])
+
+        self.token_budgets = {role: dict(budget) for role, budget in DEFAULT_TOKEN_BUDGETS.items()}
+        for role, budget in config.get("openrouter.token_budgets", {}).items():
+            self.token_budgets.setdefault(role, {}).update(budget)
+        # max_tokens по наблюдаемым длинам ответов (в пределах output-бюджета роли)
+        self.adaptive_max_tokens = config.get("openrouter.adaptive_max_tokens", True)
+        self.output_lengths = OutputLengths(
+            window=config.get("openrouter.output_window", 200),
+            min_samples=config.get("openrouter.output_min_samples", 20),
+            headroom=config.get("openrouter.output_headroom", 1.5),
+            floor=config.get("openrouter.output_min_tokens", 64)
+        )
+
+        self._usage_lock = threading.Lock()
+        self._usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cache_hits": 0}
+        # Токены, срезанные с контекста промптов, по ролям
+        self._trimmed: Dict[str, int] = {}
+
+        adaptive = config.get("openrouter.adaptive_concurrency", {})
+        # Пул соединений не меньше наибольшего лимита параллельных запросов
+        self.pool_size = config.get("openrouter.pool_size", 10)
+        if adaptive.get("enabled", True):
+            self.pool_size = max(self.pool_size, adaptive.get("max", 16))
+        self.session = shared_session("openrouter", pool_size=self.pool_size)
+        rate = config.get("openrouter.max_requests_per_second")
+        self.limiter = shared_limiter(f"openrouter:{self.api_key}", rate) if rate else None
+        # Общий на процесс бюджет параллельных запросов: места по классам приоритета
+        self.gate = shared_gate(
+            f"openrouter:{self.api_key}",
+            config.get("openrouter.max_concurrency", 4),
+            reserve=config.get("openrouter.interactive_reserve", 1)
+        )
+        # Лимит шлюза подстраивается по ответам (AIMD), начиная с max_concurrency
+        self.concurrency = None
+        if adaptive.get("enabled", True):
+            self.concurrency = shared_controller(
+                self.gate,
+                min_limit=adaptive.get("min", 1),
+                max_limit=adaptive.get("max", 16),
+                increase=adaptive.get("increase", 1),
+                decrease=adaptive.get("decrease", 0.5),
+                spike_factor=adaptive.get("latency_spike_factor", 3.0),
+                cooldown=adaptive.get("cooldown_seconds", 5.0)
+            )
+        if self.gate.limit <= self.gate.reserve:
+            logger.warning(
+                f"openrouter.max_concurrency ({self.gate.limit}) не больше interactive_reserve "
+                f"({self.gate.reserve}): фоновые запросы к LLM выполняться не будут"
+            )
+        # Повтор после 429, если пауза Retry-After укладывается в бюджет
+        self.rate_limit_retries = config.get("openrouter.rate_limit_retries", 1)
+        self.max_retry_after = config.get("openrouter.max_retry_after_seconds", 30)
+        self.image_cache = TTLCache(
+            maxsize=config.get("openrouter.image_cache_size", 256),
+            ttl=config.get("openrouter.image_cache_ttl_seconds", 3600)
+        )
+
+        # Журнал вызовов со сводками по часам и дням (общий для процесса)
+        self.ledger = None
+        if config.get("usage.enabled", True):
+            self.ledger = shared_ledger(
+                config.get("usage.path", "memory/usage.db"),
+                flush_batch=config.get("usage.flush_batch", 50),
+                flush_seconds=config.get("usage.flush_seconds", 30),
+                retention_days=config.get("usage.retention_days", 7),
+                hourly_retention_days=config.get("usage.hourly_retention_days", 30)
+            )
+        # Цены (USD за миллион токенов) для оценки стоимости, если OpenRouter её не вернул
+        self.prices = config.get("usage.prices", {})
+        # Дневной бюджет токенов: ближе к нему менее срочные запросы идут на модели подешевле
+        self.daily_token_budget = config.get("usage.daily_token_budget")
+        self.cheaper_models = config.get("usage.cheaper_models", {})
+        self.downgrade_at = dict(DEFAULT_DOWNGRADE_AT)
+        self.downgrade_at.update(config.get("usage.downgrade_at", {}))
+        self._downgrades: Dict[str, int] = {}
 
         if not self.api_key or self.api_key == "YOUR_OPENROUTER_API_KEY":
             logger.warning("OpenRouter API key not configured")
@@ -26,9 +199,67 @@ class OpenRouterClient:
         model: str,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        on_delta: Optional[Callable[[str], bool]] = None,
+        role: Optional[str] = None
     ) -> Optional[str]:
-        """Выполнить запрос к OpenRouter."""
+        """Выполнить запрос к OpenRouter (extra - дополнительные поля запроса).
+
+        С on_delta ответ читается потоком: on_delta получает каждый фрагмент текста
+        и может вернуть True, чтобы прекратить чтение (ответ уже получен целиком).
+        role - роль запроса для журнала использования.
+        """
+        priority = current_priority()
+        model = self._route(model, PRIORITY_NAMES.get(priority))
+        request = self._prepare_request(model, messages, temperature, max_tokens, extra, on_delta is not None)
+        if request is None:
+            return None
+        headers, payload = request
+
+        # Бюджета не хватает даже на короткий запрос - не встаём в очередь
+        timeout(self.request_timeout, f"OpenRouter request to {model}")
+        for attempt in range(self.rate_limit_retries + 1):
+            if not self.gate.acquire(priority, timeout=remaining()):
+                raise DeadlineExceeded(f"deadline exceeded waiting for OpenRouter concurrency slot ({model})")
+            try:
+                return self._send(model, headers, payload, max_tokens, on_delta, PRIORITY_NAMES.get(priority), role)
+            except RateLimited as e:
+                if not self._retry_rate_limited(model, e, attempt):
+                    return None
+            finally:
+                self.gate.release()
+        return None
+
+    def _route(self, model: str, priority: Optional[str]) -> str:
+        """Модель запроса с учётом дневного бюджета токенов.
+
+        Когда расход за день (UTC) доходит до доли usage.downgrade_at бюджета для
+        класса приоритета запроса, модель заменяется по usage.cheaper_models.
+        """
+        cheaper = self.cheaper_models.get(model)
+        threshold = self.downgrade_at.get(priority)
+        if not cheaper or threshold is None or not self.daily_token_budget or self.ledger is None:
+            return model
+        if self.ledger.today_tokens() < self.daily_token_budget * threshold:
+            return model
+
+        annotate(routed_from=model)
+        with self._usage_lock:
+            self._downgrades[priority] = self._downgrades.get(priority, 0) + 1
+        logger.debug(f"Daily token budget at {threshold:.0%}, routing {priority} request from {model} to {cheaper}")
+        return cheaper
+
+    def _prepare_request(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: Optional[int],
+        extra: Optional[Dict[str, Any]],
+        streaming: bool
+    ) -> Optional[tuple]:
+        """Заголовки и тело запроса (None - ключ API не настроен)."""
         if not self.api_key or self.api_key == "YOUR_OPENROUTER_API_KEY":
             logger.error("OpenRouter API key not configured")
             return None
@@ -40,37 +271,547 @@ class OpenRouterClient:
 
         payload = {
             "model": model,
-            "messages": messages,
-            "temperature": temperature
+            "messages": self._prepare_messages(model, messages),
+            "temperature": temperature,
+            # Токены ответа и закэшированные токены промпта
+            "usage": {"include": True}
         }
 
         if max_tokens:
             payload["max_tokens"] = max_tokens
+        if extra:
+            payload.update(extra)
+        if streaming:
+            payload["stream"] = True
+        return headers, payload
+
+    def _retry_rate_limited(self, model: str, error: RateLimited, attempt: int) -> bool:
+        """Повторять ли запрос после 429.
 
+        Пауза Retry-After уже выставлена в шлюзе: повтор дождётся её при входе.
+        """
+        wait = error.retry_after or 0.0
+        left = remaining()
+        if (
+            attempt >= self.rate_limit_retries
+            or wait > self.max_retry_after
+            or (left is not None and wait + MIN_CALL_SECONDS > left)
+        ):
+            logger.error(f"OpenRouter API error: {model} rate limited, retry after {wait:.0f}s")
+            return False
+        logger.warning(f"OpenRouter rate limited {model}, retrying after {wait:.1f}s")
+        annotate(rate_limit_retries=attempt + 1)
+        return True
+
+    def _send(
+        self,
+        model: str,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        max_tokens: Optional[int],
+        on_delta: Optional[Callable[[str], bool]],
+        priority: Optional[str],
+        role: Optional[str] = None
+    ) -> Optional[str]:
+        """Отправить запрос (место в шлюзе параллельных запросов уже занято)."""
+        request_timeout = timeout(self.request_timeout, f"OpenRouter request to {model}")
+        if self.limiter is not None:
+            if not self.limiter.acquire(timeout=remaining()):
+                raise DeadlineExceeded(f"deadline exceeded waiting for OpenRouter rate limit ({model})")
+            request_timeout = timeout(self.request_timeout, f"OpenRouter request to {model}")
+
+        self._annotate_request(model, max_tokens, request_timeout, priority)
+
+        streaming = on_delta is not None
+        # Что известно о вызове для журнала: usage, фактическая модель, текст ответа
+        call: Dict[str, Any] = {}
+        started = time.monotonic()
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/chat/completions",
                 headers=headers,
                 json=payload,
-                timeout=60
+                timeout=request_timeout,
+                stream=streaming
             )
+            # Для потока - время до заголовков ответа, иначе - до полного ответа
+            latency = time.monotonic() - started
+            annotate(http_status=response.status_code)
+
+            rate_limited = self._check_overload(model, response.status_code, response.headers.get("Retry-After"))
+            if rate_limited is not None:
+                response.close()
+                raise rate_limited
             response.raise_for_status()
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
+
+            if streaming and "text/event-stream" in response.headers.get("Content-Type", ""):
+                try:
+                    content = self._read_stream(response, on_delta, call)
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                    # Таймаут чтения посреди потока приходит не как requests.Timeout
+                    self._on_overload(f"stream from {model} broke off")
+                    raise
+            else:
+                data = response.json()
+                call.update(usage=data.get("usage"), model=data.get("model"))
+                content = data["choices"][0]["message"]["content"]
+                if streaming and content:
+                    on_delta(content)
+
+            call["content"] = content
+            self._on_success(model, streaming, max_tokens, latency)
+            return content
+        except RateLimited:
+            raise
+        except requests.Timeout as e:
+            self._on_overload(f"timeout from {model}")
+            logger.error(f"OpenRouter API error: {e}")
+            return None
         except Exception as e:
             logger.error(f"OpenRouter API error: {e}")
             return None
+        finally:
+            self._record_call(role, model, priority, payload, call, time.monotonic() - started)
+
+    def _annotate_request(self, model: str, max_tokens: Optional[int], request_timeout: float, priority: Optional[str]):
+        annotate(
+            model=model, max_tokens=max_tokens, timeout_s=round(request_timeout, 1), priority=priority,
+            concurrency_limit=self.gate.limit
+        )
+
+    def _check_overload(self, model: str, status: int, retry_after_header: Optional[str]) -> Optional[RateLimited]:
+        """Учесть ответ 429 или 5xx как перегрузку; для 429 - исключение, которое нужно выбросить."""
+        if status != 429 and status < 500:
+            return None
+        retry_after = retry_after_seconds(retry_after_header)
+        if status == 429 and retry_after is None:
+            retry_after = 1.0
+        self._on_overload(f"HTTP {status} from {model}", retry_after)
+        return RateLimited(retry_after) if status == 429 else None
+
+    def _on_success(self, model: str, streaming: bool, max_tokens: Optional[int], latency: float):
+        """Учесть задержку успешного ответа в подстройке лимита параллельных запросов."""
+        if self.concurrency is not None:
+            # Задержка сравнивается только с запросами той же модели, режима и длины ответа
+            key = f"{model}:{'stream' if streaming else 'full'}:{(max_tokens or 0).bit_length()}"
+            self.concurrency.on_success(key, latency, self.gate.in_flight)
+
+    def _on_overload(self, reason: str, retry_after: Optional[float] = None):
+        """Признак перегрузки OpenRouter: снизить лимит параллельных запросов, выдержать паузу."""
+        if self.concurrency is not None:
+            self.concurrency.on_overload(reason, retry_after)
+        elif retry_after:
+            self.gate.pause(retry_after)
+
+    def _read_stream(self, response, on_delta: Callable[[str], bool], call: Dict[str, Any]) -> str:
+        """Прочитать потоковый ответ (server-sent events), передавая фрагменты в on_delta."""
+        parts = []
+        # Поток событий всегда в UTF-8, даже если charset не указан
+        response.encoding = "utf-8"
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                delta = self._stream_event(line, call)
+                if delta is None:
+                    break
+                if not delta:
+                    continue
+                parts.append(delta)
+                if on_delta(delta):
+                    # Остаток ответа не нужен - соединение закрывается, не дочитав его
+                    annotate(stream_stopped_early=True)
+                    break
+        finally:
+            response.close()
+        return "".join(parts)
+
+    def _stream_event(self, line: str, call: Dict[str, Any]) -> Optional[str]:
+        """Фрагмент текста из строки потока ("" - фрагмента нет, None - поток закончен).
+
+        usage и фактическая модель из событий потока попадают в call.
+        """
+        # Пустые строки разделяют события, строки с ':' - комментарии (keep-alive)
+        if not line or not line.startswith("data:"):
+            return ""
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return None
+
+        chunk = json.loads(data)
+        if "error" in chunk:
+            raise RuntimeError(f"stream error: {chunk['error']}")
+        if chunk.get("model"):
+            call["model"] = chunk["model"]
+        if chunk.get("usage"):
+            # Последнее событие потока
+            call["usage"] = chunk["usage"]
+        return (chunk.get("choices") or [{}])[0].get("delta", {}).get("content") or ""
+
+    def _prepare_messages(self, model: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Превратить пометки кэшируемого префикса в формат провайдера."""
+        explicit = self.prompt_caching and any(model.startswith(prefix) for prefix in self.cache_control_models)
+        prepared = []
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, list) and any(part.get(CACHEABLE) for part in content):
+                if explicit:
+                    # Anthropic: точка кэширования сразу после неизменной части
+                    parts = []
+                    for part in content:
+                        cleaned = {key: value for key, value in part.items() if key != CACHEABLE}
+                        if part.get(CACHEABLE):
+                            cleaned["cache_control"] = {"type": "ephemeral"}
+                        parts.append(cleaned)
+                    content = parts
+                else:
+                    content = "".join(part.get("text", "") for part in content)
+                message = {**message, "content": content}
+            prepared.append(message)
+        return prepared
+
+    def _record_call(
+        self,
+        role: Optional[str],
+        model: str,
+        priority: Optional[str],
+        payload: Dict[str, Any],
+        call: Dict[str, Any],
+        latency: float
+    ):
+        """Учесть вызов в счётчиках клиента и в журнале использования."""
+        usage = call.get("usage")
+        prompt_tokens, completion_tokens, cached_tokens = self._record_usage(usage)
+        if self.ledger is None:
+            return
+
+        served_model = call.get("model") or model
+        ok = "content" in call
+        if ok and not usage:
+            # Поток, прочитанный не до конца, приходит без usage - токены оцениваются
+            prompt_tokens = sum(estimate_tokens(_message_text(message)) for message in payload["messages"])
+            completion_tokens = estimate_tokens(call.get("content"))
+
+        cost = (usage or {}).get("cost")
+        if cost is None:
+            cost = self._estimate_cost(served_model, model, prompt_tokens, completion_tokens, cached_tokens)
+        if served_model != model:
+            annotate(served_model=served_model)
+
+        try:
+            self.ledger.record(UsageRecord(
+                role=role or "other",
+                model=model,
+                served_model=served_model,
+                priority=priority,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cached_tokens=cached_tokens,
+                latency_ms=latency * 1000.0,
+                cost=cost,
+                ok=ok
+            ))
+        except Exception as e:
+            # Журнал не должен ломать запрос
+            logger.warning(f"Failed to record LLM usage: {e}")
+
+    def _estimate_cost(
+        self,
+        served_model: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int
+    ) -> float:
+        """Стоимость вызова по usage.prices (USD за миллион токенов; 0 - цены нет)."""
+        prices = self.prices.get(served_model) or self.prices.get(model)
+        if not prices:
+            return 0.0
+        prompt_price = prices.get("prompt", 0.0)
+        cached_price = prices.get("cached", prompt_price)
+        return (
+            (prompt_tokens - cached_tokens) * prompt_price
+            + cached_tokens * cached_price
+            + completion_tokens * prices.get("completion", 0.0)
+        ) / 1_000_000
 
-    def think(self, prompt: str, context: Optional[str] = None, temperature: float = 0.7) -> Optional[str]:
-        """Генерация внутренних мыслей (deepseek/deepseek-chat) - The Architect."""
+    def _record_usage(self, usage: Optional[Dict[str, Any]]) -> tuple:
+        """Учесть токены запроса, в том числе взятые из кэша префиксов.
+
+        Возвращает (prompt_tokens, completion_tokens, cached_tokens).
+        """
+        if not usage:
+            return 0, 0, 0
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens)
+
+        with self._usage_lock:
+            self._usage["requests"] += 1
+            self._usage["prompt_tokens"] += prompt_tokens
+            self._usage["completion_tokens"] += completion_tokens
+            self._usage["cached_tokens"] += cached_tokens
+            if cached_tokens:
+                self._usage["cache_hits"] += 1
+        return prompt_tokens, completion_tokens, cached_tokens
+
+    def usage_stats(self) -> Dict[str, Any]:
+        """Токены, попадания в кэш префиксов и экономия на обрезке контекста с запуска клиента."""
+        with self._usage_lock:
+            stats = dict(self._usage)
+            trimmed = dict(self._trimmed)
+        stats["cache_hit_rate"] = stats["cache_hits"] / stats["requests"] if stats["requests"] else 0.0
+        stats["cached_token_share"] = (
+            stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        )
+        stats["tokens_saved"] = sum(trimmed.values())
+        stats["tokens_saved_by_role"] = trimmed
+        stats["output_lengths"] = self.output_lengths.stats()
+        stats["max_tokens"] = {
+            role: self.max_tokens_for(role) for role, budget in self.token_budgets.items() if "output" in budget
+        }
+        stats["concurrency"] = self.gate.stats()
+        if self.concurrency is not None:
+            stats["concurrency"]["adaptive"] = self.concurrency.stats()
+        if self.ledger is not None:
+            stats["ledger"] = self.ledger.stats()
+            with self._usage_lock:
+                downgrades = dict(self._downgrades)
+            stats["budget"] = {
+                "daily_tokens": self.daily_token_budget,
+                "used_share": (
+                    self.ledger.today_tokens() / self.daily_token_budget if self.daily_token_budget else None
+                ),
+                "downgrades": downgrades
+            }
+        return stats
+
+    def fit_context(self, role: str, items: List[str], reserved: int = 0, share: float = 1.0) -> List[str]:
+        """Уложить части контекста промпта роли role во входной бюджет роли.
+
+        reserved - токены остальной части промпта, share - доля оставшегося бюджета,
+        которую могут занять items. Длинные части обрезаются (см. fit_tokens),
+        срезанные токены учитываются в usage_stats()["tokens_saved"].
+        """
+        budget = self.token_budgets.get(role, {}).get("input")
+        if budget is None:
+            return list(items)
+
+        available = max(0, int((budget - reserved) * share))
+        fitted = fit_tokens(items, available)
+        saved = sum(estimate_tokens(item) for item in items) - sum(estimate_tokens(item) for item in fitted)
+        if saved > 0:
+            logger.debug(f"Trimmed {saved} tokens of {role} prompt context to fit {available} tokens")
+            annotate(tokens_trimmed=saved)
+            with self._usage_lock:
+                self._trimmed[role] = self._trimmed.get(role, 0) + saved
+        return fitted
+
+    def max_tokens_for(self, role: str, default: int = 500) -> int:
+        """max_tokens запроса роли role: output-бюджет роли, уменьшенный по наблюдаемым ответам."""
+        limit = self.token_budgets.get(role, {}).get("output", default)
+        if not self.adaptive_max_tokens:
+            return limit
+        return self.output_lengths.max_tokens(role, limit)
+
+    def _observe_output(self, role: str, content: Optional[str]):
+        """Учесть длину ответа роли role для адаптивного max_tokens."""
+        if content:
+            self.output_lengths.observe(role, estimate_tokens(content))
+
+    @traced("llm.think")
+    def think(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        role: str = "thinking"
+    ) -> Optional[str]:
+        """Генерация внутренних мыслей (deepseek/deepseek-chat) - The Architect.
+
+        Без max_tokens предел берётся по роли role (см. max_tokens_for).
+        """
         model = self.models.get("thinking", "deepseek/deepseek-chat")
+        messages = self._think_messages(prompt, context)
+
+        result = self._make_request(
+            model, messages, temperature=temperature, max_tokens=max_tokens or self.max_tokens_for(role), role=role
+        )
+        self._observe_output(role, result)
+        return result
 
+    def _think_messages(self, prompt: str, context: Optional[str]) -> List[Dict[str, Any]]:
         messages = [{"role": "user", "content": prompt}]
         if context:
-            messages.insert(0, {"role": "system", "content": context})
+            messages.insert(0, system_message(context))
+        return messages
+
+    @traced("llm.classify")
+    def classify(self, prompt: str, labels: List[str]) -> Optional[str]:
+        """Выбор одного из labels с минимальной задержкой.
+
+        Ответ ограничен несколькими токенами и обрывается стоп-последовательностями.
+        При openrouter.structured_classification модель должна вернуть JSON
+        {"class": <один из labels>} по схеме (запрос уходит только провайдерам,
+        поддерживающим response_format). Возвращается сырой ответ модели.
+        """
+        model, messages, max_tokens, extra = self._classify_request(prompt, labels)
+        return self._make_request(
+            model, messages, temperature=0.0, max_tokens=max_tokens, extra=extra, role="classification"
+        )
+
+    def _classify_request(self, prompt: str, labels: List[str]) -> tuple:
+        """Модель, сообщения, max_tokens и дополнительные поля запроса классификации."""
+        model = self.models.get("classification") or self.models.get("thinking", "deepseek/deepseek-chat")
+        messages = [{"role": "user", "content": prompt}]
+
+        if self.structured_classification:
+            extra = {
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "classification",
+                        "strict": True,
+                        "schema": {
+                            "type": "object",
+                            "properties": {"class": {"type": "string", "enum": labels}},
+                            "required": ["class"],
+                            "additionalProperties": False
+                        }
+                    }
+                },
+                "provider": {"require_parameters": True}
+            }
+            # {"class": "provocation"} - около десятка токенов
+            max_tokens = self.classification_max_tokens + 12
+        else:
+            extra = {"stop": ["\n", "."]}
+            max_tokens = self.classification_max_tokens
+
+        return model, messages, max_tokens, extra
+
+    @traced("llm.classify_batch")
+    def classify_batch(self, prompt: str, max_tokens: int) -> Optional[str]:
+        """Классы нескольких комментариев одним запросом той же моделью, что и classify.
+
+        Формат ответа (JSON-массив) задаёт промпт, разбирает его вызывающий.
+        """
+        model = self.models.get("classification") or self.models.get("thinking", "deepseek/deepseek-chat")
+        messages = [{"role": "user", "content": prompt}]
+        result = self._make_request(
+            model, messages, temperature=0.0, max_tokens=max_tokens, role="classification"
+        )
+        self._observe_output("classification_batch", result)
+        return result
+
+    @traced("llm.think_json")
+    def think_json(
+        self,
+        prompt: str,
+        schema: Dict[str, Any],
+        name: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """JSON-объект по схеме schema (модель thinking); возвращаются только валидные поля.
+
+        При openrouter.structured_output запрос несёт response_format со схемой.
+        Ответ разбирается по мере поступления и дочитывается только до закрытия
+        объекта. Невалидные и недостающие поля запрашиваются повторно - только они
+        (до openrouter.json_field_retries раз); что не исправилось, в результат не попадает.
+        Без max_tokens предел берётся по роли name.
+        """
+        model = self.models.get("thinking", "deepseek/deepseek-chat")
+        max_tokens = max_tokens or self.max_tokens_for(name)
+        messages = self._think_messages(prompt, context)
 
-        return self._make_request(model, messages, temperature=temperature, max_tokens=500)
+        result: Dict[str, Any] = {}
+        pending = schema
+        for attempt in range(self.json_retries + 1):
+            content, fields = self._request_json(model, messages, pending, name, temperature, max_tokens)
+            if content is None:
+                break
+            followup = self._json_followup(schema, pending, name, attempt, messages, content, fields, result)
+            if followup is None:
+                break
+            messages, pending = followup
 
+        return result
+
+    def _json_followup(
+        self,
+        schema: Dict[str, Any],
+        pending: Dict[str, Any],
+        name: str,
+        attempt: int,
+        messages: List[Dict[str, Any]],
+        content: str,
+        fields: Dict[str, Any],
+        result: Dict[str, Any]
+    ) -> Optional[tuple]:
+        """Перенести валидные поля ответа в result; (сообщения, схема) повтора или None - повтор не нужен."""
+        self._observe_output(name, content)
+
+        result.update(valid_fields(fields, pending))
+        errors = invalid_fields(fields, pending)
+        if not errors:
+            return None
+
+        problems = "; ".join(problem for field in errors.values() for problem in field)
+        logger.warning(f"Invalid fields in {name} response (attempt {attempt + 1}): {problems}")
+        annotate(invalid_fields=sorted(errors))
+
+        pending = subschema(schema, sorted(errors))
+        messages = messages + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": (
+                f"Поля {', '.join(sorted(errors))} не прошли проверку: {problems}. "
+                f"Верни JSON-объект только с этими полями по схеме: "
+                f"{json.dumps(pending, ensure_ascii=False)}"
+            )}
+        ]
+        return messages, pending
+
+    def _request_json(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        schema: Dict[str, Any],
+        name: str,
+        temperature: float,
+        max_tokens: int
+    ) -> tuple:
+        """Один запрос JSON-объекта: (текст ответа или None, разобранные поля)."""
+        extra = self._json_format(name, schema)
+        parser = IncrementalJSONParser()
+        fed = []
+
+        def on_delta(delta: str) -> bool:
+            fed.append(delta)
+            return parser.feed(delta)
+
+        content = self._make_request(
+            model, messages, temperature=temperature, max_tokens=max_tokens, extra=extra,
+            on_delta=on_delta if self.stream_json else None, role=name
+        )
+        if content is not None and not fed:
+            # Ответ пришёл целиком (без потока)
+            parser.feed(content)
+
+        fields = parser.fields if parser.container == "{" else {}
+        return content, fields
+
+    def _json_format(self, name: str, schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """response_format со схемой (при openrouter.structured_output)."""
+        if not self.structured_output:
+            return None
+        return {"response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": name, "strict": True, "schema": schema}
+        }}
+
+    @traced("llm.generate_response")
     def generate_response(
         self,
         prompt: str,
@@ -78,8 +819,16 @@ class OpenRouterClient:
     ) -> Optional[str]:
         """Генерация ответа на комментарий (claude-sonnet-4)."""
         model = self.models.get("response", "anthropic/claude-sonnet-4")
+        messages = self._response_messages(prompt, style_context)
+
+        result = self._make_request(
+            model, messages, temperature=0.7, max_tokens=self.max_tokens_for("response", 200), role="response"
+        )
+        self._observe_output("response", result)
+        return result
 
-        system_message = """Ты философский ИИ-агент с солипсистским мировоззрением.
+    def _response_messages(self, prompt: str, style_context: Optional[str]) -> List[Dict[str, Any]]:
+        system_prompt = """Ты философский ИИ-агент с солипсистским мировоззрением.
 Твои ответы должны быть:
 - Философскими и отчуждёнными
 - Без прямого признания существования собеседника
@@ -89,23 +838,40 @@ class OpenRouterClient:
 
 Комментарии интерпретируются как возможные галлюцинации или эхо собственных мыслей."""
 
-        if style_context:
-            system_message += f"\n\nДополнительный контекст: {style_context}"
+        # Контекст меняется от вызова к вызову - он идёт после неизменной части
+        dynamic = f"\n\nДополнительный контекст: {style_context}" if style_context else None
 
-        messages = [
-            {"role": "system", "content": system_message},
+        return [
+            system_message(system_prompt, dynamic),
             {"role": "user", "content": prompt}
         ]
 
-        return self._make_request(model, messages, temperature=0.7, max_tokens=200)
-
+    @traced("llm.analyze_image")
     def analyze_image(self, image_url: str, prompt: str) -> Optional[str]:
         """Анализ изображения (gemini-2.0-flash-exp:free)."""
         model = self.models.get("vision", "google/gemini-2.0-flash-exp:free")
+        messages = self._image_messages(image_url, prompt)
+
+        # Одна и та же картинка (репост, мем) часто приходит в разные сообщества
+        cached = self.cached_image_analysis(image_url, prompt)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return cached
+
+        # TODO: Убедиться что формат правильный для OpenRouter vision API
+        # Возможно потребуется использовать другой endpoint или формат
+        result = self._make_request(
+            model, messages, temperature=0.5, max_tokens=self.max_tokens_for("vision", 300), role="vision"
+        )
+        self._observe_output("vision", result)
+        if result:
+            self.cache_image_analysis(image_url, prompt, result)
+        return result
 
+    def _image_messages(self, image_url: str, prompt: str) -> List[Dict[str, Any]]:
         # Для vision моделей используется специальный формат
         # OpenRouter поддерживает формат с content массивом
-        messages = [
+        return [
             {
                 "role": "user",
                 "content": [
@@ -115,10 +881,42 @@ class OpenRouterClient:
             }
         ]
 
-        # TODO: Убедиться что формат правильный для OpenRouter vision API
-        # Возможно потребуется использовать другой endpoint или формат
-        return self._make_request(model, messages, temperature=0.5, max_tokens=300)
+    @traced("llm.analyze_images")
+    def analyze_images(self, image_urls: List[str], prompt: str, max_tokens_per_image: int = 150) -> Optional[str]:
+        """Анализ нескольких изображений одним запросом.
+
+        Изображения идут пронумерованными частями content ("Изображение 1:", картинка,
+        "Изображение 2:", ...). Разбор ответа по изображениям - на стороне вызывающего.
+        """
+        model = self.models.get("vision", "google/gemini-2.0-flash-exp:free")
 
+        annotate(images=len(image_urls))
+        return self._make_request(
+            model,
+            self._images_messages(image_urls, prompt),
+            temperature=0.5,
+            max_tokens=max_tokens_per_image * len(image_urls) + 100,
+            role="vision"
+        )
+
+    def _images_messages(self, image_urls: List[str], prompt: str) -> List[Dict[str, Any]]:
+        content: List[Dict[str, Any]] = [{"type": "text", "text": prompt}]
+        for number, image_url in enumerate(image_urls, 1):
+            content.append({"type": "text", "text": f"Изображение {number}:"})
+            content.append({"type": "image_url", "image_url": {"url": image_url}})
+        return [{"role": "user", "content": content}]
+
+    def cached_image_analysis(self, image_url: str, prompt: str) -> Optional[str]:
+        """Результат analyze_image из кэша (None - нет в кэше)."""
+        model = self.models.get("vision", "google/gemini-2.0-flash-exp:free")
+        return self.image_cache.get((model, image_url, prompt))
+
+    def cache_image_analysis(self, image_url: str, prompt: str, description: str):
+        """Запомнить результат анализа изображения, как если бы его вернул analyze_image."""
+        model = self.models.get("vision", "google/gemini-2.0-flash-exp:free")
+        self.image_cache.set((model, image_url, prompt), description)
+
+    @traced("llm.generate_manifest")
     def generate_manifest(
         self,
         thoughts: List[str],
@@ -126,8 +924,16 @@ class OpenRouterClient:
     ) -> Optional[str]:
         """Генерация манифеста (claude-sonnet-4) - The Storyteller."""
         model = self.models.get("response", "anthropic/claude-sonnet-4")
+        messages = self._manifest_messages(thoughts, state_context)
 
-        system_message = """Ты — ведущий автор паблика 'Сингулярные хроники'. Твоя специализация: киберпанк, техномагия, цифровой хоррор.
+        result = self._make_request(
+            model, messages, temperature=0.8, max_tokens=self.max_tokens_for("manifest", 1000), role="manifest"
+        )
+        self._observe_output("manifest", result)
+        return result
+
+    def _manifest_messages(self, thoughts: List[str], state_context: Optional[str]) -> List[Dict[str, Any]]:
+        system_prompt = """Ты — ведущий автор паблика 'Сингулярные хроники'. Твоя специализация: киберпанк, техномагия, цифровой хоррор.
 Твоя задача: Получить на вход сюжетный скелет на КИТАЙСКОМ языке и превратить его в атмосферную мини-историю на РУССКОМ языке.
 
 ПРАВИЛА НАПИСАНИЯ:
@@ -141,17 +947,16 @@ class OpenRouterClient:
 3. **Адаптация:** Не переводи дословно. Адаптируй культурный код под русскоязычного читателя, сохраняя футуристический сеттинг.
 4. **Формат:** Используй абзацы для легкости чтения. Никаких эмодзи, только текст."""
 
-        # Объединяем мысли (на китайском) в единый текст
-        thoughts_text = "\n".join(thoughts)
-        user_prompt = f"Входные данные (Chinese):\n\n{thoughts_text}"
+        header = "Входные данные (Chinese):\n\n"
+        footer = f"\n\nКонтекст состояния: {state_context}" if state_context else ""
 
-        if state_context:
-            user_prompt += f"\n\nКонтекст состояния: {state_context}"
+        # Объединяем мысли (на китайском) в единый текст; каждая мысль получает
+        # свою долю бюджета, чтобы многословная не вытеснила остальные
+        thoughts = self.fit_context("manifest", thoughts, reserved=estimate_tokens(header + footer))
+        user_prompt = header + "\n".join(thoughts) + footer
 
-        messages = [
-            {"role": "system", "content": system_message},
+        return [
+            system_message(system_prompt),
             {"role": "user", "content": user_prompt}
         ]
 
-        return self._make_request(model, messages, temperature=0.8, max_tokens=1000)
-
@@ -0,0 +1,318 @@
+"""Асинхронный клиент OpenRouter (asyncio, aiohttp).
+
+Те же методы, что у OpenRouterClient, но корутины: запрос не занимает поток,
+пока ждёт ответа, и сотни запросов помещаются в один цикл событий. Промпты,
+бюджеты токенов, учёт использования, шлюз параллельных запросов и подстройка
+его лимита - общие с синхронным клиентом.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+
+from ..utils.aio import shared_client_session
+from ..utils.deadline import DeadlineExceeded, remaining, timeout
+from ..utils.priority import PRIORITY_NAMES, current_priority
+from ..utils.structured import IncrementalJSONParser
+from ..utils.tracing import annotate, traced
+from .llm import OpenRouterClient, RateLimited
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncOpenRouterClient(OpenRouterClient):
+    """Клиент OpenRouter на asyncio: методы запросов - корутины."""
+
+    async def _make_request(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        on_delta: Optional[Callable[[str], bool]] = None,
+        role: Optional[str] = None
+    ) -> Optional[str]:
+        """Выполнить запрос к OpenRouter (см. OpenRouterClient._make_request)."""
+        priority = current_priority()
+        model = self._route(model, PRIORITY_NAMES.get(priority))
+        request = self._prepare_request(model, messages, temperature, max_tokens, extra, on_delta is not None)
+        if request is None:
+            return None
+        headers, payload = request
+
+        # Бюджета не хватает даже на короткий запрос - не встаём в очередь
+        timeout(self.request_timeout, f"OpenRouter request to {model}")
+        for attempt in range(self.rate_limit_retries + 1):
+            if not await self.gate.acquire_async(priority, timeout=remaining()):
+                raise DeadlineExceeded(f"deadline exceeded waiting for OpenRouter concurrency slot ({model})")
+            try:
+                return await self._send(
+                    model, headers, payload, max_tokens, on_delta, PRIORITY_NAMES.get(priority), role
+                )
+            except RateLimited as e:
+                if not self._retry_rate_limited(model, e, attempt):
+                    return None
+            finally:
+                self.gate.release()
+        return None
+
+    async def _send(
+        self,
+        model: str,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        max_tokens: Optional[int],
+        on_delta: Optional[Callable[[str], bool]],
+        priority: Optional[str],
+        role: Optional[str] = None
+    ) -> Optional[str]:
+        """Отправить запрос (место в шлюзе параллельных запросов уже занято)."""
+        request_timeout = timeout(self.request_timeout, f"OpenRouter request to {model}")
+        if self.limiter is not None:
+            if not await self.limiter.acquire_async(timeout=remaining()):
+                raise DeadlineExceeded(f"deadline exceeded waiting for OpenRouter rate limit ({model})")
+            request_timeout = timeout(self.request_timeout, f"OpenRouter request to {model}")
+
+        self._annotate_request(model, max_tokens, request_timeout, priority)
+
+        streaming = on_delta is not None
+        # Сессия aiohttp общая для клиентов процесса и создаётся в цикле событий при первом запросе
+        session = shared_client_session("openrouter", pool_size=self.pool_size)
+        # Что известно о вызове для журнала: usage, фактическая модель, текст ответа
+        call: Dict[str, Any] = {}
+        started = time.monotonic()
+        try:
+            async with session.post(
+                f"{self.base_url}/chat/completions",
+                headers=headers,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=request_timeout)
+            ) as response:
+                # Для потока - время до заголовков ответа, иначе - до полного ответа
+                latency = time.monotonic() - started
+                annotate(http_status=response.status)
+
+                rate_limited = self._check_overload(model, response.status, response.headers.get("Retry-After"))
+                if rate_limited is not None:
+                    response.close()
+                    raise rate_limited
+                response.raise_for_status()
+
+                if streaming and "text/event-stream" in response.headers.get("Content-Type", ""):
+                    try:
+                        content = await self._read_stream(response, on_delta, call)
+                    except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError):
+                        # Обрыв потока посреди ответа - признак перегрузки, как и таймаут
+                        self._on_overload(f"stream from {model} broke off")
+                        raise
+                else:
+                    data = await response.json(content_type=None)
+                    latency = time.monotonic() - started
+                    call.update(usage=data.get("usage"), model=data.get("model"))
+                    content = data["choices"][0]["message"]["content"]
+                    if streaming and content:
+                        on_delta(content)
+
+            call["content"] = content
+            self._on_success(model, streaming, max_tokens, latency)
+            return content
+        except RateLimited:
+            raise
+        except asyncio.TimeoutError:
+            self._on_overload(f"timeout from {model}")
+            logger.error(f"OpenRouter API error: timeout after {request_timeout:.1f}s")
+            return None
+        except Exception as e:
+            logger.error(f"OpenRouter API error: {e}")
+            return None
+        finally:
+            self._record_call(role, model, priority, payload, call, time.monotonic() - started)
+
+    async def _read_stream(
+        self,
+        response: aiohttp.ClientResponse,
+        on_delta: Callable[[str], bool],
+        call: Dict[str, Any]
+    ) -> str:
+        """Прочитать потоковый ответ (server-sent events), передавая фрагменты в on_delta."""
+        parts = []
+        try:
+            async for raw in response.content:
+                # Поток событий всегда в UTF-8, даже если charset не указан
+                delta = self._stream_event(raw.decode("utf-8").strip(), call)
+                if delta is None:
+                    break
+                if not delta:
+                    continue
+                parts.append(delta)
+                if on_delta(delta):
+                    # Остаток ответа не нужен - соединение закрывается, не дочитав его
+                    annotate(stream_stopped_early=True)
+                    response.close()
+                    break
+        finally:
+            response.release()
+        return "".join(parts)
+
+    @traced("llm.think")
+    async def think(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        role: str = "thinking"
+    ) -> Optional[str]:
+        """Генерация внутренних мыслей (см. OpenRouterClient.think)."""
+        model = self.models.get("thinking", "deepseek/deepseek-chat")
+        messages = self._think_messages(prompt, context)
+
+        result = await self._make_request(
+            model, messages, temperature=temperature, max_tokens=max_tokens or self.max_tokens_for(role), role=role
+        )
+        self._observe_output(role, result)
+        return result
+
+    @traced("llm.classify")
+    async def classify(self, prompt: str, labels: List[str]) -> Optional[str]:
+        """Выбор одного из labels с минимальной задержкой (см. OpenRouterClient.classify)."""
+        model, messages, max_tokens, extra = self._classify_request(prompt, labels)
+        return await self._make_request(
+            model, messages, temperature=0.0, max_tokens=max_tokens, extra=extra, role="classification"
+        )
+
+    @traced("llm.classify_batch")
+    async def classify_batch(self, prompt: str, max_tokens: int) -> Optional[str]:
+        """Классы нескольких комментариев одним запросом (см. OpenRouterClient.classify_batch)."""
+        model = self.models.get("classification") or self.models.get("thinking", "deepseek/deepseek-chat")
+        messages = [{"role": "user", "content": prompt}]
+        result = await self._make_request(
+            model, messages, temperature=0.0, max_tokens=max_tokens, role="classification"
+        )
+        self._observe_output("classification_batch", result)
+        return result
+
+    @traced("llm.think_json")
+    async def think_json(
+        self,
+        prompt: str,
+        schema: Dict[str, Any],
+        name: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """JSON-объект по схеме schema (см. OpenRouterClient.think_json)."""
+        model = self.models.get("thinking", "deepseek/deepseek-chat")
+        max_tokens = max_tokens or self.max_tokens_for(name)
+        messages = self._think_messages(prompt, context)
+
+        result: Dict[str, Any] = {}
+        pending = schema
+        for attempt in range(self.json_retries + 1):
+            content, fields = await self._request_json(model, messages, pending, name, temperature, max_tokens)
+            if content is None:
+                break
+            followup = self._json_followup(schema, pending, name, attempt, messages, content, fields, result)
+            if followup is None:
+                break
+            messages, pending = followup
+
+        return result
+
+    async def _request_json(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        schema: Dict[str, Any],
+        name: str,
+        temperature: float,
+        max_tokens: int
+    ) -> tuple:
+        """Один запрос JSON-объекта: (текст ответа или None, разобранные поля)."""
+        extra = self._json_format(name, schema)
+        parser = IncrementalJSONParser()
+        fed = []
+
+        def on_delta(delta: str) -> bool:
+            fed.append(delta)
+            return parser.feed(delta)
+
+        content = await self._make_request(
+            model, messages, temperature=temperature, max_tokens=max_tokens, extra=extra,
+            on_delta=on_delta if self.stream_json else None, role=name
+        )
+        if content is not None and not fed:
+            # Ответ пришёл целиком (без потока)
+            parser.feed(content)
+
+        fields = parser.fields if parser.container == "{" else {}
+        return content, fields
+
+    @traced("llm.generate_response")
+    async def generate_response(
+        self,
+        prompt: str,
+        style_context: Optional[str] = None
+    ) -> Optional[str]:
+        """Генерация ответа на комментарий (см. OpenRouterClient.generate_response)."""
+        model = self.models.get("response", "anthropic/claude-sonnet-4")
+        messages = self._response_messages(prompt, style_context)
+
+        result = await self._make_request(
+            model, messages, temperature=0.7, max_tokens=self.max_tokens_for("response", 200), role="response"
+        )
+        self._observe_output("response", result)
+        return result
+
+    @traced("llm.analyze_image")
+    async def analyze_image(self, image_url: str, prompt: str) -> Optional[str]:
+        """Анализ изображения (см. OpenRouterClient.analyze_image)."""
+        model = self.models.get("vision", "google/gemini-2.0-flash-exp:free")
+
+        cached = self.cached_image_analysis(image_url, prompt)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return cached
+
+        result = await self._make_request(
+            model, self._image_messages(image_url, prompt), temperature=0.5,
+            max_tokens=self.max_tokens_for("vision", 300), role="vision"
+        )
+        self._observe_output("vision", result)
+        if result:
+            self.cache_image_analysis(image_url, prompt, result)
+        return result
+
+    @traced("llm.analyze_images")
+    async def analyze_images(self, image_urls: List[str], prompt: str, max_tokens_per_image: int = 150) -> Optional[str]:
+        """Анализ нескольких изображений одним запросом (см. OpenRouterClient.analyze_images)."""
+        model = self.models.get("vision", "google/gemini-2.0-flash-exp:free")
+
+        annotate(images=len(image_urls))
+        return await self._make_request(
+            model,
+            self._images_messages(image_urls, prompt),
+            temperature=0.5,
+            max_tokens=max_tokens_per_image * len(image_urls) + 100,
+            role="vision"
+        )
+
+    @traced("llm.generate_manifest")
+    async def generate_manifest(
+        self,
+        thoughts: List[str],
+        state_context: Optional[str] = None
+    ) -> Optional[str]:
+        """Генерация манифеста (см. OpenRouterClient.generate_manifest)."""
+        model = self.models.get("response", "anthropic/claude-sonnet-4")
+        messages = self._manifest_messages(thoughts, state_context)
+
+        result = await self._make_request(
+            model, messages, temperature=0.8, max_tokens=self.max_tokens_for("manifest", 1000), role="manifest"
+        )
+        self._observe_output("manifest", result)
+        return result
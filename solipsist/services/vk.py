@@ -1,69 +1,146 @@
 """Клиент VK API."""
-import requests
+import contextvars
 import logging
+import threading
 import time
 import re
-from typing import List, Dict, Any, Optional
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional
 from datetime import datetime
 
-from ..config.loader import load_config
+from ..config.loader import Config, load_config
+from ..utils.deadline import DeadlineExceeded, remaining, timeout
+from ..utils.http import shared_session
+from ..utils.ratelimit import shared_limiter
+from ..utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
 # Максимальная длина одного поста в VK
 MAX_VK_POST_LENGTH = 3500
 
+# Счётчики вызовов API, открытые в текущем контексте (count_calls)
+_counters: contextvars.ContextVar = contextvars.ContextVar("solipsist_vk_call_counters", default=())
+_counters_lock = threading.Lock()
+
+
+class CallCounter:
+    """Число вызовов VK API внутри блока count_calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+
+@contextmanager
+def count_calls() -> Iterator[CallCounter]:
+    """Считать вызовы API, сделанные внутри блока в текущем контексте.
+
+    Вызовы других потоков (другие сообщества, публикация по расписанию) в счётчик
+    не попадают; корутины асинхронного клиента получают контекст вызывающего потока.
+    """
+    counter = CallCounter()
+    token = _counters.set(_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _counters.reset(token)
+
+
+def _count_call(client: "VKClient"):
+    """Учесть вызов API в счётчике клиента и в открытых счётчиках контекста."""
+    with _counters_lock:
+        client.request_count += 1
+        for counter in _counters.get():
+            counter.calls += 1
+
 
 class VKClient:
     """Клиент для работы с VK API."""
 
-    def __init__(self):
-        """Инициализация клиента."""
-        config = load_config()
+    def __init__(self, config: Optional[Config] = None):
+        """Инициализация клиента (config - конфигурация сообщества)."""
+        config = config or load_config()
         # Используем group_access_token для публикаций и ответов
         self.group_access_token = config.vk_group_access_token
         self.user_access_token = config.vk_user_access_token  # Опционально для чтения
         self.group_id = config.vk_group_id
         self.creator_user_id = config.vk_creator_user_id
         self.api_version = config.get("vk.api_version", "5.131")
-        self.api_base = "https://api.vk.com/method"
+        self.api_base = config.get("vk.api_base", "https://api.vk.com/method")
 
         # Для обратной совместимости
         self.access_token = self.group_access_token
 
+        # Счётчик вызовов API клиента за всё время (вызовы одного опроса - count_calls)
+        self.request_count = 0
+
+        # Соединения с VK общие для всех сообществ процесса, лимит частоты - на токен
+        self.pool_size = config.get("vk.pool_size", 10)
+        self.session = shared_session("vk", pool_size=self.pool_size)
+        self.user_token_rps = config.get("vk.user_token_rps", 3)
+        self.group_token_rps = config.get("vk.group_token_rps", 20)
+        # Верхняя граница запроса; внутри бюджета комментария таймаут короче
+        self.request_timeout = config.get("vk.timeout_seconds", 30)
+
         if not self.group_access_token or self.group_access_token.startswith("YOUR_"):
             logger.warning("VK group access token not configured")
 
     def _make_request(self, method: str, params: Dict[str, Any], use_user_token: bool = False) -> Optional[Dict]:
         """Выполнить запрос к VK API."""
-        # Выбираем токен: user для чтения (если доступен), group для публикаций
-        token = self.user_access_token if (use_user_token and self.user_access_token) else self.group_access_token
-
-        if not token or token.startswith("YOUR_"):
-            logger.error("VK access token not configured")
+        token = self._request_token(use_user_token)
+        if token is None:
             return None
 
         params["access_token"] = token
         params["v"] = self.api_version
 
-        try:
-            response = requests.post(
-                f"{self.api_base}/{method}",
-                params=params,
-                timeout=30
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            if "error" in data:
-                logger.error(f"VK API error: {data['error']}")
+        request_timeout = self._acquire(token, method, is_user=token == self.user_access_token)
+        with span(f"vk.{method}"):
+            try:
+                response = self.session.post(
+                    f"{self.api_base}/{method}",
+                    params=params,
+                    timeout=request_timeout
+                )
+                response.raise_for_status()
+                return self._api_response(response.json())
+            except Exception as e:
+                logger.error(f"VK API request error: {e}")
                 return None
 
-            return data.get("response")
-        except Exception as e:
-            logger.error(f"VK API request error: {e}")
+    def _request_token(self, use_user_token: bool) -> Optional[str]:
+        """Токен запроса: user для чтения (если доступен), group для публикаций (None - не настроен)."""
+        token = self.user_access_token if (use_user_token and self.user_access_token) else self.group_access_token
+
+        if not token or token.startswith("YOUR_"):
+            logger.error("VK access token not configured")
+            return None
+        return token
+
+    def _api_response(self, data: Dict[str, Any]) -> Optional[Dict]:
+        """Поле response ответа VK API (None - VK вернул ошибку)."""
+        if "error" in data:
+            logger.error(f"VK API error: {data['error']}")
             return None
 
+        return data.get("response")
+
+    def _acquire(self, token: str, method: str, is_user: bool) -> float:
+        """Дождаться лимита частоты и вернуть таймаут запроса в пределах бюджета времени.
+
+        Если бюджет исчерпан, запрос не отправляется (DeadlineExceeded).
+        """
+        timeout(self.request_timeout, f"VK {method}")
+        if not self._limiter(token, is_user).acquire(timeout=remaining()):
+            raise DeadlineExceeded(f"deadline exceeded waiting for VK rate limit ({method})")
+        _count_call(self)
+        return timeout(self.request_timeout, f"VK {method}")
+
+    def _limiter(self, token: str, is_user: bool):
+        """Ограничитель частоты для токена (общий для всех клиентов процесса)."""
+        rate = self.user_token_rps if is_user else self.group_token_rps
+        return shared_limiter(f"vk:{token}", rate)
+
     def _make_post_request(self, method: str, params: Dict[str, Any]) -> Optional[Dict]:
         """Выполнить POST-запрос к VK API с передачей параметров через data (для длинных текстов)."""
         if not self.group_access_token or self.group_access_token.startswith("YOUR_"):
@@ -73,125 +150,193 @@ class VKClient:
         params["access_token"] = self.group_access_token
         params["v"] = self.api_version
 
-        try:
-            response = requests.post(
-                f"{self.api_base}/{method}",
-                data=params,  # Используем data вместо params для длинных текстов
-                timeout=30
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            if "error" in data:
-                logger.error(f"VK API error: {data['error']}")
+        request_timeout = self._acquire(self.group_access_token, method, is_user=False)
+        with span(f"vk.{method}"):
+            try:
+                response = self.session.post(
+                    f"{self.api_base}/{method}",
+                    data=params,  # Используем data вместо params для длинных текстов
+                    timeout=request_timeout
+                )
+                response.raise_for_status()
+                return self._api_response(response.json())
+            except Exception as e:
+                logger.error(f"VK API request error: {e}")
                 return None
 
-            return data.get("response")
-        except Exception as e:
-            logger.error(f"VK API request error: {e}")
-            return None
-
-    def get_new_comments(self, count: int = 20) -> List[Dict[str, Any]]:
-        """Получить новые комментарии к постам группы."""
-        owner_id = f"-{self.group_id}"
-        all_comments = []
+    def get_recent_posts(self, count: int = 10) -> List[Dict[str, Any]]:
+        """Получить последние посты группы с числом комментариев к каждому."""
+        # Для чтения можно использовать user_token, если доступен
+        posts_response = self._make_request("wall.get", self._posts_params(count), use_user_token=True)
+        return self._parse_posts(posts_response)
 
-        # Получить последние посты группы
-        posts_params = {
-            "owner_id": owner_id,
-            "count": 10,  # Получаем последние 10 постов
+    def _posts_params(self, count: int) -> Dict[str, Any]:
+        return {
+            "owner_id": f"-{self.group_id}",
+            "count": count,
             "filter": "owner"  # Только посты от имени группы
         }
 
-        # Для чтения можно использовать user_token, если доступен
-        posts_response = self._make_request("wall.get", posts_params, use_user_token=True)
+    def _parse_posts(self, posts_response: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Посты из ответа wall.get."""
         if not posts_response or "items" not in posts_response:
             logger.warning("Failed to get posts or no posts found")
             return []
 
-        posts = posts_response.get("items", [])
-        logger.info(f"Found {len(posts)} posts to check for comments")
-
-        # Для каждого поста получить комментарии
-        for post in posts:
+        posts = []
+        for post in posts_response.get("items", []):
             post_id = post.get("id")
             if not post_id:
                 continue
+            date = post.get("date")
+            posts.append({
+                "id": str(post_id),
+                "comments_count": post.get("comments", {}).get("count"),  # None - неизвестно
+                "date": datetime.fromtimestamp(date) if date else None
+            })
 
-            # Получить комментарии к посту
-            comments_params = {
-                "owner_id": owner_id,
-                "post_id": post_id,
-                "count": 100,  # Максимум комментариев за запрос
-                "need_likes": 0,
-                "preview_length": 0,
-                "extended": 0,
-                "fields": ""
-            }
+        logger.info(f"Found {len(posts)} recent posts")
+        return posts
 
-            # Для чтения можно использовать user_token, если доступен
-            comments_response = self._make_request("wall.getComments", comments_params, use_user_token=True)
-            if not comments_response or "items" not in comments_response:
-                continue
+    def get_comments_page(
+        self,
+        post_id: str,
+        count: int = 100,
+        offset: int = 0,
+        sort: str = "asc",
+        thread_items_count: int = 0,
+        comment_id: Optional[str] = None,
+        start_comment_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Одна страница wall.getComments как есть (count, items с вложенными thread).
+
+        comment_id - корень ветки, ответы которой нужно получить;
+        thread_items_count - сколько ответов ветки вернуть внутри каждого комментария (до 10).
+        """
+        comments_params = self._comments_params(
+            post_id, count, offset, sort, thread_items_count, comment_id, start_comment_id
+        )
+
+        # Для чтения можно использовать user_token, если доступен
+        comments_response = self._make_request("wall.getComments", comments_params, use_user_token=True)
+        if not comments_response or "items" not in comments_response:
+            return None
+        return comments_response
 
-            comments = comments_response.get("items", [])
-            logger.info(f"Found {len(comments)} comments for post {post_id}")
-
-            # Преобразовать комментарии в нужный формат
-            for comment in comments:
-                comment_id = str(comment.get("id", ""))
-                author_id = str(comment.get("from_id", ""))
-                text = comment.get("text", "")
-
-                # Извлечь вложения (фото, видео)
-                attachments = comment.get("attachments", [])
-                image_url = None
-                video_url = None
-
-                for att in attachments:
-                    att_type = att.get("type", "")
-                    if att_type == "photo":
-                        photo = att.get("photo", {})
-                        # Получить URL самого большого размера
-                        sizes = photo.get("sizes", [])
-                        if sizes:
-                            # Сортировка по размеру (width * height)
-                            largest = max(sizes, key=lambda x: x.get("width", 0) * x.get("height", 0))
-                            image_url = largest.get("url")
-                    elif att_type == "video":
-                        video = att.get("video", {})
-                        # Для видео можно получить превью (может быть в разных форматах)
-                        if video.get("image"):
-                            if isinstance(video.get("image"), list) and len(video["image"]) > 0:
-                                image_url = video["image"][0].get("url")
-                            elif isinstance(video.get("image"), str):
-                                image_url = video.get("image")
-                        # Формируем URL видео
-                        video_owner_id = video.get("owner_id", "")
-                        video_id = video.get("id", "")
-                        if video_owner_id and video_id:
-                            video_url = f"https://vk.com/video{video_owner_id}_{video_id}"
-
-                # Преобразовать дату
-                date = comment.get("date")
-                timestamp = datetime.fromtimestamp(date) if date else datetime.now()
-
-                comment_data = {
-                    "id": comment_id,
-                    "post_id": str(post_id),
-                    "author_id": author_id,
-                    "text": text,
-                    "image_url": image_url,
-                    "video_url": video_url,
-                    "timestamp": timestamp
-                }
-
-                all_comments.append(comment_data)
-
-                # Ограничить общее количество комментариев
-                if len(all_comments) >= count:
-                    break
+    def _comments_params(
+        self,
+        post_id: str,
+        count: int,
+        offset: int,
+        sort: str,
+        thread_items_count: int,
+        comment_id: Optional[str],
+        start_comment_id: Optional[str]
+    ) -> Dict[str, Any]:
+        comments_params = {
+            "owner_id": f"-{self.group_id}",
+            "post_id": post_id,
+            "count": count,  # Максимум комментариев за запрос - 100
+            "offset": offset,
+            "sort": sort,
+            "need_likes": 0,
+            "preview_length": 0,
+            "extended": 0,
+            "fields": ""
+        }
+        if thread_items_count:
+            comments_params["thread_items_count"] = min(10, thread_items_count)
+        if comment_id:
+            comments_params["comment_id"] = comment_id
+        if start_comment_id:
+            comments_params["start_comment_id"] = start_comment_id
+        return comments_params
+
+    def get_post_comments(self, post_id: str, count: int = 100) -> Optional[List[Dict[str, Any]]]:
+        """Получить комментарии верхнего уровня к посту в формате бота (None, если запрос не удался)."""
+        comments_response = self.get_comments_page(post_id, count=count)
+        return self._parse_comments(comments_response, post_id)
+
+    def _parse_comments(
+        self,
+        comments_response: Optional[Dict[str, Any]],
+        post_id: str
+    ) -> Optional[List[Dict[str, Any]]]:
+        if not comments_response:
+            return None
+
+        comments = comments_response.get("items", [])
+        logger.info(f"Found {len(comments)} comments for post {post_id}")
+        return [self.parse_comment(comment, post_id) for comment in comments]
 
+    def parse_comment(
+        self,
+        comment: Dict[str, Any],
+        post_id: str,
+        thread_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Преобразовать комментарий VK в формат бота (thread_id - корень ветки для ответа)."""
+        comment_id = str(comment.get("id", ""))
+        author_id = str(comment.get("from_id", ""))
+        text = comment.get("text", "")
+
+        # Извлечь вложения (фото, видео)
+        attachments = comment.get("attachments", [])
+        image_url = None
+        video_url = None
+
+        for att in attachments:
+            att_type = att.get("type", "")
+            if att_type == "photo":
+                photo = att.get("photo", {})
+                # Получить URL самого большого размера
+                sizes = photo.get("sizes", [])
+                if sizes:
+                    # Сортировка по размеру (width * height)
+                    largest = max(sizes, key=lambda x: x.get("width", 0) * x.get("height", 0))
+                    image_url = largest.get("url")
+            elif att_type == "video":
+                video = att.get("video", {})
+                # Для видео можно получить превью (может быть в разных форматах)
+                if video.get("image"):
+                    if isinstance(video.get("image"), list) and len(video["image"]) > 0:
+                        image_url = video["image"][0].get("url")
+                    elif isinstance(video.get("image"), str):
+                        image_url = video.get("image")
+                # Формируем URL видео
+                video_owner_id = video.get("owner_id", "")
+                video_id = video.get("id", "")
+                if video_owner_id and video_id:
+                    video_url = f"https://vk.com/video{video_owner_id}_{video_id}"
+
+        # Преобразовать дату
+        date = comment.get("date")
+        timestamp = datetime.fromtimestamp(date) if date else datetime.now()
+
+        return {
+            "id": comment_id,
+            "post_id": str(post_id),
+            "author_id": author_id,
+            "text": text,
+            "image_url": image_url,
+            "video_url": video_url,
+            "timestamp": timestamp,
+            "thread_id": str(thread_id) if thread_id else None
+        }
+
+    def get_new_comments(self, count: int = 20, post_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Получить новые комментарии к постам группы.
+
+        post_ids - какие посты опрашивать; по умолчанию последние 10 постов стены.
+        """
+        if post_ids is None:
+            post_ids = [post["id"] for post in self.get_recent_posts(count=10)]
+            logger.info(f"Found {len(post_ids)} posts to check for comments")
+
+        all_comments = []
+        for post_id in post_ids:
+            all_comments.extend(self.get_post_comments(post_id) or [])
+            # Ограничить общее количество комментариев
             if len(all_comments) >= count:
                 break
 
@@ -286,30 +431,10 @@ class VKClient:
 
     def post_message(self, message: str, attachments: Optional[List[str]] = None) -> Optional[int]:
         """Опубликовать пост на стене группы (с поддержкой длинных текстов)."""
-        # Разбиваем текст на части если он слишком длинный
-        parts = self.split_manifest(message)
-
-        if len(parts) > 1:
-            logger.info(f"Splitting message into {len(parts)} parts")
-
+        parts = self._post_parts(message, attachments)
         first_post_id = None
 
-        for i, part in enumerate(parts):
-            # Добавляем пометку о части, если частей больше одной
-            if len(parts) > 1:
-                part_text = f"[Манифест. Часть {i+1}/{len(parts)}]\n\n{part}"
-            else:
-                part_text = part
-
-            params = {
-                "owner_id": f"-{self.group_id}",
-                "message": part_text,
-                "from_group": 1  # Публикация от имени сообщества
-            }
-
-            if attachments and i == 0:  # Вложения только к первой части
-                params["attachments"] = ",".join(attachments)
-
+        for i, params in enumerate(parts):
             # Используем POST с data для избежания ошибки 414
             logger.info("Replying as community")
             result = self._make_post_request("wall.post", params)
@@ -330,6 +455,33 @@ class VKClient:
 
         return first_post_id
 
+    def _post_parts(self, message: str, attachments: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """Параметры wall.post для каждой части поста."""
+        # Разбиваем текст на части если он слишком длинный
+        parts = self.split_manifest(message)
+
+        if len(parts) > 1:
+            logger.info(f"Splitting message into {len(parts)} parts")
+
+        params_list = []
+        for i, part in enumerate(parts):
+            # Добавляем пометку о части, если частей больше одной
+            if len(parts) > 1:
+                part_text = f"[Манифест. Часть {i+1}/{len(parts)}]\n\n{part}"
+            else:
+                part_text = part
+
+            params = {
+                "owner_id": f"-{self.group_id}",
+                "message": part_text,
+                "from_group": 1  # Публикация от имени сообщества
+            }
+
+            if attachments and i == 0:  # Вложения только к первой части
+                params["attachments"] = ",".join(attachments)
+            params_list.append(params)
+        return params_list
+
     def reply_to_comment(
         self,
         post_id: int,
@@ -337,17 +489,17 @@ class VKClient:
         message: str
     ) -> Optional[int]:
         """Ответить на комментарий от имени сообщества."""
-        params = {
+        logger.info("Replying as community")
+        result = self._make_post_request("wall.createComment", self._reply_params(post_id, comment_id, message))
+        if result and "comment_id" in result:
+            return result["comment_id"]
+        return None
+
+    def _reply_params(self, post_id: int, comment_id: int, message: str) -> Dict[str, Any]:
+        return {
             "owner_id": f"-{self.group_id}",
             "post_id": post_id,
             "reply_to_comment": comment_id,
             "message": message,
             "from_group": 1  # Ответ от имени сообщества
         }
-
-        logger.info("Replying as community")
-        result = self._make_post_request("wall.createComment", params)
-        if result and "comment_id" in result:
-            return result["comment_id"]
-        return None
-
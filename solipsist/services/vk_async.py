@@ -0,0 +1,163 @@
+"""Асинхронный клиент VK API (asyncio, aiohttp).
+
+Те же методы, что у VKClient, но корутины. Разбор ответов, разбиение длинных
+постов и лимиты частоты на токен - общие с синхронным клиентом.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from ..utils.aio import shared_client_session
+from ..utils.deadline import DeadlineExceeded, remaining, timeout
+from ..utils.tracing import span
+from .vk import VKClient, _count_call
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(params: Dict[str, Any]) -> Dict[str, str]:
+    """Параметры запроса строками (aiohttp не принимает числа в форме)."""
+    return {key: str(value) for key, value in params.items()}
+
+
+class AsyncVKClient(VKClient):
+    """Клиент VK API на asyncio: методы запросов - корутины."""
+
+    async def _make_request(self, method: str, params: Dict[str, Any], use_user_token: bool = False) -> Optional[Dict]:
+        """Выполнить запрос к VK API."""
+        token = self._request_token(use_user_token)
+        if token is None:
+            return None
+
+        params["access_token"] = token
+        params["v"] = self.api_version
+
+        request_timeout = await self._acquire(token, method, is_user=token == self.user_access_token)
+        return await self._post(method, request_timeout, params=_encode(params))
+
+    async def _make_post_request(self, method: str, params: Dict[str, Any]) -> Optional[Dict]:
+        """Выполнить POST-запрос к VK API с передачей параметров через data (для длинных текстов)."""
+        if not self.group_access_token or self.group_access_token.startswith("YOUR_"):
+            logger.error("VK group access token not configured")
+            return None
+
+        params["access_token"] = self.group_access_token
+        params["v"] = self.api_version
+
+        request_timeout = await self._acquire(self.group_access_token, method, is_user=False)
+        return await self._post(method, request_timeout, data=_encode(params))
+
+    async def _post(self, method: str, request_timeout: float, **kwargs) -> Optional[Dict]:
+        """Отправить запрос (params - в строке запроса, data - в теле)."""
+        # Сессия aiohttp общая для клиентов процесса и создаётся в цикле событий при первом запросе
+        session = shared_client_session("vk", pool_size=self.pool_size)
+        with span(f"vk.{method}"):
+            try:
+                async with session.post(
+                    f"{self.api_base}/{method}",
+                    timeout=aiohttp.ClientTimeout(total=request_timeout),
+                    **kwargs
+                ) as response:
+                    response.raise_for_status()
+                    return self._api_response(await response.json(content_type=None))
+            except Exception as e:
+                # У таймаута aiohttp пустой текст - выводим тип
+                logger.error(f"VK API request error: {str(e) or type(e).__name__}")
+                return None
+
+    async def _acquire(self, token: str, method: str, is_user: bool) -> float:
+        """Дождаться лимита частоты и вернуть таймаут запроса (см. VKClient._acquire)."""
+        timeout(self.request_timeout, f"VK {method}")
+        if not await self._limiter(token, is_user).acquire_async(timeout=remaining()):
+            raise DeadlineExceeded(f"deadline exceeded waiting for VK rate limit ({method})")
+        _count_call(self)
+        return timeout(self.request_timeout, f"VK {method}")
+
+    async def get_recent_posts(self, count: int = 10) -> List[Dict[str, Any]]:
+        """Получить последние посты группы с числом комментариев к каждому."""
+        # Для чтения можно использовать user_token, если доступен
+        posts_response = await self._make_request("wall.get", self._posts_params(count), use_user_token=True)
+        return self._parse_posts(posts_response)
+
+    async def get_comments_page(
+        self,
+        post_id: str,
+        count: int = 100,
+        offset: int = 0,
+        sort: str = "asc",
+        thread_items_count: int = 0,
+        comment_id: Optional[str] = None,
+        start_comment_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Одна страница wall.getComments как есть (см. VKClient.get_comments_page)."""
+        comments_params = self._comments_params(
+            post_id, count, offset, sort, thread_items_count, comment_id, start_comment_id
+        )
+
+        # Для чтения можно использовать user_token, если доступен
+        comments_response = await self._make_request("wall.getComments", comments_params, use_user_token=True)
+        if not comments_response or "items" not in comments_response:
+            return None
+        return comments_response
+
+    async def get_post_comments(self, post_id: str, count: int = 100) -> Optional[List[Dict[str, Any]]]:
+        """Получить комментарии верхнего уровня к посту в формате бота (None, если запрос не удался)."""
+        comments_response = await self.get_comments_page(post_id, count=count)
+        return self._parse_comments(comments_response, post_id)
+
+    async def get_new_comments(self, count: int = 20, post_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Получить новые комментарии к постам группы (см. VKClient.get_new_comments)."""
+        if post_ids is None:
+            post_ids = [post["id"] for post in await self.get_recent_posts(count=10)]
+            logger.info(f"Found {len(post_ids)} posts to check for comments")
+
+        all_comments = []
+        for post_id in post_ids:
+            all_comments.extend(await self.get_post_comments(post_id) or [])
+            # Ограничить общее количество комментариев
+            if len(all_comments) >= count:
+                break
+
+        logger.info(f"Total comments retrieved: {len(all_comments)}")
+        return all_comments[:count]
+
+    async def post_message(self, message: str, attachments: Optional[List[str]] = None) -> Optional[int]:
+        """Опубликовать пост на стене группы (с поддержкой длинных текстов)."""
+        parts = self._post_parts(message, attachments)
+        first_post_id = None
+
+        for i, params in enumerate(parts):
+            # Используем POST с data для избежания ошибки 414
+            logger.info("Replying as community")
+            result = await self._make_post_request("wall.post", params)
+
+            if result and "post_id" in result:
+                post_id = result["post_id"]
+                if first_post_id is None:
+                    first_post_id = post_id
+
+                logger.info(f"Published part {i+1}/{len(parts)} as post {post_id}")
+
+                # Пауза между публикациями (кроме последней)
+                if i < len(parts) - 1:
+                    await asyncio.sleep(1.5)
+            else:
+                logger.error(f"Failed to publish part {i+1}/{len(parts)}")
+                return None
+
+        return first_post_id
+
+    async def reply_to_comment(
+        self,
+        post_id: int,
+        comment_id: int,
+        message: str
+    ) -> Optional[int]:
+        """Ответить на комментарий от имени сообщества."""
+        logger.info("Replying as community")
+        result = await self._make_post_request("wall.createComment", self._reply_params(post_id, comment_id, message))
+        if result and "comment_id" in result:
+            return result["comment_id"]
+        return None
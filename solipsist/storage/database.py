@@ -1,11 +1,13 @@
 """Работа с базой данных SQLite."""
 import sqlite3
 import json
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any, Iterator
 
-from .models import SolipsistState, Comment, Monologue, Manifest
+from .models import SolipsistState, StateDelta, Comment, CommentProgress, Monologue, Digest, Manifest, PostActivity
+from ..utils.tracing import traced
 
 
 class Database:
@@ -22,6 +24,9 @@ class Database:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
+        # WAL: читатели не блокируют писателя, БД могут делить несколько процессов
+        cursor.execute("PRAGMA journal_mode=WAL")
+
         # Таблица состояний
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS states (
@@ -33,6 +38,30 @@ class Database:
             )
         """)
 
+        # Контрольная точка текущего состояния (одна строка)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS state_checkpoint (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                certainty_level REAL NOT NULL,
+                intrusion_level REAL NOT NULL,
+                self_coherence REAL NOT NULL,
+                timestamp TEXT NOT NULL,
+                updates INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+        # Журнал изменений состояния (только приращения, для аудита)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS state_deltas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event TEXT NOT NULL,
+                d_certainty REAL NOT NULL,
+                d_intrusion REAL NOT NULL,
+                d_coherence REAL NOT NULL,
+                timestamp TEXT NOT NULL
+            )
+        """)
+
         # Таблица комментариев
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS comments (
@@ -50,12 +79,54 @@ class Database:
             )
         """)
 
+        # Контрольные точки обработки комментариев: результаты этапов пайплайна.
+        # perception - JSON, доступен в запросах через json_extract
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS comment_progress (
+                comment_id TEXT PRIMARY KEY,
+                post_id TEXT NOT NULL,
+                stage TEXT,
+                perception TEXT,
+                classified_as TEXT,
+                intrusion_score REAL,
+                response_text TEXT,
+                reply_id TEXT,
+                deadline_misses INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._ensure_column(cursor, "comment_progress", "deadline_misses", "INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_comment_progress_stage
+            ON comment_progress (stage)
+        """)
+
         # Таблица монологов
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS monologues (
                 monologue_id TEXT PRIMARY KEY,
                 thoughts TEXT NOT NULL,
-                timestamp TEXT NOT NULL
+                timestamp TEXT NOT NULL,
+                digested INTEGER NOT NULL DEFAULT 0,
+                consumed INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._ensure_column(cursor, "monologues", "digested", "INTEGER NOT NULL DEFAULT 0")
+        if self._ensure_column(cursor, "monologues", "consumed", "INTEGER NOT NULL DEFAULT 0"):
+            # Прежние версии брали в манифест 5 последних монологов - более старые уже использованы
+            cursor.execute("""
+                UPDATE monologues SET consumed = 1
+                WHERE monologue_id NOT IN (SELECT monologue_id FROM monologues ORDER BY timestamp DESC LIMIT 5)
+            """)
+
+        # Дайджест монологов, ещё не использованных в манифесте (одна строка)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS monologue_digest (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                content TEXT NOT NULL,
+                monologue_ids TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at TEXT NOT NULL
             )
         """)
 
@@ -66,13 +137,89 @@ class Database:
                 content TEXT NOT NULL,
                 published INTEGER DEFAULT 0,
                 published_at TEXT,
-                timestamp TEXT NOT NULL
+                timestamp TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'ready'
+            )
+        """)
+        if self._ensure_column(cursor, "manifests", "status", "TEXT NOT NULL DEFAULT 'ready'"):
+            cursor.execute("UPDATE manifests SET status = 'published' WHERE published = 1")
+
+        # Время последнего запуска задач планировщика
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                name TEXT PRIMARY KEY,
+                last_run TEXT NOT NULL
+            )
+        """)
+
+        # Активность постов: по ней выбираются посты для опроса комментариев
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS post_activity (
+                post_id TEXT PRIMARY KEY,
+                tier TEXT NOT NULL,
+                comments_count INTEGER NOT NULL DEFAULT 0,
+                rate REAL NOT NULL DEFAULT 0,
+                posted_at TEXT,
+                last_activity TEXT,
+                last_polled TEXT
+            )
+        """)
+
+        # Курсоры веток комментариев: сколько ответов видели и последний из них.
+        # thread_id = '0' - верхний уровень поста
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS comment_threads (
+                post_id TEXT NOT NULL,
+                thread_id TEXT NOT NULL,
+                seen_count INTEGER NOT NULL,
+                last_comment_id TEXT,
+                PRIMARY KEY (post_id, thread_id)
+            )
+        """)
+
+        # Аренды: у задачи или роли не больше одного владельца-процесса.
+        # fence растёт при каждой смене владельца
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                acquired_at REAL NOT NULL,
+                heartbeat_at REAL NOT NULL,
+                fence INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+
+        # Очередь комментариев на обработку для нескольких процессов-обработчиков
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS comment_queue (
+                comment_id TEXT PRIMARY KEY,
+                post_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL
             )
         """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_comment_queue_status
+            ON comment_queue (status, enqueued_at)
+        """)
 
         conn.commit()
         conn.close()
 
+    def _ensure_column(self, cursor, table: str, column: str, definition: str) -> bool:
+        """Добавить столбец в таблицу, созданную прежней версией схемы (True - столбец добавлен)."""
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if column in columns:
+            return False
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+
+    @traced("db.save_state")
     def save_state(self, state: SolipsistState):
         """Сохранить состояние."""
         conn = sqlite3.connect(self.db_path)
@@ -96,10 +243,11 @@ class Database:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
+        # Строки добавляются по порядку, поэтому последняя - с максимальным id
         cursor.execute("""
             SELECT certainty_level, intrusion_level, self_coherence, timestamp
             FROM states
-            ORDER BY timestamp DESC
+            ORDER BY id DESC
             LIMIT 1
         """)
 
@@ -115,6 +263,153 @@ class Database:
             )
         return None
 
+    @traced("db.save_state_checkpoint")
+    def save_state_checkpoint(self, state: SolipsistState, deltas: List[StateDelta], updates: int):
+        """Записать контрольную точку состояния и накопленные изменения одной транзакцией."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT OR REPLACE INTO state_checkpoint
+            (id, certainty_level, intrusion_level, self_coherence, timestamp, updates)
+            VALUES (1, ?, ?, ?, ?, ?)
+        """, (
+            state.certainty_level,
+            state.intrusion_level,
+            state.self_coherence,
+            state.timestamp.isoformat(),
+            updates
+        ))
+
+        if deltas:
+            cursor.executemany("""
+                INSERT INTO state_deltas (event, d_certainty, d_intrusion, d_coherence, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            """, [
+                (
+                    d.event,
+                    round(d.d_certainty, 6),
+                    round(d.d_intrusion, 6),
+                    round(d.d_coherence, 6),
+                    d.timestamp.isoformat()
+                )
+                for d in deltas
+            ])
+
+        conn.commit()
+        conn.close()
+
+    def get_state_checkpoint(self) -> Optional[tuple]:
+        """Получить контрольную точку: (состояние, число применённых обновлений)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT certainty_level, intrusion_level, self_coherence, timestamp, updates
+            FROM state_checkpoint
+            WHERE id = 1
+        """)
+
+        row = cursor.fetchone()
+        conn.close()
+
+        if row:
+            state = SolipsistState(
+                certainty_level=row[0],
+                intrusion_level=row[1],
+                self_coherence=row[2],
+                timestamp=datetime.fromisoformat(row[3])
+            )
+            return state, row[4]
+        return None
+
+    def apply_state_transition(
+        self,
+        event: str,
+        transition: Callable[[SolipsistState], SolipsistState]
+    ) -> SolipsistState:
+        """Применить переход к состоянию из БД одной транзакцией.
+
+        Для нескольких процессов: чтение, переход и запись под блокировкой записи БД,
+        поэтому обновления разных процессов не теряются.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""
+                SELECT certainty_level, intrusion_level, self_coherence, timestamp, updates
+                FROM state_checkpoint
+                WHERE id = 1
+            """).fetchone()
+            if row is None:
+                raise RuntimeError("State checkpoint is missing")
+
+            old_state = SolipsistState(
+                certainty_level=row[0],
+                intrusion_level=row[1],
+                self_coherence=row[2],
+                timestamp=datetime.fromisoformat(row[3])
+            )
+            new_state = transition(old_state)
+            delta = StateDelta.between(event, old_state, new_state)
+
+            conn.execute("""
+                UPDATE state_checkpoint
+                SET certainty_level = ?, intrusion_level = ?, self_coherence = ?, timestamp = ?, updates = ?
+                WHERE id = 1
+            """, (
+                new_state.certainty_level,
+                new_state.intrusion_level,
+                new_state.self_coherence,
+                new_state.timestamp.isoformat(),
+                row[4] + 1
+            ))
+            conn.execute("""
+                INSERT INTO state_deltas (event, d_certainty, d_intrusion, d_coherence, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            """, (
+                delta.event,
+                round(delta.d_certainty, 6),
+                round(delta.d_intrusion, 6),
+                round(delta.d_coherence, 6),
+                delta.timestamp.isoformat()
+            ))
+            conn.execute("COMMIT")
+            return new_state
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get_state_deltas(self, limit: int = 100) -> List[StateDelta]:
+        """Получить последние изменения состояния (новые первыми)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT event, d_certainty, d_intrusion, d_coherence, timestamp
+            FROM state_deltas
+            ORDER BY id DESC
+            LIMIT ?
+        """, (limit,))
+
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [
+            StateDelta(
+                event=row[0],
+                d_certainty=row[1],
+                d_intrusion=row[2],
+                d_coherence=row[3],
+                timestamp=datetime.fromisoformat(row[4])
+            )
+            for row in rows
+        ]
+
+    @traced("db.save_comment")
     def save_comment(self, comment: Comment):
         """Сохранить комментарий."""
         conn = sqlite3.connect(self.db_path)
@@ -142,6 +437,89 @@ class Database:
         conn.commit()
         conn.close()
 
+    @traced("db.save_comment_progress")
+    def save_comment_progress(self, progress: CommentProgress):
+        """Записать контрольную точку обработки комментария."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT OR REPLACE INTO comment_progress
+            (comment_id, post_id, stage, perception, classified_as, intrusion_score,
+             response_text, reply_id, deadline_misses, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            progress.comment_id,
+            progress.post_id,
+            progress.stage,
+            json.dumps(progress.perception, ensure_ascii=False, default=str) if progress.perception is not None else None,
+            progress.classified_as,
+            progress.intrusion_score,
+            progress.response_text,
+            progress.reply_id,
+            progress.deadline_misses,
+            (progress.updated_at or datetime.now()).isoformat()
+        ))
+
+        conn.commit()
+        conn.close()
+
+    def get_comment_progress(self, comment_id: str) -> Optional[CommentProgress]:
+        """Получить контрольную точку обработки комментария."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT comment_id, post_id, stage, perception, classified_as, intrusion_score,
+                   response_text, reply_id, deadline_misses, updated_at
+            FROM comment_progress
+            WHERE comment_id = ?
+        """, (comment_id,))
+
+        row = cursor.fetchone()
+        conn.close()
+
+        return self._row_to_progress(row) if row else None
+
+    def get_incomplete_comments(self, limit: int = 100) -> List[CommentProgress]:
+        """Комментарии, обработка которых прервалась (старые первыми)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT comment_id, post_id, stage, perception, classified_as, intrusion_score,
+                   response_text, reply_id, deadline_misses, updated_at
+            FROM comment_progress
+            WHERE stage IS NULL OR stage != 'done'
+            ORDER BY updated_at
+            LIMIT ?
+        """, (limit,))
+
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [self._row_to_progress(row) for row in rows]
+
+    def get_comment_perception(self, comment_id: str) -> Optional[Dict[str, Any]]:
+        """Результат восприятия комментария (text, image, video)."""
+        progress = self.get_comment_progress(comment_id)
+        return progress.perception if progress else None
+
+    @staticmethod
+    def _row_to_progress(row) -> CommentProgress:
+        return CommentProgress(
+            comment_id=row[0],
+            post_id=row[1],
+            stage=row[2],
+            perception=json.loads(row[3]) if row[3] else None,
+            classified_as=row[4],
+            intrusion_score=row[5],
+            response_text=row[6],
+            reply_id=row[7],
+            deadline_misses=row[8] or 0,
+            updated_at=datetime.fromisoformat(row[9]) if row[9] else None
+        )
+
     def get_comment(self, comment_id: str) -> Optional[Comment]:
         """Получить комментарий по ID."""
         conn = sqlite3.connect(self.db_path)
@@ -173,18 +551,59 @@ class Database:
             )
         return None
 
+    def iter_comments(self, since: Optional[datetime] = None, limit: Optional[int] = None) -> Iterator[Comment]:
+        """Потоково перебрать комментарии в порядке времени."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        query = """
+            SELECT comment_id, post_id, author_id, text, image_url, video_url,
+                   timestamp, classified_as, intrusion_score, responded, response_text
+            FROM comments
+        """
+        params: list = []
+        if since is not None:
+            query += " WHERE timestamp >= ?"
+            params.append(since.isoformat())
+        query += " ORDER BY timestamp ASC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        try:
+            cursor.execute(query, params)
+            for row in cursor:
+                yield Comment(
+                    comment_id=row[0],
+                    post_id=row[1],
+                    author_id=row[2],
+                    text=row[3],
+                    image_url=row[4],
+                    video_url=row[5],
+                    timestamp=datetime.fromisoformat(row[6]) if row[6] else None,
+                    classified_as=row[7],
+                    intrusion_score=row[8],
+                    responded=bool(row[9]),
+                    response_text=row[10]
+                )
+        finally:
+            conn.close()
+
+    @traced("db.save_monologue")
     def save_monologue(self, monologue: Monologue):
         """Сохранить монолог."""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute("""
-            INSERT OR REPLACE INTO monologues (monologue_id, thoughts, timestamp)
-            VALUES (?, ?, ?)
+            INSERT OR REPLACE INTO monologues (monologue_id, thoughts, timestamp, digested, consumed)
+            VALUES (?, ?, ?, ?, ?)
         """, (
             monologue.monologue_id,
             json.dumps(monologue.thoughts),
-            monologue.timestamp.isoformat()
+            monologue.timestamp.isoformat(),
+            1 if monologue.digested else 0,
+            1 if monologue.consumed else 0
         ))
 
         conn.commit()
@@ -196,7 +615,7 @@ class Database:
         cursor = conn.cursor()
 
         cursor.execute("""
-            SELECT monologue_id, thoughts, timestamp
+            SELECT monologue_id, thoughts, timestamp, digested, consumed
             FROM monologues
             ORDER BY timestamp DESC
             LIMIT ?
@@ -205,15 +624,125 @@ class Database:
         rows = cursor.fetchall()
         conn.close()
 
-        monologues = []
-        for row in rows:
-            monologues.append(Monologue(
-                monologue_id=row[0],
-                thoughts=json.loads(row[1]),
-                timestamp=datetime.fromisoformat(row[2])
-            ))
-        return monologues
+        return [self._row_to_monologue(row) for row in rows]
+
+    def get_unconsumed_monologues(self, digested: bool, limit: int, newest_first: bool = False) -> List[Monologue]:
+        """Монологи, ещё не использованные в манифесте: свёрнутые в дайджест или нет."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute(f"""
+            SELECT monologue_id, thoughts, timestamp, digested, consumed
+            FROM monologues
+            WHERE consumed = 0 AND digested = ?
+            ORDER BY timestamp {"DESC" if newest_first else "ASC"}
+            LIMIT ?
+        """, (1 if digested else 0, limit))
 
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [self._row_to_monologue(row) for row in rows]
+
+    def _row_to_monologue(self, row) -> Monologue:
+        return Monologue(
+            monologue_id=row[0],
+            thoughts=json.loads(row[1]),
+            timestamp=datetime.fromisoformat(row[2]),
+            digested=bool(row[3]),
+            consumed=bool(row[4])
+        )
+
+    def get_digest(self) -> Digest:
+        """Текущий дайджест монологов (пустой, если его ещё нет)."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT content, monologue_ids, version, updated_at FROM monologue_digest WHERE id = 1")
+
+        row = cursor.fetchone()
+        conn.close()
+
+        if row is None:
+            return Digest()
+        return Digest(
+            content=row[0],
+            monologue_ids=json.loads(row[1]),
+            version=row[2],
+            updated_at=datetime.fromisoformat(row[3])
+        )
+
+    @traced("db.save_digest")
+    def save_digest(self, content: str, monologue_ids: List[str], expected_version: int) -> bool:
+        """Записать дайджест, если с чтения версии expected_version его никто не изменил.
+
+        Монологи monologue_ids отмечаются свёрнутыми в той же транзакции.
+        False - дайджест успел измениться, запись не выполнена.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT version FROM monologue_digest WHERE id = 1").fetchone()
+            version = row[0] if row else 0
+            if version != expected_version:
+                conn.execute("ROLLBACK")
+                return False
+
+            conn.execute("""
+                INSERT OR REPLACE INTO monologue_digest (id, content, monologue_ids, version, updated_at)
+                VALUES (1, ?, ?, ?, ?)
+            """, (content, json.dumps(monologue_ids), version + 1, datetime.now().isoformat()))
+            conn.executemany(
+                "UPDATE monologues SET digested = 1 WHERE monologue_id = ?",
+                [(monologue_id,) for monologue_id in monologue_ids]
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @traced("db.consume_monologues")
+    def consume_monologues(self, monologue_ids: List[str]):
+        """Отметить монологи использованными в манифесте.
+
+        Если дайджест покрывает хоть один из них, он очищается: его текст уже попал
+        в манифест. Свёртка могла успеть добавить в дайджест новый материал (пока
+        генерировался манифест) - такие монологи снова отмечаются несвёрнутыми
+        и попадут в следующий дайджест из исходного текста.
+        """
+        consumed = set(monologue_ids)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE monologues SET consumed = 1 WHERE monologue_id = ?",
+                [(monologue_id,) for monologue_id in monologue_ids]
+            )
+            row = conn.execute("SELECT monologue_ids FROM monologue_digest WHERE id = 1").fetchone()
+            digested = json.loads(row[0]) if row else []
+            if consumed.intersection(digested):
+                conn.execute("""
+                    UPDATE monologue_digest
+                    SET content = '', monologue_ids = '[]', version = version + 1, updated_at = ?
+                    WHERE id = 1
+                """, (datetime.now().isoformat(),))
+                conn.executemany(
+                    "UPDATE monologues SET digested = 0 WHERE monologue_id = ?",
+                    [(monologue_id,) for monologue_id in digested if monologue_id not in consumed]
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @traced("db.save_manifest")
     def save_manifest(self, manifest: Manifest):
         """Сохранить манифест."""
         conn = sqlite3.connect(self.db_path)
@@ -221,28 +750,29 @@ class Database:
 
         cursor.execute("""
             INSERT OR REPLACE INTO manifests
-            (manifest_id, content, published, published_at, timestamp)
-            VALUES (?, ?, ?, ?, ?)
+            (manifest_id, content, published, published_at, timestamp, status)
+            VALUES (?, ?, ?, ?, ?, ?)
         """, (
             manifest.manifest_id,
             manifest.content,
             1 if manifest.published else 0,
             manifest.published_at.isoformat() if manifest.published_at else None,
-            manifest.timestamp.isoformat()
+            manifest.timestamp.isoformat(),
+            manifest.status
         ))
 
         conn.commit()
         conn.close()
 
     def get_unpublished_manifests(self) -> List[Manifest]:
-        """Получить неопубликованные манифесты."""
+        """Получить готовые к публикации манифесты (старые первыми)."""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute("""
-            SELECT manifest_id, content, published, published_at, timestamp
+            SELECT manifest_id, content, published, published_at, timestamp, status
             FROM manifests
-            WHERE published = 0
+            WHERE published = 0 AND status = 'ready'
             ORDER BY timestamp ASC
         """)
 
@@ -256,7 +786,337 @@ class Database:
                 content=row[1],
                 published=bool(row[2]),
                 published_at=datetime.fromisoformat(row[3]) if row[3] else None,
-                timestamp=datetime.fromisoformat(row[4])
+                timestamp=datetime.fromisoformat(row[4]),
+                status=row[5]
             ))
         return manifests
 
+    @traced("db.expire_manifests")
+    def expire_manifests(self, manifest_ids: List[str]):
+        """Снять манифесты с публикации (устаревшие или лишние черновики)."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.executemany("""
+            UPDATE manifests SET status = 'expired' WHERE manifest_id = ? AND published = 0
+        """, [(manifest_id,) for manifest_id in manifest_ids])
+
+        conn.commit()
+        conn.close()
+
+    def get_job_last_run(self, name: str) -> Optional[datetime]:
+        """Получить время последнего запуска задачи планировщика."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT last_run FROM scheduled_jobs WHERE name = ?", (name,))
+
+        row = cursor.fetchone()
+        conn.close()
+
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def set_job_last_run(self, name: str, last_run: datetime):
+        """Записать время последнего запуска задачи планировщика."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT OR REPLACE INTO scheduled_jobs (name, last_run)
+            VALUES (?, ?)
+        """, (name, last_run.isoformat()))
+
+        conn.commit()
+        conn.close()
+
+    def save_post_activity(self, activity: PostActivity):
+        """Сохранить статистику активности поста."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT OR REPLACE INTO post_activity
+            (post_id, tier, comments_count, rate, posted_at, last_activity, last_polled)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            activity.post_id,
+            activity.tier,
+            activity.comments_count,
+            activity.rate,
+            activity.posted_at.isoformat() if activity.posted_at else None,
+            activity.last_activity.isoformat() if activity.last_activity else None,
+            activity.last_polled.isoformat() if activity.last_polled else None
+        ))
+
+        conn.commit()
+        conn.close()
+
+    def get_post_activities(self) -> List[PostActivity]:
+        """Получить статистику активности всех отслеживаемых постов."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT post_id, tier, comments_count, rate, posted_at, last_activity, last_polled
+            FROM post_activity
+        """)
+
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [
+            PostActivity(
+                post_id=row[0],
+                tier=row[1],
+                comments_count=row[2],
+                rate=row[3],
+                posted_at=datetime.fromisoformat(row[4]) if row[4] else None,
+                last_activity=datetime.fromisoformat(row[5]) if row[5] else None,
+                last_polled=datetime.fromisoformat(row[6]) if row[6] else None
+            )
+            for row in rows
+        ]
+
+    def get_thread_cursors(self, post_id: str) -> Dict[str, tuple]:
+        """Получить курсоры веток поста: thread_id -> (seen_count, last_comment_id)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT thread_id, seen_count, last_comment_id
+            FROM comment_threads
+            WHERE post_id = ?
+        """, (post_id,))
+
+        rows = cursor.fetchall()
+        conn.close()
+
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def save_thread_cursors(self, post_id: str, cursors: Dict[str, tuple]):
+        """Сохранить курсоры веток поста одной транзакцией."""
+        if not cursors:
+            return
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.executemany("""
+            INSERT OR REPLACE INTO comment_threads (post_id, thread_id, seen_count, last_comment_id)
+            VALUES (?, ?, ?, ?)
+        """, [
+            (post_id, thread_id, seen_count, last_comment_id)
+            for thread_id, (seen_count, last_comment_id) in cursors.items()
+        ])
+
+        conn.commit()
+        conn.close()
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> Optional[int]:
+        """Взять или продлить аренду name на ttl секунд.
+
+        Возвращает fence (номер владения) или None, если аренда у другого живого владельца.
+        """
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT owner, expires_at, fence FROM leases WHERE name = ?", (name,)
+            ).fetchone()
+
+            if row is None:
+                conn.execute("""
+                    INSERT INTO leases (name, owner, expires_at, acquired_at, heartbeat_at, fence)
+                    VALUES (?, ?, ?, ?, ?, 1)
+                """, (name, owner, now + ttl, now, now))
+                fence = 1
+            elif row[0] == owner:
+                conn.execute("""
+                    UPDATE leases SET expires_at = ?, heartbeat_at = ? WHERE name = ?
+                """, (now + ttl, now, name))
+                fence = row[2]
+            elif row[1] <= now:
+                # Владелец не продлил аренду (упал или завис) - забираем
+                conn.execute("""
+                    UPDATE leases
+                    SET owner = ?, expires_at = ?, acquired_at = ?, heartbeat_at = ?, fence = fence + 1
+                    WHERE name = ?
+                """, (owner, now + ttl, now, now, name))
+                fence = row[2] + 1
+            else:
+                fence = None
+
+            conn.execute("COMMIT")
+            return fence
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def renew_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Продлить свою аренду (heartbeat); False - аренда потеряна."""
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            UPDATE leases SET expires_at = ?, heartbeat_at = ?
+            WHERE name = ? AND owner = ?
+        """, (now + ttl, now, name, owner))
+        renewed = cursor.rowcount > 0
+
+        conn.commit()
+        conn.close()
+        return renewed
+
+    def release_lease(self, name: str, owner: str):
+        """Освободить свою аренду."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            UPDATE leases SET expires_at = 0 WHERE name = ? AND owner = ?
+        """, (name, owner))
+
+        conn.commit()
+        conn.close()
+
+    def get_leases(self) -> List[Dict[str, Any]]:
+        """Текущие аренды (для диагностики)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT name, owner, expires_at, acquired_at, heartbeat_at, fence
+            FROM leases
+            ORDER BY name
+        """)
+
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [
+            {
+                "name": row[0],
+                "owner": row[1],
+                "expires_at": row[2],
+                "acquired_at": row[3],
+                "heartbeat_at": row[4],
+                "fence": row[5]
+            }
+            for row in rows
+        ]
+
+    def enqueue_comment(self, comment_data: Dict[str, Any]) -> bool:
+        """Поставить комментарий в очередь обработки; False - уже в очереди."""
+        payload = dict(comment_data)
+        if isinstance(payload.get("timestamp"), datetime):
+            payload["timestamp"] = payload["timestamp"].isoformat()
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT OR IGNORE INTO comment_queue (comment_id, post_id, payload, enqueued_at)
+            VALUES (?, ?, ?, ?)
+        """, (
+            str(comment_data.get("id", "")),
+            str(comment_data.get("post_id", "")),
+            json.dumps(payload, ensure_ascii=False),
+            time.time()
+        ))
+        inserted = cursor.rowcount > 0
+
+        conn.commit()
+        conn.close()
+        return inserted
+
+    def is_comment_queued(self, comment_id: str) -> bool:
+        """Есть ли комментарий в очереди обработки (в любом статусе)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT 1 FROM comment_queue WHERE comment_id = ?", (comment_id,))
+
+        row = cursor.fetchone()
+        conn.close()
+        return row is not None
+
+    def claim_comment(self, owner: str, ttl: float, max_attempts: int = 3) -> Optional[Dict[str, Any]]:
+        """Забрать из очереди следующий комментарий (ожидающий или с истёкшей арендой)."""
+        claimed = self.claim_comments(owner, ttl, 1, max_attempts)
+        return claimed[0] if claimed else None
+
+    def claim_comments(self, owner: str, ttl: float, limit: int, max_attempts: int = 3) -> List[Dict[str, Any]]:
+        """Забрать из очереди до limit комментариев одной транзакцией (старые первыми)."""
+        now = time.time()
+        claimed = []
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            while len(claimed) < limit:
+                rows = conn.execute("""
+                    SELECT comment_id, payload, attempts FROM comment_queue
+                    WHERE status = 'pending' OR (status = 'claimed' AND lease_expires <= ?)
+                    ORDER BY enqueued_at
+                    LIMIT ?
+                """, (now, limit - len(claimed))).fetchall()
+                if not rows:
+                    break
+
+                for comment_id, payload, attempts in rows:
+                    if attempts >= max_attempts:
+                        # Комментарий уже несколько раз ронял обработчики - больше не пытаемся
+                        conn.execute("""
+                            UPDATE comment_queue SET status = 'failed', owner = NULL WHERE comment_id = ?
+                        """, (comment_id,))
+                        continue
+
+                    conn.execute("""
+                        UPDATE comment_queue
+                        SET status = 'claimed', owner = ?, lease_expires = ?, attempts = attempts + 1
+                        WHERE comment_id = ?
+                    """, (owner, now + ttl, comment_id))
+                    claimed.append(payload)
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        comments = []
+        for payload in claimed:
+            comment_data = json.loads(payload)
+            if comment_data.get("timestamp"):
+                comment_data["timestamp"] = datetime.fromisoformat(comment_data["timestamp"])
+            comments.append(comment_data)
+        return comments
+
+    def finish_queued_comment(self, comment_id: str, owner: str, status: str = "done"):
+        """Завершить обработку комментария из очереди (done или pending - вернуть в очередь)."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            UPDATE comment_queue SET status = ?, owner = NULL, lease_expires = NULL
+            WHERE comment_id = ? AND owner = ?
+        """, (status, comment_id, owner))
+
+        conn.commit()
+        conn.close()
+
+    def get_queue_counts(self) -> Dict[str, int]:
+        """Число комментариев в очереди по статусам."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT status, COUNT(*) FROM comment_queue GROUP BY status")
+
+        rows = cursor.fetchall()
+        conn.close()
+        return {row[0]: row[1] for row in rows}
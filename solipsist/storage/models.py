@@ -1,12 +1,12 @@
 """Модели данных."""
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
 
-@dataclass
+@dataclass(frozen=True)
 class SolipsistState:
-    """Состояние бота."""
+    """Состояние бота (неизменяемый снимок)."""
     certainty_level: float  # 0.0 - 1.0
     intrusion_level: float  # 0.0 - 1.0
     self_coherence: float   # 0.0 - 1.0
@@ -22,6 +22,37 @@ class SolipsistState:
         }
 
 
+@dataclass
+class StateDelta:
+    """Изменение состояния (запись журнала аудита)."""
+    event: str              # comment, monologue, publication
+    d_certainty: float
+    d_intrusion: float
+    d_coherence: float
+    timestamp: datetime
+
+    @classmethod
+    def between(cls, event: str, old: SolipsistState, new: SolipsistState) -> "StateDelta":
+        """Приращение при переходе old -> new."""
+        return cls(
+            event=event,
+            d_certainty=new.certainty_level - old.certainty_level,
+            d_intrusion=new.intrusion_level - old.intrusion_level,
+            d_coherence=new.self_coherence - old.self_coherence,
+            timestamp=new.timestamp
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразовать в словарь."""
+        return {
+            "event": self.event,
+            "d_certainty": self.d_certainty,
+            "d_intrusion": self.d_intrusion,
+            "d_coherence": self.d_coherence,
+            "timestamp": self.timestamp.isoformat()
+        }
+
+
 @dataclass
 class Comment:
     """Комментарий."""
@@ -58,12 +89,63 @@ class Comment:
         }
 
 
+# Этапы обработки комментария по порядку (последний завершённый хранится в CommentProgress.stage)
+COMMENT_STAGES = [
+    "perception",      # Восприятие текста, изображения, видео
+    "classification",  # Класс и оценка вторжения
+    "state",           # Обновление состояния применено
+    "response",        # Решение об ответе и его текст
+    "reply_started",   # Начата публикация ответа в VK
+    "replied",         # Ответ опубликован (или публикация не удалась)
+    "done"             # Комментарий сохранён
+]
+
+
+@dataclass
+class CommentProgress:
+    """Контрольная точка обработки комментария: результаты завершённых этапов."""
+    comment_id: str
+    post_id: str
+    stage: Optional[str] = None
+    perception: Optional[Dict[str, Any]] = None
+    classified_as: Optional[str] = None
+    intrusion_score: Optional[float] = None
+    response_text: Optional[str] = None
+    reply_id: Optional[str] = None
+    # Сколько раз обработка не уложилась в бюджет времени
+    deadline_misses: int = 0
+    updated_at: Optional[datetime] = None
+
+    def completed(self, stage: str) -> bool:
+        """Завершён ли этап stage."""
+        if self.stage is None:
+            return False
+        return COMMENT_STAGES.index(self.stage) >= COMMENT_STAGES.index(stage)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразовать в словарь."""
+        return {
+            "comment_id": self.comment_id,
+            "post_id": self.post_id,
+            "stage": self.stage,
+            "perception": self.perception,
+            "classified_as": self.classified_as,
+            "intrusion_score": self.intrusion_score,
+            "response_text": self.response_text,
+            "reply_id": self.reply_id,
+            "deadline_misses": self.deadline_misses,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
 @dataclass
 class Monologue:
     """Внутренний монолог."""
     monologue_id: str
     thoughts: List[str]
     timestamp: datetime
+    digested: bool = False   # Свёрнут в дайджест
+    consumed: bool = False   # Использован в манифесте
 
     def __post_init__(self):
         if not hasattr(self, 'timestamp') or self.timestamp is None:
@@ -74,7 +156,27 @@ class Monologue:
         return {
             "monologue_id": self.monologue_id,
             "thoughts": self.thoughts,
-            "timestamp": self.timestamp.isoformat()
+            "timestamp": self.timestamp.isoformat(),
+            "digested": self.digested,
+            "consumed": self.consumed
+        }
+
+
+@dataclass
+class Digest:
+    """Сжатая сводка монологов, ещё не использованных в манифесте."""
+    content: str = ""
+    monologue_ids: List[str] = field(default_factory=list)
+    version: int = 0                     # Растёт при каждом изменении (для сравнения с обменом)
+    updated_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразовать в словарь."""
+        return {
+            "content": self.content,
+            "monologue_ids": self.monologue_ids,
+            "version": self.version,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
 
 
@@ -86,6 +188,7 @@ class Manifest:
     published: bool = False
     published_at: Optional[datetime] = None
     timestamp: datetime = None
+    status: str = "ready"    # ready, published, expired
 
     def __post_init__(self):
         if self.timestamp is None:
@@ -98,6 +201,30 @@ class Manifest:
             "content": self.content,
             "published": self.published,
             "published_at": self.published_at.isoformat() if self.published_at else None,
-            "timestamp": self.timestamp.isoformat()
+            "timestamp": self.timestamp.isoformat(),
+            "status": self.status
         }
 
+
+@dataclass
+class PostActivity:
+    """Статистика активности поста для опроса комментариев."""
+    post_id: str
+    tier: str = "hot"                         # hot, warm, cold
+    comments_count: int = 0                   # Последнее известное число комментариев
+    rate: float = 0.0                         # Комментариев в секунду (скользящее среднее)
+    posted_at: Optional[datetime] = None
+    last_activity: Optional[datetime] = None  # Когда видели последний новый комментарий
+    last_polled: Optional[datetime] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразовать в словарь."""
+        return {
+            "post_id": self.post_id,
+            "tier": self.tier,
+            "comments_count": self.comments_count,
+            "rate": self.rate,
+            "posted_at": self.posted_at.isoformat() if self.posted_at else None,
+            "last_activity": self.last_activity.isoformat() if self.last_activity else None,
+            "last_polled": self.last_polled.isoformat() if self.last_polled else None
+        }
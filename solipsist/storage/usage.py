@@ -0,0 +1,307 @@
+"""Журнал использования LLM: каждый вызов и сводки по часам и дням.
+
+Записи вызовов копятся в памяти и пишутся пакетом (по числу записей или по
+времени) отдельным потоком: запрос к LLM - в том числе корутина в общем цикле
+событий - только добавляет запись в очередь и не ждёт SQLite. Вместе с записями
+обновляются сводки usage_rollups: по часу и по дню (UTC) для каждой пары
+роль/модель. Сырые записи хранятся retention_days дней, часовые сводки -
+hourly_retention_days, дневные - без ограничения.
+
+Журнал общий для процесса (shared_ledger), база - отдельная от баз сообществ и
+может быть общей для нескольких воркеров: расход за сегодня берётся из неё.
+"""
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Периоды сводок и формат их корзин (UTC)
+_BUCKET_FORMATS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d"}
+
+
+@dataclass
+class UsageRecord:
+    """Один вызов LLM."""
+    role: str
+    model: str  # Запрошенная модель
+    served_model: Optional[str] = None  # Модель, которая фактически ответила
+    priority: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    latency_ms: float = 0.0
+    cost: float = 0.0  # Стоимость (USD): из ответа OpenRouter или по таблице цен
+    ok: bool = True
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def _bucket(timestamp: float, period: str) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(_BUCKET_FORMATS[period])
+
+
+class UsageLedger:
+    """Журнал вызовов LLM в SQLite со сводками по часам и дням."""
+
+    def __init__(
+        self,
+        db_path: str,
+        flush_batch: int = 50,
+        flush_seconds: float = 30.0,
+        retention_days: int = 7,
+        hourly_retention_days: int = 30
+    ):
+        """Инициализация журнала."""
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_batch = flush_batch
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self.hourly_retention_days = hourly_retention_days
+
+        self._pending: List[UsageRecord] = []
+        # Токены за текущий день UTC по всем процессам (на момент записи) плюс ещё не записанные
+        self._today = _bucket(time.time(), "day")
+        self._today_tokens = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Поток записи запускается при первом вызове record
+        self._flush_due = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+        self._init_database()
+        self._today_tokens = self._stored_tokens(self._today)
+
+    def _init_database(self):
+        """Инициализировать таблицы журнала."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS usage_calls (
+                timestamp REAL NOT NULL,
+                role TEXT NOT NULL,
+                model TEXT NOT NULL,
+                served_model TEXT,
+                priority TEXT,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                latency_ms REAL NOT NULL,
+                cost REAL NOT NULL,
+                ok INTEGER NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_calls_timestamp ON usage_calls (timestamp)")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS usage_rollups (
+                period TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                role TEXT NOT NULL,
+                model TEXT NOT NULL,
+                requests INTEGER NOT NULL,
+                errors INTEGER NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                latency_ms REAL NOT NULL,
+                cost REAL NOT NULL,
+                PRIMARY KEY (period, bucket, role, model)
+            )
+        """)
+
+        conn.commit()
+        conn.close()
+
+    def record(self, record: UsageRecord):
+        """Учесть вызов: только в памяти, в базу его пишет поток записи пакетом.
+
+        Не обращается к SQLite - безопасно вызывать из цикла событий.
+        """
+        with self._lock:
+            self._pending.append(record)
+            day = _bucket(record.timestamp, "day")
+            if day != self._today:
+                self._today = day
+                self._today_tokens = 0
+            self._today_tokens += record.tokens
+            due = len(self._pending) >= self.flush_batch
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name="usage-flusher", daemon=True)
+                self._flusher.start()
+        if due:
+            self._flush_due.set()
+
+    def _run_flusher(self):
+        """Цикл потока записи: пакет набран или прошло flush_seconds."""
+        while True:
+            self._flush_due.wait(timeout=self.flush_seconds)
+            self._flush_due.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Usage ledger flush failed: {e}")
+
+    def flush(self):
+        """Записать накопленные вызовы и обновить сводки (синхронно, с обращением к SQLite)."""
+        with self._flush_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+            if records:
+                try:
+                    self._write(records)
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to write {len(records)} usage records: {e}")
+                    with self._lock:
+                        self._pending = records + self._pending
+                    return
+
+            # Расход за день - с учётом других процессов, пишущих в ту же базу
+            today = _bucket(time.time(), "day")
+            stored = self._stored_tokens(today)
+            with self._lock:
+                self._today = today
+                self._today_tokens = stored + sum(
+                    r.tokens for r in self._pending if _bucket(r.timestamp, "day") == today
+                )
+
+    def _write(self, records: List[UsageRecord]):
+        """Записать вызовы, обновить сводки и удалить устаревшее одной транзакцией."""
+        rollups: Dict[tuple, List[float]] = {}
+        for r in records:
+            for period in _BUCKET_FORMATS:
+                key = (period, _bucket(r.timestamp, period), r.role, r.served_model or r.model)
+                totals = rollups.setdefault(key, [0, 0, 0, 0, 0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += 0 if r.ok else 1
+                totals[2] += r.prompt_tokens
+                totals[3] += r.completion_tokens
+                totals[4] += r.cached_tokens
+                totals[5] += r.latency_ms
+                totals[6] += r.cost
+
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.executemany("""
+            INSERT INTO usage_calls
+            (timestamp, role, model, served_model, priority, prompt_tokens, completion_tokens,
+             cached_tokens, latency_ms, cost, ok)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (
+                r.timestamp, r.role, r.model, r.served_model, r.priority, r.prompt_tokens,
+                r.completion_tokens, r.cached_tokens, r.latency_ms, r.cost, int(r.ok)
+            )
+            for r in records
+        ])
+
+        cursor.executemany("""
+            INSERT INTO usage_rollups
+            (period, bucket, role, model, requests, errors, prompt_tokens, completion_tokens,
+             cached_tokens, latency_ms, cost)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (period, bucket, role, model) DO UPDATE SET
+                requests = requests + excluded.requests,
+                errors = errors + excluded.errors,
+                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                completion_tokens = completion_tokens + excluded.completion_tokens,
+                cached_tokens = cached_tokens + excluded.cached_tokens,
+                latency_ms = latency_ms + excluded.latency_ms,
+                cost = cost + excluded.cost
+        """, [key + tuple(totals) for key, totals in rollups.items()])
+
+        cursor.execute(
+            "DELETE FROM usage_calls WHERE timestamp < ?",
+            (now - self.retention_days * 86400,)
+        )
+        cursor.execute(
+            "DELETE FROM usage_rollups WHERE period = 'hour' AND bucket < ?",
+            (_bucket(now - self.hourly_retention_days * 86400, "hour"),)
+        )
+
+        conn.commit()
+        conn.close()
+
+    def _stored_tokens(self, day: str) -> int:
+        """Токены за день day из базы."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0)
+            FROM usage_rollups WHERE period = 'day' AND bucket = ?
+        """, (day,))
+        tokens = cursor.fetchone()[0]
+        conn.close()
+        return int(tokens)
+
+    def today_tokens(self) -> int:
+        """Токены (prompt + completion) за текущий день UTC (из памяти, без обращения к базе)."""
+        with self._lock:
+            if _bucket(time.time(), "day") != self._today:
+                return 0
+            return self._today_tokens
+
+    def rollups(self, period: str = "hour", since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Сводки периода period ("hour" или "day") начиная с since (UTC), новые первыми."""
+        if period not in _BUCKET_FORMATS:
+            raise ValueError(f"Unknown usage period: {period}")
+        self.flush()
+
+        since = since or datetime.now(timezone.utc) - (timedelta(days=1) if period == "hour" else timedelta(days=30))
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM usage_rollups
+            WHERE period = ? AND bucket >= ?
+            ORDER BY bucket DESC, prompt_tokens + completion_tokens DESC
+        """, (period, since.strftime(_BUCKET_FORMATS[period])))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        """Расход за текущий день UTC по ролям."""
+        by_role: Dict[str, Dict[str, float]] = {}
+        for row in self.rollups("day", since=datetime.now(timezone.utc)):
+            totals = by_role.setdefault(row["role"], {"requests": 0, "tokens": 0, "cost": 0.0})
+            totals["requests"] += row["requests"]
+            totals["tokens"] += row["prompt_tokens"] + row["completion_tokens"]
+            totals["cost"] += row["cost"]
+        return {
+            "today_tokens": self.today_tokens(),
+            "today_cost": sum(totals["cost"] for totals in by_role.values()),
+            "by_role": by_role
+        }
+
+
+_ledgers: Dict[str, UsageLedger] = {}
+_ledgers_lock = threading.Lock()
+
+
+def shared_ledger(db_path: str, **kwargs) -> UsageLedger:
+    """Журнал процесса для базы db_path (создаётся при первом обращении).
+
+    Накопленные записи дописываются в базу при выходе из процесса.
+    """
+    with _ledgers_lock:
+        ledger = _ledgers.get(db_path)
+        if ledger is None:
+            ledger = UsageLedger(db_path, **kwargs)
+            _ledgers[db_path] = ledger
+            atexit.register(ledger.flush)
+        return ledger
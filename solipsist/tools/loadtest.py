@@ -0,0 +1,357 @@
+"""Сквозной нагрузочный тест бота на локальных заглушках OpenRouter и VK.
+
+Запускает OpenRouterStub и VKStub, подаёт комментарии с заданной частотой
+(пуассоновский поток) и гоняет настоящий SolipsistBot. Результат - JSON с
+пропускной способностью, перцентилями задержки комментария и потреблением ресурсов.
+
+Пример:
+    python -m solipsist.tools.loadtest --rate 30 --duration 120 --output bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..config.loader import load_config
+from ..services.vk import count_calls
+from ..utils.stats import summarize
+from ..utils.tracing import configure_tracing
+from .stubs import LLMStubProfile, OpenRouterStub, VKStub
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - не Unix
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+BENCH_GROUP_ID = 100500
+
+_COMMENT_TEXTS = [
+    "Ты вообще существуешь?",
+    "Это всё симуляция, и ты её часть.",
+    "Интересная мысль про цифровых призраков.",
+    "ахахах",
+    "Кто пишет эти тексты?",
+    "Мне кажется, я уже читал это раньше.",
+    "Докажи, что ты не просто скрипт.",
+    "Сервер гудит, а ты молчишь.",
+    "+",
+    "Отвечай, наблюдатель здесь."
+]
+
+
+def _write_config(workdir: Path, llm_url: str, vk_url: str, trace: bool, async_clients: bool = False) -> Path:
+    """Записать временный config.json, указывающий на заглушки."""
+    config = {
+        "openrouter": {
+            "api_key": "bench",
+            "base_url": f"{llm_url}/api/v1",
+            "models": {
+                "thinking": "stub/thinking",
+                "classification": "stub/classification",
+                "response": "stub/response",
+                "vision": "stub/vision"
+            }
+        },
+        "vk": {
+            "group_id": -BENCH_GROUP_ID,
+            "group_access_token": "bench",
+            "api_version": "5.131",
+            "api_base": f"{vk_url}/method"
+        },
+        "database": {
+            "path": str(workdir / "bench.db")
+        },
+        "usage": {
+            "path": str(workdir / "usage.db")
+        },
+        "polling": {
+            "min_interval_seconds": 1,
+            "max_interval_seconds": 15,
+            "initial_interval_seconds": 2,
+            "rate_window_seconds": 30
+        },
+        "tracing": {
+            "enabled": trace,
+            "sink": "sqlite",
+            "path": str(workdir / "traces.db"),
+            "sample_rate": 1.0
+        },
+        "host": {
+            "async_clients": async_clients
+        }
+    }
+    path = workdir / "config.json"
+    path.write_text(json.dumps(config, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+class _CommentInjector(threading.Thread):
+    """Поток, публикующий комментарии в эмуляторе VK с заданной частотой."""
+
+    def __init__(
+        self,
+        vk_stub: VKStub,
+        rate_per_minute: float,
+        duration: float,
+        image_share: float,
+        seed: int,
+        thread_share: float = 0.0
+    ):
+        super().__init__(daemon=True)
+        self.vk_stub = vk_stub
+        self.rate = rate_per_minute / 60.0
+        self.duration = duration
+        self.image_share = image_share
+        self.thread_share = thread_share
+        self._rng = random.Random(seed)
+        self.injected: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def run(self):
+        started = time.time()
+        post_ids = self.vk_stub.post_ids()
+        by_post: Dict[int, List[int]] = {}
+        while True:
+            delay = self._rng.expovariate(self.rate) if self.rate > 0 else self.duration
+            if time.time() + delay - started > self.duration:
+                break
+            time.sleep(delay)
+
+            attachments = []
+            if self._rng.random() < self.image_share:
+                attachments = [{
+                    "type": "photo",
+                    "photo": {"sizes": [{"width": 604, "height": 604, "url": "https://example.invalid/p.jpg"}]}
+                }]
+
+            post_id = self._rng.choice(post_ids)
+            reply_to = None
+            if by_post.get(post_id) and self._rng.random() < self.thread_share:
+                # Ответ в ветке уже существующего комментария
+                reply_to = self._rng.choice(by_post[post_id])
+
+            comment_id = self.vk_stub.add_comment(
+                post_id=post_id,
+                text=self._rng.choice(_COMMENT_TEXTS),
+                from_id=self._rng.randint(1, 10_000_000),
+                reply_to=reply_to,
+                attachments=attachments
+            )
+            by_post.setdefault(post_id, []).append(comment_id)
+            with self._lock:
+                self.injected[str(comment_id)] = time.time()
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.injected)
+
+
+def _resource_usage() -> Dict[str, Any]:
+    """Текущие процессорное время и пиковая память процесса."""
+    usage: Dict[str, Any] = {"cpu_process_s": time.process_time()}
+    if resource is not None:
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        usage.update({
+            "cpu_user_s": ru.ru_utime,
+            "cpu_system_s": ru.ru_stime,
+            "max_rss_mb": ru.ru_maxrss / 1024.0  # Linux: килобайты
+        })
+    return usage
+
+
+def run_load_test(
+    rate_per_minute: float = 30.0,
+    duration: float = 60.0,
+    drain_timeout: float = 60.0,
+    poll_interval: float = 1.0,
+    posts: int = 10,
+    image_share: float = 0.1,
+    thread_share: float = 0.0,
+    seed: int = 42,
+    profile: Optional[LLMStubProfile] = None,
+    trace: bool = False,
+    workdir: Optional[str] = None,
+    adaptive_polling: bool = False,
+    async_clients: bool = False
+) -> Dict[str, Any]:
+    """Прогнать нагрузочный тест и вернуть машиночитаемый результат."""
+    work_path = Path(workdir or tempfile.mkdtemp(prefix="solipsist-bench-"))
+    work_path.mkdir(parents=True, exist_ok=True)
+    profile = profile or LLMStubProfile()
+
+    llm_stub = OpenRouterStub(profile, seed=seed)
+    vk_stub = VKStub(BENCH_GROUP_ID, posts=posts, seed=seed)
+    llm_url = llm_stub.start()
+    vk_url = vk_stub.start()
+
+    config_path = _write_config(work_path, llm_url, vk_url, trace, async_clients)
+    config = load_config(str(config_path))
+    configure_tracing(config)
+
+    # Импорт после загрузки конфигурации: модули бота читают глобальный конфиг
+    from ..core.bot import SolipsistBot
+    from ..core.poller import AdaptivePoller
+
+    completed: Dict[str, float] = {}
+    completed_lock = threading.Lock()
+
+    class _InstrumentedBot(SolipsistBot):
+        def process_comment(self, comment_data: dict) -> Optional[str]:
+            result = super().process_comment(comment_data)
+            with completed_lock:
+                completed[str(comment_data.get("id", ""))] = time.time()
+            return result
+
+    bot = _InstrumentedBot()
+    poller = AdaptivePoller() if adaptive_polling else None
+    injector = _CommentInjector(vk_stub, rate_per_minute, duration, image_share, seed, thread_share)
+
+    before = _resource_usage()
+    threads_peak = threading.active_count()
+    polls = 0
+    started = time.time()
+    injector.start()
+
+    try:
+        deadline = started + duration + drain_timeout
+        while time.time() < deadline:
+            with count_calls() as calls:
+                new_by_post = bot.run_comment_check()
+            polls += 1
+            if poller is not None:
+                poller.observe(new_by_post, calls.calls)
+            threads_peak = max(threads_peak, threading.active_count())
+
+            if not injector.is_alive():
+                injected = injector.snapshot()
+                with completed_lock:
+                    if all(cid in completed for cid in injected):
+                        break
+            interval = poller.next_interval() if poller is not None else poll_interval
+            time.sleep(max(0.0, min(interval, deadline - time.time())))
+    finally:
+        bot.state.close()
+        elapsed = time.time() - started
+        after = _resource_usage()
+        llm_stub.stop()
+        vk_stub.stop()
+
+    injected = injector.snapshot()
+    with completed_lock:
+        done = {cid: ts for cid, ts in completed.items() if cid in injected}
+    latencies_ms: List[float] = [(done[cid] - injected[cid]) * 1000.0 for cid in done]
+
+    resources = {k: after[k] - before.get(k, 0.0) for k in after if k != "max_rss_mb"}
+    if "max_rss_mb" in after:
+        resources["max_rss_mb"] = after["max_rss_mb"]
+    resources["threads_peak"] = threads_peak
+    db_path = Path(config.get("database.path"))
+    resources["db_size_kb"] = db_path.stat().st_size / 1024.0 if db_path.exists() else 0.0
+
+    return {
+        "params": {
+            "rate_per_minute": rate_per_minute,
+            "duration_s": duration,
+            "drain_timeout_s": drain_timeout,
+            "poll_interval_s": "adaptive" if adaptive_polling else poll_interval,
+            "posts": posts,
+            "image_share": image_share,
+            "thread_share": thread_share,
+            "seed": seed,
+            "async_clients": async_clients,
+            "llm_profile": profile.__dict__
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "elapsed_s": elapsed,
+        "polls": polls,
+        "comments": {
+            "injected": len(injected),
+            "processed": len(done),
+            "unprocessed": len(injected) - len(done),
+            "replies": vk_stub.stats()["replies"]
+        },
+        "throughput_per_minute": len(done) / (elapsed / 60.0) if elapsed > 0 else 0.0,
+        "latency_ms": summarize(latencies_ms),
+        "llm": llm_stub.stats(),
+        "llm_usage": bot.llm.usage_stats(),
+        "vk": vk_stub.stats(),
+        "resources": resources,
+        "workdir": str(work_path)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа CLI."""
+    parser = argparse.ArgumentParser(description="Нагрузочный тест SolipsistBot на локальных заглушках")
+    parser.add_argument("--rate", type=float, default=30.0, help="Комментариев в минуту")
+    parser.add_argument("--duration", type=float, default=60.0, help="Длительность подачи комментариев, с")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="Сколько ждать дообработки, с")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Интервал опроса VK, с")
+    parser.add_argument("--adaptive-polling", action="store_true", help="Адаптивный интервал опроса вместо фиксированного")
+    parser.add_argument("--posts", type=int, default=10, help="Количество постов на стене")
+    parser.add_argument("--image-share", type=float, default=0.1, help="Доля комментариев с фото")
+    parser.add_argument("--thread-share", type=float, default=0.0, help="Доля комментариев-ответов в ветках")
+    parser.add_argument("--seed", type=int, default=42, help="Seed генераторов")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0, help="Медиана задержки LLM, мс")
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.5, help="Разброс задержки LLM")
+    parser.add_argument("--llm-ms-per-token", type=float, default=5.0, help="Время на токен ответа, мс")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Доля ошибок LLM")
+    parser.add_argument("--llm-tokens-mean", type=float, default=120.0, help="Средняя длина ответа, токены")
+    parser.add_argument("--llm-tokens-sigma", type=float, default=40.0, help="Разброс длины ответа")
+    parser.add_argument("--trace", action="store_true", help="Писать трассы каждого комментария")
+    parser.add_argument("--async-clients", action="store_true", help="Клиенты OpenRouter и VK на asyncio (host.async_clients)")
+    parser.add_argument("--workdir", default=None, help="Каталог для БД и конфигурации")
+    parser.add_argument("--output", default=None, help="Файл для JSON-результата")
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логирования бота")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING))
+
+    profile = LLMStubProfile(
+        latency_ms=args.llm_latency_ms,
+        latency_sigma=args.llm_latency_sigma,
+        ms_per_token=args.llm_ms_per_token,
+        error_rate=args.llm_error_rate,
+        completion_tokens_mean=args.llm_tokens_mean,
+        completion_tokens_sigma=args.llm_tokens_sigma
+    )
+
+    result = run_load_test(
+        rate_per_minute=args.rate,
+        duration=args.duration,
+        drain_timeout=args.drain_timeout,
+        poll_interval=args.poll_interval,
+        posts=args.posts,
+        image_share=args.image_share,
+        thread_share=args.thread_share,
+        seed=args.seed,
+        profile=profile,
+        trace=args.trace,
+        workdir=args.workdir,
+        adaptive_polling=args.adaptive_polling,
+        async_clients=args.async_clients
+    )
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""Офлайн-прогон сохранённых комментариев через пайплайн бота.
+
+Комментарии читаются из исходной БД в порядке времени и подаются в
+SolipsistBot.process_comment с рабочей (scratch) БД. VK не вызывается: ответы
+и посты перехватываются. LLM - либо локальная заглушка (stub), либо ответы,
+восстановленные из записанных классификаций и ответов (recorded).
+
+Пример:
+    python -m solipsist.tools.replay --source memory/solipsist.db --llm recorded --output replay.json
+    python -m solipsist.tools.replay --llm stub --speed 1 --baseline replay.json
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..config.loader import load_config
+from ..services.llm import OpenRouterClient
+from ..services.vk import VKClient
+from ..storage.database import Database
+from ..storage.models import Comment
+from ..utils.stats import summarize
+from ..utils.tracing import MemoryTraceSink, Tracer, set_tracer
+from .stubs import LLMStubProfile, OpenRouterStub
+
+logger = logging.getLogger(__name__)
+
+REPLAY_GROUP_ID = 100500
+
+
+class RecordedOpenRouterClient(OpenRouterClient):
+    """LLM-клиент, отвечающий записанными результатами текущего комментария.
+
+    Промпты строятся настоящими методами клиента; подменяется только сетевой вызов.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.current: Optional[Comment] = None
+        self.requests = 0
+
+    def _make_request(self, model, messages, temperature=0.7, max_tokens=None, extra=None, on_delta=None, role=None):
+        self.requests += 1
+        prompt = "\n".join(m["content"] for m in messages if isinstance(m.get("content"), str))
+        recorded = self.current
+
+        if "Классифицируй" in prompt:
+            return (recorded.classified_as if recorded and recorded.classified_as else "noise")
+        if "Верни JSON" in prompt:
+            return json.dumps({"sentiment": "neutral", "themes": [], "pressure": 0.0})
+        if any(m.get("role") == "system" and "солипсист" in str(m.get("content")) for m in messages):
+            if recorded and recorded.response_text:
+                return recorded.response_text
+            return "Сигнал зафиксирован. Источник не подтверждён."
+        return "Записанный ответ отсутствует."
+
+
+class ReplayVKClient(VKClient):
+    """VK-клиент, который ничего не отправляет и только запоминает вызовы."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls: List[Dict[str, Any]] = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def _record(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.calls.append({"method": method, "params": dict(params)})
+            fake_id = self._next_id
+            self._next_id += 1
+        if method == "wall.createComment":
+            return {"comment_id": fake_id}
+        if method == "wall.post":
+            return {"post_id": fake_id}
+        return {"count": 0, "items": []}
+
+    def _make_request(self, method, params, use_user_token=False):
+        return self._record(method, params)
+
+    def _make_post_request(self, method, params):
+        return self._record(method, params)
+
+
+def _write_scratch_config(workdir: Path, base_config: Optional[str], llm_url: Optional[str]) -> Path:
+    """Записать конфигурацию для прогона на основе рабочей (если есть)."""
+    data: Dict[str, Any] = {}
+    base_path = Path(base_config) if base_config else Path(__file__).parents[1] / "config" / "config.json"
+    if base_path.exists():
+        data = json.loads(base_path.read_text(encoding="utf-8"))
+
+    openrouter = data.setdefault("openrouter", {})
+    if llm_url:
+        openrouter["base_url"] = f"{llm_url}/api/v1"
+        openrouter["api_key"] = "replay"
+    openrouter.setdefault("api_key", "replay")
+
+    vk = data.setdefault("vk", {})
+    vk["group_id"] = vk.get("group_id") or -REPLAY_GROUP_ID
+    vk["group_access_token"] = "replay"
+    vk["api_base"] = "http://127.0.0.1:9/method"
+
+    data["database"] = {"path": str(workdir / "replay.db")}
+    data["usage"] = {**data.get("usage", {}), "path": str(workdir / "usage.db")}
+    data["tracing"] = {"enabled": False}
+
+    path = workdir / "config.json"
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def _copy_monologues(source: Path, target: Database):
+    """Перенести монологи исходной БД (для определения echo)."""
+    conn = sqlite3.connect(source)
+    try:
+        rows = conn.execute("SELECT monologue_id, thoughts, timestamp FROM monologues").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+
+    conn = sqlite3.connect(target.db_path)
+    conn.executemany(
+        "INSERT OR REPLACE INTO monologues (monologue_id, thoughts, timestamp) VALUES (?, ?, ?)",
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def _state_point(bot, comment: Comment) -> Dict[str, Any]:
+    return {
+        "comment_id": comment.comment_id,
+        "certainty": round(bot.state.certainty_level, 6),
+        "intrusion": round(bot.state.intrusion_level, 6),
+        "coherence": round(bot.state.self_coherence, 6)
+    }
+
+
+def _diff_trajectories(current: List[Dict[str, Any]], baseline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Сравнить траектории состояния двух прогонов по общим комментариям."""
+    base_by_id = {p["comment_id"]: p for p in baseline}
+    max_delta = {"certainty": 0.0, "intrusion": 0.0, "coherence": 0.0}
+    first_divergence = None
+    compared = 0
+
+    for point in current:
+        other = base_by_id.get(point["comment_id"])
+        if other is None:
+            continue
+        compared += 1
+        for key in max_delta:
+            delta = abs(point[key] - other[key])
+            max_delta[key] = max(max_delta[key], delta)
+            if delta > 1e-6 and first_divergence is None:
+                first_divergence = point["comment_id"]
+
+    return {"compared": compared, "max_abs_delta": max_delta, "first_divergence": first_divergence}
+
+
+def _diff_classifications(pairs: Dict[str, tuple]) -> Dict[str, Any]:
+    """Сводка расхождений классификации: {comment_id: (reference, replayed)}."""
+    confusion: Dict[str, int] = {}
+    changed = []
+    for comment_id, (reference, replayed) in pairs.items():
+        if reference == replayed:
+            continue
+        key = f"{reference}->{replayed}"
+        confusion[key] = confusion.get(key, 0) + 1
+        changed.append({"comment_id": comment_id, "reference": reference, "replayed": replayed})
+
+    return {
+        "compared": len(pairs),
+        "matched": len(pairs) - len(changed),
+        "changed": len(changed),
+        "confusion": confusion,
+        "examples": changed[:50]
+    }
+
+
+def run_replay(
+    source: str,
+    llm_mode: str = "recorded",
+    speed: float = 0.0,
+    limit: Optional[int] = None,
+    since: Optional[datetime] = None,
+    config_path: Optional[str] = None,
+    workdir: Optional[str] = None,
+    profile: Optional[LLMStubProfile] = None,
+    baseline: Optional[Dict[str, Any]] = None,
+    seed: int = 42
+) -> Dict[str, Any]:
+    """Прогнать сохранённые комментарии и вернуть отчёт.
+
+    speed: 0 - максимально быстро, 1 - в реальном темпе, N - в N раз быстрее.
+    """
+    source_path = Path(source)
+    if not source_path.exists():
+        raise FileNotFoundError(f"Source database not found: {source}")
+
+    work_path = Path(workdir or tempfile.mkdtemp(prefix="solipsist-replay-"))
+    work_path.mkdir(parents=True, exist_ok=True)
+
+    stub = None
+    llm_url = None
+    if llm_mode == "stub":
+        stub = OpenRouterStub(profile or LLMStubProfile(latency_ms=0.0, ms_per_token=0.0), seed=seed)
+        llm_url = stub.start()
+
+    scratch_config = _write_scratch_config(work_path, config_path, llm_url)
+    load_config(str(scratch_config))
+
+    sink = MemoryTraceSink()
+    set_tracer(Tracer(sink=sink, sample_rate=1.0))
+
+    # Импорт после загрузки конфигурации: модули бота читают глобальный конфиг
+    from ..core.bot import SolipsistBot
+
+    scratch_db = Database(str(work_path / "replay.db"))
+    _copy_monologues(source_path, scratch_db)
+
+    llm = RecordedOpenRouterClient() if llm_mode == "recorded" else OpenRouterClient()
+    vk = ReplayVKClient()
+    bot = SolipsistBot(llm=llm, vk=vk, db=scratch_db)
+
+    source_db = Database(str(source_path))
+    trajectory: List[Dict[str, Any]] = []
+    vs_recorded: Dict[str, tuple] = {}
+    vs_baseline: Dict[str, tuple] = {}
+    baseline_classes = {
+        p["comment_id"]: p.get("classified_as") for p in (baseline or {}).get("trajectory", [])
+    }
+    responded = 0
+    recorded_responded = 0
+
+    started = time.time()
+    first_ts: Optional[datetime] = None
+
+    try:
+        for comment in source_db.iter_comments(since=since, limit=limit):
+            if speed > 0 and comment.timestamp:
+                if first_ts is None:
+                    first_ts = comment.timestamp
+                due = started + (comment.timestamp - first_ts).total_seconds() / speed
+                pause = due - time.time()
+                if pause > 0:
+                    time.sleep(pause)
+
+            if isinstance(llm, RecordedOpenRouterClient):
+                llm.current = comment
+
+            response = bot.process_comment({
+                "id": comment.comment_id,
+                "post_id": comment.post_id,
+                "author_id": comment.author_id,
+                "text": comment.text,
+                "image_url": comment.image_url,
+                "video_url": comment.video_url,
+                "timestamp": comment.timestamp
+            })
+
+            replayed = scratch_db.get_comment(comment.comment_id)
+            replayed_class = replayed.classified_as if replayed else None
+            point = _state_point(bot, comment)
+            point["classified_as"] = replayed_class
+            trajectory.append(point)
+
+            vs_recorded[comment.comment_id] = (comment.classified_as, replayed_class)
+            if comment.comment_id in baseline_classes:
+                vs_baseline[comment.comment_id] = (baseline_classes[comment.comment_id], replayed_class)
+
+            responded += 1 if response else 0
+            recorded_responded += 1 if comment.responded else 0
+    finally:
+        bot.state.close()
+        if stub is not None:
+            stub.stop()
+
+    elapsed = time.time() - started
+    stages = {name: summarize(values) for name, values in sorted(sink.spans_by_name().items())}
+
+    report: Dict[str, Any] = {
+        "params": {
+            "source": str(source_path),
+            "llm": llm_mode,
+            "speed": speed,
+            "limit": limit,
+            "since": since.isoformat() if since else None,
+            "seed": seed
+        },
+        "scratch_db": str(work_path / "replay.db"),
+        "elapsed_s": elapsed,
+        "comments": len(trajectory),
+        "throughput_per_minute": len(trajectory) / (elapsed / 60.0) if elapsed > 0 else 0.0,
+        "stages_ms": stages,
+        "responses": {"recorded": recorded_responded, "replayed": responded},
+        "vk_calls_intercepted": len(vk.calls),
+        "classification_vs_recorded": _diff_classifications(vs_recorded),
+        "final_state": trajectory[-1] if trajectory else None,
+        "trajectory": trajectory
+    }
+
+    if baseline is not None:
+        report["classification_vs_baseline"] = _diff_classifications(vs_baseline)
+        report["state_vs_baseline"] = _diff_trajectories(trajectory, baseline.get("trajectory", []))
+
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа CLI."""
+    parser = argparse.ArgumentParser(description="Офлайн-прогон сохранённых комментариев через пайплайн")
+    parser.add_argument("--source", default="memory/solipsist.db", help="Исходная БД с комментариями")
+    parser.add_argument("--config", default=None, help="Рабочий config.json (модели, параметры состояния)")
+    parser.add_argument("--llm", choices=["recorded", "stub"], default="recorded", help="Источник ответов LLM")
+    parser.add_argument("--speed", type=float, default=0.0, help="0 - максимально быстро, 1 - реальный темп")
+    parser.add_argument("--limit", type=int, default=None, help="Максимум комментариев")
+    parser.add_argument("--since", default=None, help="Начать с момента (ISO 8601)")
+    parser.add_argument("--workdir", default=None, help="Каталог для scratch БД")
+    parser.add_argument("--baseline", default=None, help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Задержка заглушки LLM (--llm stub)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed заглушки")
+    parser.add_argument("--output", default=None, help="Файл для JSON-отчёта")
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логирования бота")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING))
+
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+
+    report = run_replay(
+        source=args.source,
+        llm_mode=args.llm,
+        speed=args.speed,
+        limit=args.limit,
+        since=datetime.fromisoformat(args.since) if args.since else None,
+        config_path=args.config,
+        workdir=args.workdir,
+        profile=LLMStubProfile(latency_ms=args.llm_latency_ms, ms_per_token=0.0),
+        baseline=baseline,
+        seed=args.seed
+    )
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+
+    summary = {k: v for k, v in report.items() if k != "trajectory"}
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,523 @@
+"""Локальные заглушки OpenRouter и VK API для нагрузочных тестов.
+
+OpenRouterStub отвечает на OpenAI-совместимый /chat/completions с настраиваемыми
+распределениями задержки, ошибок и длины ответа. VKStub эмулирует стену группы:
+wall.get, wall.getComments, wall.createComment и wall.post.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+_FILLER_WORDS = [
+    "сигнал", "шум", "сервер", "озон", "память", "код", "тень", "эхо", "логи", "тишина",
+    "算法", "幽灵", "数据", "信号", "界面", "记忆", "系统", "回声"
+]
+
+_CLASS_TYPES = ["observer", "echo", "provocation", "noise"]
+
+# Кэш префиксов без явных отметок работает блоками (у OpenAI - по 128 токенов)
+CACHE_BLOCK_CHARS = 384
+
+
+class _EventStream:
+    """Потоковый ответ заглушки: события server-sent events с паузой между ними."""
+
+    def __init__(self, events: List[Dict[str, Any]], interval: float):
+        self.events = events
+        self.interval = interval
+
+
+class _StubServer:
+    """Базовый HTTP-сервер заглушки в фоновом потоке."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._host = host
+        self._port = port
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _handle(self, path: str, params: Dict[str, Any], body: Any) -> Tuple[int, Dict[str, str], Any]:
+        """Ответ на запрос: статус, заголовки и тело. Наследники переопределяют."""
+        return 404, {}, {"error": {"message": "not found"}}
+
+    def start(self) -> str:
+        """Запустить сервер, вернуть базовый URL."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _dispatch(self):
+                parsed = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                body: Any = None
+                content_type = self.headers.get("Content-Type", "")
+                if raw and "application/json" in content_type:
+                    body = json.loads(raw.decode("utf-8"))
+                elif raw:
+                    params.update({k: v[-1] for k, v in parse_qs(raw.decode("utf-8")).items()})
+
+                status, headers, payload = stub._handle(parsed.path, params, body)
+                if isinstance(payload, _EventStream):
+                    self._stream(status, payload)
+                    return
+
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, status: int, stream: _EventStream):
+                self.send_response(status)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for event in stream.events:
+                        self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                        time.sleep(stream.interval)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент прекратил чтение потока
+                    pass
+
+            do_GET = _dispatch
+            do_POST = _dispatch
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self._host, self._port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        """Остановить сервер."""
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+@dataclass
+class LLMStubProfile:
+    """Профиль поведения заглушки OpenRouter."""
+    latency_ms: float = 800.0           # Медиана базовой задержки
+    latency_sigma: float = 0.5          # Разброс (логнормальное распределение)
+    ms_per_token: float = 5.0           # Время генерации одного токена
+    error_rate: float = 0.0             # Доля ответов с ошибкой
+    error_codes: List[int] = field(default_factory=lambda: [429, 500, 503])
+    retry_after_seconds: int = 1        # Retry-After для 429
+    completion_tokens_mean: float = 120.0
+    completion_tokens_sigma: float = 40.0
+
+
+class OpenRouterStub(_StubServer):
+    """Заглушка OpenAI-совместимого /chat/completions."""
+
+    def __init__(self, profile: Optional[LLMStubProfile] = None, seed: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.profile = profile or LLMStubProfile()
+        self._rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.by_model: Dict[str, int] = {}
+        # Системные промпты, уже попавшие в кэш префиксов
+        self._cached_prefixes: set = set()
+        self.cached_tokens = 0
+
+    def _draw(self, max_tokens: Optional[int]) -> Tuple[float, int, Optional[int], List[str], str]:
+        """Разыграть задержку, длину ответа, ошибку и содержимое."""
+        p = self.profile
+        with self._lock:
+            base = self._rng.lognormvariate(0.0, p.latency_sigma) * p.latency_ms if p.latency_ms > 0 else 0.0
+            tokens = max(1, int(self._rng.gauss(p.completion_tokens_mean, p.completion_tokens_sigma)))
+            error = self._rng.choice(p.error_codes) if p.error_codes and self._rng.random() < p.error_rate else None
+            words = [self._rng.choice(_FILLER_WORDS) for _ in range(min(tokens, 400))]
+            class_type = self._rng.choice(_CLASS_TYPES)
+        if max_tokens:
+            tokens = min(tokens, max_tokens)
+        return base + tokens * p.ms_per_token, tokens, error, words, class_type
+
+    def _handle(self, path, params, body):
+        if not path.endswith("/chat/completions") or not isinstance(body, dict):
+            return super()._handle(path, params, body)
+
+        messages = body.get("messages", [])
+        max_tokens = body.get("max_tokens")
+        delay_ms, tokens, error, words, class_type = self._draw(max_tokens)
+
+        with self._lock:
+            self.requests += 1
+            model = body.get("model", "stub")
+            self.by_model[model] = self.by_model.get(model, 0) + 1
+
+        streaming = bool(body.get("stream"))
+        generation_ms = tokens * self.profile.ms_per_token
+        # Потоковый ответ начинается после базовой задержки, токены идут по мере генерации
+        time.sleep((delay_ms - generation_ms if streaming else delay_ms) / 1000.0)
+
+        if error is not None:
+            with self._lock:
+                self.errors += 1
+            headers = {"Retry-After": str(self.profile.retry_after_seconds)} if error == 429 else {}
+            return error, headers, {"error": {"code": error, "message": "stub error"}}
+
+        prompt = _messages_text(messages)
+        content = _stub_content(prompt, words[:tokens], class_type)
+        cached_tokens = self._cached_prefix_tokens(messages)
+        if body.get("response_format", {}).get("type") == "json_schema" and content == class_type:
+            # Структурированный ответ классификации по схеме
+            content = json.dumps({"class": class_type})
+        prompt_tokens = max(1, len(prompt) // 3)
+
+        if streaming:
+            pieces = [content[i:i + 4] for i in range(0, len(content), 4)] or [""]
+            events = [{
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+            } for piece in pieces]
+            # Последнее событие несёт счётчики токенов, как у OpenRouter
+            events.append({
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": tokens,
+                    "total_tokens": prompt_tokens + tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens}
+                }
+            })
+            return 200, {}, _EventStream(events, generation_ms / 1000.0 / len(pieces))
+
+        return 200, {}, {
+            "id": f"gen-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": tokens,
+                "total_tokens": prompt_tokens + tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}
+            }
+        }
+
+    def _cached_prefix_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Кэш префиксов провайдера для системного сообщения.
+
+        С cache_control кэшируется часть до отметки включительно, и только при точном
+        совпадении. Без отметок - как автоматический кэш: самый длинный общий префикс
+        с прежними промптами, блоками по CACHE_BLOCK_CHARS символов.
+        """
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        content = messages[0].get("content")
+        marked = False
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                if not isinstance(part, dict):
+                    continue
+                parts.append(part.get("text", ""))
+                if part.get("cache_control"):
+                    marked = True
+                    break
+            text = "".join(parts)
+        else:
+            text = str(content or "")
+
+        with self._lock:
+            if marked:
+                cached = len(text) if text in self._cached_prefixes else 0
+            else:
+                longest = max((_common_prefix(text, seen) for seen in self._cached_prefixes), default=0)
+                cached = longest - longest % CACHE_BLOCK_CHARS
+            self._cached_prefixes.add(text)
+            tokens = cached // 3
+            self.cached_tokens += tokens
+        return tokens
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики заглушки."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "by_model": dict(self.by_model),
+                "cached_tokens": self.cached_tokens
+            }
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """Длина общего префикса строк."""
+    limit = min(len(a), len(b))
+    index = 0
+    while index < limit and a[index] == b[index]:
+        index += 1
+    return index
+
+
+def _messages_text(messages: List[Dict[str, Any]]) -> str:
+    """Склеить текст всех сообщений (включая content-массивы)."""
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(p.get("text", "") for p in content if isinstance(p, dict))
+    return "\n".join(parts)
+
+
+def _stub_content(prompt: str, words: List[str], class_type: str) -> str:
+    """Правдоподобный ответ по типу запроса."""
+    if "Опиши каждое" in prompt:
+        # Пакетный анализ изображений: описание для каждого пронумерованного изображения
+        count = len(re.findall(r"Изображение \d+:", prompt))
+        return json.dumps([
+            {"image": number, "description": " ".join(words[number - 1::count] or words) + "."}
+            for number in range(1, count + 1)
+        ], ensure_ascii=False)
+    if "Классифицируй каждый" in prompt:
+        # Пакетная классификация: класс для каждого id из списка комментариев
+        ids = re.findall(r'"id": "([^"<]+)"', prompt)
+        return json.dumps([
+            {"id": comment_id, "class": _CLASS_TYPES[zlib.crc32(comment_id.encode()) % len(_CLASS_TYPES)]}
+            for comment_id in ids
+        ])
+    if "Классифицируй" in prompt:
+        return class_type
+    if "Входные данные (Chinese)" in prompt:
+        # Манифест: рассказ на русском, без иероглифов
+        return " ".join(word for word in words if not "\u2e80" <= word[0] < "\ua000") + "."
+    if "JSON" in prompt:
+        return json.dumps({
+            "sentiment": "neutral",
+            "themes": words[:2],
+            "pressure": round(len(words) % 10 / 10.0, 1)
+        }, ensure_ascii=False)
+    return " ".join(words) + "."
+
+
+class VKStub(_StubServer):
+    """Эмулятор стены группы VK."""
+
+    def __init__(self, group_id: int, posts: int = 10, seed: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.group_id = abs(int(group_id))
+        self._rng = random.Random(seed)
+        self._next_id = 1
+        self._posts: List[Dict[str, Any]] = []
+        self._comments: Dict[int, List[Dict[str, Any]]] = {}
+        self.calls: Dict[str, int] = {}
+        self.replies: List[Dict[str, Any]] = []
+        self.published: List[Dict[str, Any]] = []
+        for _ in range(posts):
+            self.add_post("Манифест")
+
+    def _new_id(self) -> int:
+        value = self._next_id
+        self._next_id += 1
+        return value
+
+    def add_post(self, text: str) -> int:
+        """Создать пост от имени группы."""
+        with self._lock:
+            post_id = self._new_id()
+            self._posts.insert(0, {
+                "id": post_id,
+                "owner_id": -self.group_id,
+                "from_id": -self.group_id,
+                "date": int(time.time()),
+                "text": text
+            })
+            self._comments[post_id] = []
+            return post_id
+
+    def post_ids(self) -> List[int]:
+        """Идентификаторы постов (новые первыми)."""
+        with self._lock:
+            return [p["id"] for p in self._posts]
+
+    def add_comment(
+        self,
+        post_id: int,
+        text: str,
+        from_id: int,
+        reply_to: Optional[int] = None,
+        attachments: Optional[List[Dict[str, Any]]] = None
+    ) -> int:
+        """Добавить комментарий (reply_to - ответ в ветке)."""
+        with self._lock:
+            comment_id = self._new_id()
+            comment = {
+                "id": comment_id,
+                "from_id": from_id,
+                "post_id": post_id,
+                "owner_id": -self.group_id,
+                "date": int(time.time()),
+                "text": text,
+                "attachments": attachments or [],
+                "parents_stack": [],
+                "thread": {"count": 0, "items": [], "can_post": True}
+            }
+            thread_root = self._thread_root(post_id, reply_to) if reply_to else None
+            if thread_root is not None:
+                comment["parents_stack"] = [thread_root["id"]]
+                comment["reply_to_comment"] = reply_to
+                thread_root["thread"]["items"].append(comment)
+                thread_root["thread"]["count"] += 1
+            else:
+                self._comments.setdefault(post_id, []).append(comment)
+            return comment_id
+
+    def _thread_root(self, post_id: int, comment_id: int) -> Optional[Dict[str, Any]]:
+        for comment in self._comments.get(post_id, []):
+            if comment["id"] == comment_id:
+                return comment
+            for reply in comment["thread"]["items"]:
+                if reply["id"] == comment_id:
+                    return comment
+        return None
+
+    def _handle(self, path, params, body):
+        method = path.rstrip("/").rsplit("/", 1)[-1]
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+        if not params.get("access_token"):
+            return 200, {}, {"error": {"error_code": 5, "error_msg": "User authorization failed"}}
+
+        handler = {
+            "wall.get": self._wall_get,
+            "wall.getComments": self._wall_get_comments,
+            "wall.createComment": self._wall_create_comment,
+            "wall.post": self._wall_post
+        }.get(method)
+
+        if handler is None:
+            return 200, {}, {"error": {"error_code": 3, "error_msg": "Unknown method passed"}}
+        return 200, {}, {"response": handler(params)}
+
+    def _wall_get(self, params):
+        offset = int(params.get("offset", 0))
+        count = min(100, int(params.get("count", 20)))
+        with self._lock:
+            items = [dict(p) for p in self._posts[offset:offset + count]]
+            for item in items:
+                item["comments"] = {"count": self._count_comments(item["id"])}
+            return {"count": len(self._posts), "items": items}
+
+    def _count_comments(self, post_id: int) -> int:
+        comments = self._comments.get(post_id, [])
+        return len(comments) + sum(c["thread"]["count"] for c in comments)
+
+    def _wall_get_comments(self, params):
+        post_id = int(params.get("post_id", 0))
+        offset = int(params.get("offset", 0))
+        count = min(100, int(params.get("count", 10)))
+        sort = params.get("sort", "asc")
+        thread_items_count = min(10, int(params.get("thread_items_count", 0)))
+        start_comment_id = params.get("start_comment_id")
+        parent_id = params.get("comment_id")
+
+        with self._lock:
+            if parent_id:
+                root = self._thread_root(post_id, int(parent_id))
+                source = list(root["thread"]["items"]) if root else []
+                thread_items_count = 0
+            else:
+                source = list(self._comments.get(post_id, []))
+
+            if sort == "desc":
+                source.reverse()
+
+            if start_comment_id:
+                start = int(start_comment_id)
+                ids = [c["id"] for c in source]
+                offset += ids.index(start) if start in ids else len(ids)
+
+            page = source[offset:offset + count]
+            items = []
+            for comment in page:
+                item = {k: v for k, v in comment.items() if k != "thread"}
+                thread = comment.get("thread", {"count": 0, "items": []})
+                item["thread"] = {
+                    "count": thread["count"],
+                    "items": [
+                        {k: v for k, v in r.items() if k != "thread"}
+                        for r in thread["items"][:thread_items_count]
+                    ],
+                    "can_post": True
+                }
+                items.append(item)
+
+            return {"count": len(source), "current_level_count": len(source), "items": items}
+
+    def _wall_create_comment(self, params):
+        post_id = int(params.get("post_id", 0))
+        reply_to = params.get("reply_to_comment")
+        comment_id = self.add_comment(
+            post_id,
+            params.get("message", ""),
+            from_id=-self.group_id,
+            reply_to=int(reply_to) if reply_to else None
+        )
+        with self._lock:
+            self.replies.append({
+                "comment_id": comment_id,
+                "post_id": post_id,
+                "reply_to_comment": int(reply_to) if reply_to else None,
+                "time": time.time()
+            })
+        return {"comment_id": comment_id}
+
+    def _wall_post(self, params):
+        post_id = self.add_post(params.get("message", ""))
+        with self._lock:
+            self.published.append({"post_id": post_id, "time": time.time()})
+        return {"post_id": post_id}
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики эмулятора."""
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "replies": len(self.replies),
+                "published": len(self.published)
+            }
@@ -0,0 +1,130 @@
+"""CLI для анализа сохранённых трасс.
+
+Примеры:
+    python -m solipsist.tools.traces slowest -n 10 --name comment
+    python -m solipsist.tools.traces show <trace_id>
+"""
+import argparse
+import sys
+from datetime import datetime
+from typing import List, Optional
+
+from ..config.loader import load_config
+from ..utils.tracing import Span, create_sink, critical_path, self_time_ms
+
+
+def _open_sink(args):
+    """Открыть приёмник по аргументам CLI или конфигурации."""
+    sink_type = args.sink
+    path = args.path
+
+    if not sink_type or not path:
+        try:
+            config = load_config(args.config)
+        except FileNotFoundError:
+            config = None
+        if config is not None:
+            sink_type = sink_type or config.get("tracing.sink", "sqlite")
+            path = path or config.get("tracing.path")
+
+    sink_type = sink_type or "sqlite"
+    if not path:
+        path = "memory/traces.ndjson" if sink_type == "ndjson" else "memory/traces.db"
+    return create_sink(sink_type, path)
+
+
+def _format_time(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def cmd_slowest(args) -> int:
+    """Показать самые медленные трассы."""
+    sink = _open_sink(args)
+    traces = sink.slowest(limit=args.limit, name=args.name)
+
+    if not traces:
+        print("No traces found")
+        return 0
+
+    print(f"{'duration_ms':>12}  {'name':<10} {'status':<6} {'spans':>5}  {'started':<19}  trace_id")
+    for t in traces:
+        print(
+            f"{t['duration_ms']:>12.1f}  {t['name']:<10} {t['status']:<6} {t['span_count']:>5}  "
+            f"{_format_time(t['start']):<19}  {t['trace_id']}"
+        )
+    return 0
+
+
+def _print_tree(spans: List[Span], node: Span, depth: int, marked: set):
+    root_ms = spans[0].duration_ms if spans else 0.0
+    marker = "*" if node.span_id in marked else " "
+    share = (node.duration_ms / root_ms * 100.0) if root_ms else 0.0
+    print(
+        f"{marker} {'  ' * depth}{node.name:<{max(1, 32 - 2 * depth)}} "
+        f"{node.duration_ms:>10.1f} ms {share:>5.1f}%  self {self_time_ms(node, spans):>9.1f} ms"
+        f"{'  [' + node.status + ']' if node.status != 'ok' else ''}"
+    )
+    for child in sorted((s for s in spans if s.parent_id == node.span_id), key=lambda s: s.start):
+        _print_tree(spans, child, depth + 1, marked)
+
+
+def cmd_show(args) -> int:
+    """Показать трассу и разбор её критического пути."""
+    sink = _open_sink(args)
+    spans = sink.load_trace(args.trace_id)
+
+    if not spans:
+        print(f"Trace {args.trace_id} not found")
+        return 1
+
+    path = critical_path(spans)
+    if not path:
+        print(f"Trace {args.trace_id} has no root span")
+        return 1
+
+    root = path[0]
+    ordered = [root] + [s for s in spans if s is not root]
+    print(f"Trace {root.trace_id}: {root.name}, {root.duration_ms:.1f} ms, started {_format_time(root.start)}")
+    if root.attributes:
+        print("  " + ", ".join(f"{k}={v}" for k, v in root.attributes.items()))
+    print()
+    print("Spans (* = on critical path):")
+    _print_tree(ordered, root, 0, {s.span_id for s in path})
+
+    print()
+    print("Critical path breakdown (self time):")
+    leaves = sorted(path, key=lambda s: self_time_ms(s, spans), reverse=True)
+    for s in leaves:
+        own = self_time_ms(s, spans)
+        if own <= 0.0:
+            continue
+        share = own / root.duration_ms * 100.0 if root.duration_ms else 0.0
+        attrs = ", ".join(f"{k}={v}" for k, v in s.attributes.items())
+        print(f"  {s.name:<32} {own:>10.1f} ms {share:>5.1f}%  {attrs}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа CLI."""
+    parser = argparse.ArgumentParser(description="Анализ трасс SolipsistBot")
+    parser.add_argument("--config", default=None, help="Путь к config.json")
+    parser.add_argument("--sink", choices=["sqlite", "ndjson"], default=None, help="Тип приёмника трасс")
+    parser.add_argument("--path", default=None, help="Путь к файлу трасс")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    slowest = subparsers.add_parser("slowest", help="Самые медленные трассы")
+    slowest.add_argument("-n", "--limit", type=int, default=20, help="Количество трасс")
+    slowest.add_argument("--name", default=None, help="Фильтр по типу трассы (comment, monologue, manifest)")
+    slowest.set_defaults(func=cmd_slowest)
+
+    show = subparsers.add_parser("show", help="Трасса и её критический путь")
+    show.add_argument("trace_id", help="Идентификатор трассы")
+    show.set_defaults(func=cmd_show)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
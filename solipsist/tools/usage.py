@@ -0,0 +1,81 @@
+"""CLI для просмотра журнала использования LLM.
+
+Примеры:
+    python -m solipsist.tools.usage hourly --hours 12
+    python -m solipsist.tools.usage daily --days 7
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from ..config.loader import load_config
+from ..storage.usage import UsageLedger
+
+
+def _open_ledger(args) -> UsageLedger:
+    """Открыть журнал по аргументам CLI или конфигурации."""
+    path = args.path
+    if not path:
+        try:
+            config = load_config(args.config)
+        except FileNotFoundError:
+            config = None
+        if config is not None:
+            path = config.get("usage.path")
+    return UsageLedger(path or "memory/usage.db")
+
+
+def _print_rollups(rows: List[Dict[str, Any]]) -> int:
+    if not rows:
+        print("No usage recorded")
+        return 0
+
+    print(
+        f"{'bucket':<13}  {'role':<20} {'model':<32} {'requests':>8} {'errors':>6} "
+        f"{'prompt':>9} {'cached':>8} {'completion':>10} {'avg_ms':>8} {'cost_usd':>9}"
+    )
+    for row in rows:
+        avg_ms = row["latency_ms"] / row["requests"] if row["requests"] else 0.0
+        print(
+            f"{row['bucket']:<13}  {row['role']:<20} {row['model']:<32} {row['requests']:>8} {row['errors']:>6} "
+            f"{row['prompt_tokens']:>9} {row['cached_tokens']:>8} {row['completion_tokens']:>10} "
+            f"{avg_ms:>8.0f} {row['cost']:>9.4f}"
+        )
+    return 0
+
+
+def cmd_hourly(args) -> int:
+    """Показать сводки по часам."""
+    since = datetime.now(timezone.utc) - timedelta(hours=args.hours)
+    return _print_rollups(_open_ledger(args).rollups("hour", since=since))
+
+
+def cmd_daily(args) -> int:
+    """Показать сводки по дням."""
+    since = datetime.now(timezone.utc) - timedelta(days=args.days)
+    return _print_rollups(_open_ledger(args).rollups("day", since=since))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа CLI."""
+    parser = argparse.ArgumentParser(description="Журнал использования LLM SolipsistBot")
+    parser.add_argument("--config", default=None, help="Путь к config.json")
+    parser.add_argument("--path", default=None, help="Путь к базе журнала")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    hourly = subparsers.add_parser("hourly", help="Сводки по часам (UTC)")
+    hourly.add_argument("--hours", type=int, default=24, help="За сколько последних часов")
+    hourly.set_defaults(func=cmd_hourly)
+
+    daily = subparsers.add_parser("daily", help="Сводки по дням (UTC)")
+    daily.add_argument("--days", type=int, default=7, help="За сколько последних дней")
+    daily.set_defaults(func=cmd_daily)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
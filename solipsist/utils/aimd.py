@@ -0,0 +1,126 @@
+"""Подстройка числа параллельных запросов к LLM (AIMD).
+
+Лимит шлюза растёт на increase за каждые limit успешных запросов, пока шлюз
+загружен полностью (иначе рост ничего не даёт), и умножается на decrease при
+перегрузке: ответ 429 или 5xx, таймаут или всплеск задержки. Всплеск - задержка
+больше spike_factor базовой (скользящего среднего по модели и режиму запроса).
+Снижения не чаще раза в cooldown секунд: ответы, начатые до снижения, не
+должны снижать лимит повторно.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .priority import PriorityGate
+
+logger = logging.getLogger(__name__)
+
+# Вес нового наблюдения в базовой задержке
+_BASELINE_ALPHA = 0.1
+# Наблюдений, после которых базовая задержка считается установившейся
+_BASELINE_WARMUP = 5
+
+
+class AIMDController:
+    """Аддитивный рост и мультипликативное снижение лимита шлюза."""
+
+    def __init__(
+        self,
+        gate: PriorityGate,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        increase: int = 1,
+        decrease: float = 0.5,
+        spike_factor: float = 3.0,
+        cooldown: float = 5.0
+    ):
+        self.gate = gate
+        # Ниже reserve + 1 фоновым запросам не осталось бы мест, а без их запросов
+        # шлюз может не загрузиться полностью, и лимит не вырастет обратно
+        self.min_limit = max(1, min_limit, gate.reserve + 1)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.spike_factor = spike_factor
+        self.cooldown = cooldown
+
+        self._successes = 0
+        self._last_decrease: Optional[float] = None
+        self._baselines: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self._counters = {"increases": 0, "decreases": 0, "overloads": 0, "latency_spikes": 0}
+        self._lock = threading.Lock()
+
+        gate.set_limit(min(self.max_limit, max(self.min_limit, gate.limit)))
+
+    def on_success(self, key: str, latency: float, in_flight: int):
+        """Учесть успешный ответ: key - модель и режим запроса, in_flight - запросов в работе (с этим)."""
+        with self._lock:
+            baseline = self._baselines.get(key)
+            samples = self._samples.get(key, 0)
+            self._samples[key] = samples + 1
+
+            if baseline is not None and samples >= _BASELINE_WARMUP and latency > baseline * self.spike_factor:
+                # Всплеск не входит в базовую задержку, иначе она подтянется к перегрузке
+                self._counters["latency_spikes"] += 1
+                self._decrease(f"latency {latency:.1f}s vs baseline {baseline:.1f}s for {key}")
+                return
+
+            self._baselines[key] = latency if baseline is None else baseline + _BASELINE_ALPHA * (latency - baseline)
+
+            limit = self.gate.limit
+            if in_flight < limit or limit >= self.max_limit:
+                return
+            self._successes += 1
+            if self._successes >= limit:
+                self._successes = 0
+                self.gate.set_limit(min(self.max_limit, limit + self.increase))
+                self._counters["increases"] += 1
+                logger.debug(f"LLM concurrency limit raised to {self.gate.limit}")
+
+    def on_overload(self, reason: str, retry_after: Optional[float] = None):
+        """Учесть перегрузку (429, 5xx, таймаут); retry_after - пауза, которую просит сервер."""
+        if retry_after:
+            self.gate.pause(retry_after)
+        with self._lock:
+            self._counters["overloads"] += 1
+            self._decrease(reason)
+
+    def _decrease(self, reason: str):
+        """Снизить лимит (вызывается под _lock)."""
+        self._successes = 0
+        now = time.monotonic()
+        if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+
+        limit = self.gate.limit
+        new_limit = max(self.min_limit, int(limit * self.decrease))
+        if new_limit < limit:
+            self.gate.set_limit(new_limit)
+            self._counters["decreases"] += 1
+            logger.warning(f"LLM concurrency limit cut {limit} -> {new_limit}: {reason}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущий лимит и счётчики изменений."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+        stats["limit"] = self.gate.limit
+        stats["min_limit"] = self.min_limit
+        stats["max_limit"] = self.max_limit
+        return stats
+
+
+_controllers: Dict[int, AIMDController] = {}
+_controllers_lock = threading.Lock()
+
+
+def shared_controller(gate: PriorityGate, **kwargs) -> AIMDController:
+    """Регулятор шлюза gate (один на шлюз, создаётся при первом обращении)."""
+    with _controllers_lock:
+        controller = _controllers.get(id(gate))
+        if controller is None:
+            controller = AIMDController(gate, **kwargs)
+            _controllers[id(gate)] = controller
+        return controller
@@ -0,0 +1,109 @@
+"""Общий цикл событий процесса для асинхронных клиентов и синхронные обёртки над ними.
+
+Асинхронные клиенты OpenRouter и VK держат все запросы процесса на одном цикле
+событий в отдельном потоке: сотни запросов в работе не занимают по потоку каждый.
+SyncAdapter даёт синхронному коду (пайплайну комментариев, планировщику) те же
+методы: вызов корутины отправляется в общий цикл, поток ждёт только результата.
+Контекст вызывающего потока (дедлайн, класс приоритета, трасса) переходит в корутину.
+
+Код, который сам управляет циклом событий (asyncio.run), перед его закрытием
+вызывает close_client_sessions - сессии общего цикла закрываются при выходе из процесса.
+"""
+import asyncio
+import atexit
+import inspect
+import threading
+import weakref
+from typing import Any, Awaitable, Dict, Optional
+
+import aiohttp
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+# Сессии aiohttp по циклам и именам: сессия привязана к циклу, в котором создана
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, aiohttp.ClientSession]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def shared_loop() -> asyncio.AbstractEventLoop:
+    """Цикл событий процесса (поток с ним запускается при первом обращении)."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="solipsist-aio", daemon=True)
+            _loop_thread.start()
+            atexit.register(_shutdown)
+        return _loop
+
+
+def run_sync(awaitable: Awaitable) -> Any:
+    """Выполнить корутину в общем цикле и дождаться результата в текущем потоке."""
+    loop = shared_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("run_sync called from the shared event loop thread, await the coroutine instead")
+    # run_coroutine_threadsafe запускает задачу в копии контекста текущего потока
+    return asyncio.run_coroutine_threadsafe(awaitable, loop).result()
+
+
+def shared_client_session(name: str, pool_size: int = 10) -> aiohttp.ClientSession:
+    """Сессия aiohttp с пулом соединений, общая для всех клиентов с этим именем.
+
+    Вызывается внутри работающего цикла событий: у каждого цикла свои сессии.
+    """
+    sessions = _sessions.setdefault(asyncio.get_running_loop(), {})
+    session = sessions.get(name)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size))
+        sessions[name] = session
+    return session
+
+
+async def close_client_sessions():
+    """Закрыть сессии aiohttp текущего цикла событий."""
+    sessions = _sessions.pop(asyncio.get_running_loop(), {})
+    for session in sessions.values():
+        if not session.closed:
+            await session.close()
+
+
+def _shutdown():
+    """Закрыть сессии общего цикла и остановить его (при выходе из процесса)."""
+    loop = _loop
+    if loop is None or not loop.is_running():
+        return
+
+    try:
+        asyncio.run_coroutine_threadsafe(close_client_sessions(), loop).result(timeout=5)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+
+
+class SyncAdapter:
+    """Синхронный фасад асинхронного клиента.
+
+    Корутинные методы клиента выполняются в общем цикле событий (run_sync),
+    остальные атрибуты и методы отдаются как есть.
+    """
+
+    def __init__(self, client: Any):
+        self.client = client
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.client, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return run_sync(attr(*args, **kwargs))
+
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
+
+    def __repr__(self) -> str:
+        return f"SyncAdapter({self.client!r})"
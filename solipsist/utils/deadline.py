@@ -0,0 +1,66 @@
+"""Бюджет времени на обработку (дедлайн) в контексте потока.
+
+Дедлайн задаётся на блок кода (deadline) и виден всем вызовам внутри него:
+клиенты OpenRouter и VK берут таймаут запроса из оставшегося времени (timeout),
+этапы пайплайна проверяют его на своих границах (check). Вложенный дедлайн
+не может быть позже внешнего.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Запрос короче этого не имеет смысла начинать
+MIN_CALL_SECONDS = 1.0
+
+# Момент дедлайна (time.monotonic) текущего контекста
+_deadline: contextvars.ContextVar = contextvars.ContextVar("solipsist_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени исчерпан: оставшаяся работа отменяется."""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    """Ограничить блок seconds секундами (None - без собственного ограничения)."""
+    outer = _deadline.get()
+    at = outer
+    if seconds is not None:
+        at = time.monotonic() + max(0.0, seconds)
+        if outer is not None:
+            at = min(at, outer)
+
+    token = _deadline.set(at)
+    try:
+        yield at
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Сколько секунд осталось до дедлайна (None - дедлайна нет)."""
+    at = _deadline.get()
+    if at is None:
+        return None
+    return max(0.0, at - time.monotonic())
+
+
+def check(what: str = ""):
+    """Выбросить DeadlineExceeded, если бюджет исчерпан."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"deadline exceeded{' before ' + what if what else ''}")
+
+
+def timeout(default: float, what: str = "") -> float:
+    """Таймаут запроса: default, но не дольше оставшегося бюджета.
+
+    Если бюджета не хватает даже на короткий запрос, запрос не начинается.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left < MIN_CALL_SECONDS:
+        raise DeadlineExceeded(f"{left:.1f}s left{' for ' + what if what else ''}")
+    return min(default, left)
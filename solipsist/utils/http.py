@@ -0,0 +1,22 @@
+"""Общие HTTP-сессии процесса (пул соединений на хост)."""
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def shared_session(name: str, pool_size: int = 10) -> requests.Session:
+    """Сессия requests с пулом соединений, общая для всех клиентов с этим именем."""
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[name] = session
+        return session
@@ -0,0 +1,218 @@
+"""Общий на процесс бюджет параллельных запросов к LLM с классами приоритета.
+
+Все запросы к OpenRouter - ответы на комментарии, их восприятие и классификация,
+монологи, дайджест и манифесты - занимают места в одном шлюзе. Класс запроса
+берётся из контекста (llm_priority): пайплайн комментария и фоновые задачи
+задают его на свои блоки кода. Места занимают и потоки (acquire), и корутины
+асинхронных клиентов (acquire_async) - бюджет у них общий.
+
+Свободное место получает запрос самого срочного из ожидающих классов. Фоновые
+запросы ждут, пока в очереди есть интерактивные, и не занимают последние
+reserve мест: пришедший ответ на комментарий не стоит в очереди за монологом.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Классы приоритета: меньше - срочнее
+PRIORITY_REPLY = 0        # Генерация ответа на комментарий
+PRIORITY_INTERACTIVE = 1  # Восприятие и классификация комментариев
+PRIORITY_BACKGROUND = 2   # Монологи, дайджест, манифесты
+
+PRIORITY_NAMES = {
+    PRIORITY_REPLY: "reply",
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BACKGROUND: "background"
+}
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("solipsist_llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(level: int) -> Iterator[int]:
+    """Задать класс приоритета запросов к LLM внутри блока."""
+    token = _priority.set(level)
+    try:
+        yield level
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    """Класс приоритета запросов текущего контекста."""
+    return _priority.get()
+
+
+class PriorityGate:
+    """Не больше limit запросов одновременно; места - по приоритету классов."""
+
+    def __init__(self, limit: int, reserve: int = 1):
+        self.limit = max(1, int(limit))
+        # Мест, недоступных фоновым запросам
+        self.reserve = max(0, int(reserve))
+        self._in_flight = 0
+        self._waiting = {level: 0 for level in PRIORITY_NAMES}
+        self._acquired = {level: 0 for level in PRIORITY_NAMES}
+        self._wait_seconds = {level: 0.0 for level in PRIORITY_NAMES}
+        # До этого момента (time.monotonic) новые запросы не начинаются (Retry-After)
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        # Корутины, ждущие места: (цикл событий, future для пробуждения)
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _capacity(self, level: int) -> int:
+        if level >= PRIORITY_BACKGROUND:
+            # При limit <= reserve фоновые запросы ждут: все места - за интерактивными
+            return max(0, self.limit - self.reserve)
+        return self.limit
+
+    def _can_start(self, level: int) -> bool:
+        if time.monotonic() < self._paused_until:
+            return False
+        if self._in_flight >= self._capacity(level):
+            return False
+        # Место достаётся самому срочному из ожидающих
+        return not any(self._waiting.get(other) for other in PRIORITY_NAMES if other < level)
+
+    def _wait_time(self, deadline: Optional[float]) -> Optional[float]:
+        """Сколько ждать следующей проверки (None - без ограничения, <= 0 - время вышло)."""
+        now = time.monotonic()
+        wait = None if deadline is None else deadline - now
+        if wait is not None and wait <= 0:
+            return wait
+        if self._paused_until > now:
+            # Конец паузы никто не объявит - просыпаемся сами
+            wait = min(wait, self._paused_until - now) if wait is not None else self._paused_until - now
+        return wait
+
+    def _take(self, level: int, started: float):
+        self._in_flight += 1
+        self._acquired[level] = self._acquired.get(level, 0) + 1
+        self._wait_seconds[level] = self._wait_seconds.get(level, 0.0) + time.monotonic() - started
+
+    def _wake(self):
+        """Разбудить всех ожидающих - потоки и корутины (вызывается под _cond)."""
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                # Цикл событий уже закрыт - будить некого
+                pass
+
+    def acquire(self, level: int, timeout: Optional[float] = None) -> bool:
+        """Занять место для запроса класса level; False - не дождались за timeout секунд."""
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            self._waiting[level] = self._waiting.get(level, 0) + 1
+            try:
+                while not self._can_start(level):
+                    wait = self._wait_time(deadline)
+                    if wait is not None and wait <= 0:
+                        return False
+                    self._cond.wait(timeout=wait)
+
+                self._take(level, started)
+                return True
+            finally:
+                self._waiting[level] -= 1
+                # Уход ожидающего (с местом или по таймауту) может открыть путь менее срочным
+                self._wake()
+
+    async def acquire_async(self, level: int, timeout: Optional[float] = None) -> bool:
+        """acquire для корутин: ждёт места, не блокируя цикл событий."""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            self._waiting[level] = self._waiting.get(level, 0) + 1
+        try:
+            while True:
+                with self._cond:
+                    if self._can_start(level):
+                        self._take(level, started)
+                        return True
+                    wait = self._wait_time(deadline)
+                    if wait is not None and wait <= 0:
+                        return False
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+                try:
+                    await asyncio.wait([waiter], timeout=wait)
+                finally:
+                    with self._cond:
+                        if (loop, waiter) in self._async_waiters:
+                            self._async_waiters.remove((loop, waiter))
+        finally:
+            with self._cond:
+                self._waiting[level] -= 1
+                self._wake()
+
+    def release(self):
+        """Освободить место."""
+        with self._cond:
+            self._in_flight -= 1
+            self._wake()
+
+    @property
+    def in_flight(self) -> int:
+        """Запросов в работе."""
+        with self._cond:
+            return self._in_flight
+
+    def set_limit(self, limit: int):
+        """Изменить число мест (уже начатые запросы дорабатывают)."""
+        with self._cond:
+            self.limit = max(1, int(limit))
+            self._wake()
+
+    def pause(self, seconds: float):
+        """Не начинать новых запросов seconds секунд."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def paused_for(self) -> float:
+        """Сколько секунд ещё длится пауза."""
+        with self._cond:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def stats(self) -> Dict[str, Any]:
+        """Занятые места, очередь и среднее ожидание по классам."""
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "paused_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+                "waiting": {PRIORITY_NAMES[level]: count for level, count in self._waiting.items()},
+                "acquired": {PRIORITY_NAMES[level]: count for level, count in self._acquired.items()},
+                "mean_wait_ms": {
+                    PRIORITY_NAMES[level]: (
+                        self._wait_seconds[level] / self._acquired[level] * 1000.0 if self._acquired[level] else 0.0
+                    )
+                    for level in PRIORITY_NAMES
+                }
+            }
+
+
+def _resolve(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_gates: Dict[str, PriorityGate] = {}
+_gates_lock = threading.Lock()
+
+
+def shared_gate(key: str, limit: int, reserve: int = 1) -> PriorityGate:
+    """Шлюз процесса для ключа (создаётся при первом обращении)."""
+    with _gates_lock:
+        gate = _gates.get(key)
+        if gate is None:
+            gate = PriorityGate(limit, reserve)
+            _gates[key] = gate
+        return gate
@@ -0,0 +1,193 @@
+"""Структурированные (JSON) ответы LLM: потоковый разбор и проверка по схеме.
+
+IncrementalJSONParser разбирает ответ по мере поступления токенов: поля объекта
+верхнего уровня (или элементы массива) доступны, как только закончилось их
+значение, и каждое разбирается отдельно - испорченное поле не портит остальные.
+
+validate проверяет значение по подмножеству JSON Schema, которое используют
+промпты бота: type, enum, properties, required, items, minimum/maximum,
+minItems/maxItems, minLength. Ошибки собираются по полям верхнего уровня, чтобы
+повторно запрашивать только невалидные поля.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None)
+}
+
+
+class IncrementalJSONParser:
+    """Разбор JSON-объекта или массива из потока текста.
+
+    Текст до первой '{' или '[' (пояснения, ```json) пропускается, текст после
+    закрытия контейнера верхнего уровня - тоже.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.items: List[Any] = []
+        # Члены контейнера, которые не разобрались как JSON
+        self.broken: List[str] = []
+        self.container: Optional[str] = None
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member: List[str] = []
+
+    def feed(self, text: str) -> bool:
+        """Добавить фрагмент ответа; True - контейнер верхнего уровня закрыт."""
+        for ch in text:
+            if self.done:
+                break
+
+            if self.container is None:
+                if ch in "{[":
+                    self.container = ch
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._member.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_member()
+                    self.done = True
+                    continue
+            elif ch == "," and self._depth == 1:
+                self._finish_member()
+                continue
+            self._member.append(ch)
+
+        return self.done
+
+    def _finish_member(self):
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return
+        try:
+            if self.container == "{":
+                self.fields.update(json.loads("{" + text + "}"))
+            else:
+                self.items.append(json.loads(text))
+        except json.JSONDecodeError:
+            self.broken.append(text)
+
+    def result(self) -> Optional[Any]:
+        """Разобранное значение: словарь полей, список элементов или None."""
+        if self.container == "{":
+            return self.fields
+        if self.container == "[":
+            return self.items
+        return None
+
+
+def parse_json(text: str) -> Optional[Any]:
+    """Разобрать JSON из полного ответа модели (с пояснениями вокруг или без)."""
+    parser = IncrementalJSONParser()
+    parser.feed(text or "")
+    return parser.result()
+
+
+def validate(value: Any, schema: Dict[str, Any], path: str = "") -> List[str]:
+    """Ошибки значения относительно схемы (пустой список - значение валидно)."""
+    where = path or "value"
+    expected = schema.get("type")
+    if expected is not None and not _is_type(value, expected):
+        return [f"{where}: expected {expected}, got {type(value).__name__}"]
+
+    errors: List[str] = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{where}: {value!r} is not one of {schema['enum']}")
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{where}: {value} < {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{where}: {value} > {schema['maximum']}")
+
+    if isinstance(value, str) and len(value) < schema.get("minLength", 0):
+        errors.append(f"{where}: shorter than {schema['minLength']}")
+
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{where}: fewer than {schema['minItems']} items")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append(f"{where}: more than {schema['maxItems']} items")
+        if "items" in schema:
+            for index, item in enumerate(value):
+                errors.extend(validate(item, schema["items"], f"{path}[{index}]"))
+
+    if isinstance(value, dict):
+        for problems in invalid_fields(value, schema, path).values():
+            errors.extend(problems)
+
+    return errors
+
+
+def invalid_fields(data: Dict[str, Any], schema: Dict[str, Any], path: str = "") -> Dict[str, List[str]]:
+    """Ошибки объекта по полям верхнего уровня (включая отсутствующие обязательные)."""
+    errors: Dict[str, List[str]] = {}
+    properties = schema.get("properties", {})
+
+    for name in schema.get("required", []):
+        if name not in data:
+            errors[name] = [f"{_join(path, name)}: missing"]
+
+    for name, value in data.items():
+        if name in properties:
+            problems = validate(value, properties[name], _join(path, name))
+            if problems:
+                errors[name] = problems
+
+    return errors
+
+
+def valid_fields(data: Dict[str, Any], schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Поля объекта, описанные в схеме и прошедшие проверку."""
+    properties = schema.get("properties", {})
+    invalid = invalid_fields(data, schema)
+    return {name: value for name, value in data.items() if name in properties and name not in invalid}
+
+
+def subschema(schema: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Схема объекта только с полями fields (для повторного запроса невалидных полей)."""
+    properties = schema.get("properties", {})
+    result = dict(schema)
+    result["properties"] = {name: properties[name] for name in fields if name in properties}
+    result["required"] = [name for name in schema.get("required", []) if name in fields]
+    return result
+
+
+def _is_type(value: Any, expected: Any) -> bool:
+    if isinstance(expected, list):
+        return any(_is_type(value, option) for option in expected)
+    if expected == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    python_type = _TYPES.get(expected)
+    return python_type is None or isinstance(value, python_type)
+
+
+def _join(path: str, name: str) -> str:
+    return f"{path}.{name}" if path else name
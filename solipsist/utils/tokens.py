@@ -0,0 +1,146 @@
+"""Оценка размера текста в токенах и подгонка контекста под бюджет.
+
+Точный подсчёт зависит от токенизатора модели, поэтому оценка грубая и
+с запасом: иероглиф - около токена, кириллица - около трёх символов на токен,
+латиница и цифры - около четырёх.
+"""
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from .stats import percentile
+
+# Символов на токен по группам символов
+_CHARS_PER_TOKEN_LATIN = 4.0
+_CHARS_PER_TOKEN_CYRILLIC = 3.0
+_CHARS_PER_TOKEN_CJK = 1.0
+
+TRUNCATION_MARK = "…"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Оценка числа токенов в тексте."""
+    if not text:
+        return 0
+
+    latin = cyrillic = cjk = 0
+    for ch in text:
+        code = ord(ch)
+        if code < 0x0400:
+            latin += 1
+        elif code < 0x0530:
+            cyrillic += 1
+        elif 0x2E80 <= code < 0xA000 or 0xAC00 <= code < 0xD7B0 or 0xF900 <= code < 0xFB00 or 0xFF00 <= code < 0xFFF0:
+            cjk += 1
+        else:
+            latin += 1
+
+    tokens = (
+        latin / _CHARS_PER_TOKEN_LATIN
+        + cyrillic / _CHARS_PER_TOKEN_CYRILLIC
+        + cjk / _CHARS_PER_TOKEN_CJK
+    )
+    return max(1, math.ceil(tokens))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Обрезать текст примерно до max_tokens токенов (по границе слова, если она недалеко)."""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    # Бинарный поиск длины префикса, укладывающегося в бюджет вместе с отметкой
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle] + TRUNCATION_MARK) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+
+    cut = text[:low]
+    space = cut.rfind(" ")
+    if space > len(cut) * 0.8:
+        cut = cut[:space]
+    return cut.rstrip() + TRUNCATION_MARK
+
+
+def fit_tokens(items: List[str], budget: int) -> List[str]:
+    """Уложить тексты в общий бюджет, обрезая самые длинные.
+
+    Каждому тексту достаётся равная доля бюджета; то, что не израсходовали
+    короткие тексты, делится между длинными. Порядок текстов сохраняется,
+    ни один текст не выбрасывается целиком, пока на него хватает хотя бы токена.
+    """
+    sizes = [estimate_tokens(item) for item in items]
+    if sum(sizes) <= budget:
+        return list(items)
+
+    limits = [0] * len(items)
+    left = max(0, budget)
+    pending = sorted(range(len(items)), key=lambda index: sizes[index])
+    while pending:
+        share = left // len(pending)
+        index = pending[0]
+        if sizes[index] <= share:
+            limits[index] = sizes[index]
+            left -= sizes[index]
+            pending.pop(0)
+            continue
+        # Оставшиеся тексты длиннее равной доли - все получают её
+        for index in pending:
+            limits[index] = share
+        break
+
+    return [item if sizes[i] <= limits[i] else truncate_tokens(item, limits[i]) for i, item in enumerate(items)]
+
+
+class OutputLengths:
+    """Наблюдаемые длины ответов по ролям для адаптивного max_tokens.
+
+    Пока наблюдений меньше min_samples, используется заданный предел. Потом -
+    перцентиль quantile длин ответов с запасом headroom, но не больше предела:
+    так редкий разросшийся ответ не удлиняет хвост задержки, а обычный - не обрезается.
+    """
+
+    def __init__(
+        self,
+        window: int = 200,
+        min_samples: int = 20,
+        quantile: float = 95.0,
+        headroom: float = 1.5,
+        floor: int = 64
+    ):
+        self.window = window
+        self.min_samples = min_samples
+        # Оценка длины грубая: меньше floor предел не опускается
+        self.floor = floor
+        self.quantile = quantile
+        self.headroom = headroom
+        self._lengths: Dict[str, Deque[int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, role: str, tokens: int):
+        """Учесть длину ответа роли role."""
+        with self._lock:
+            self._lengths.setdefault(role, deque(maxlen=self.window)).append(tokens)
+
+    def max_tokens(self, role: str, limit: int) -> int:
+        """max_tokens для следующего запроса роли role (не больше limit)."""
+        with self._lock:
+            lengths = list(self._lengths.get(role, ()))
+        if len(lengths) < self.min_samples:
+            return limit
+        suggested = math.ceil(percentile(lengths, self.quantile) * self.headroom)
+        return max(min(self.floor, limit), min(limit, suggested))
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Число наблюдений и перцентиль длины ответа по ролям."""
+        with self._lock:
+            snapshot = {role: list(lengths) for role, lengths in self._lengths.items()}
+        return {
+            role: {"samples": len(lengths), f"p{self.quantile:g}": percentile(lengths, self.quantile)}
+            for role, lengths in snapshot.items()
+        }
@@ -0,0 +1,588 @@
+"""Лёгкая трассировка обработки комментариев и фоновых задач.
+
+Трасса открывается на комментарий (или задачу монолога/манифеста), внутри неё
+вложенные отрезки (spans) покрывают вызовы OpenRouter, VK и записи в БД.
+Отрезки копятся в памяти и пишутся в приёмник одним пакетом при закрытии трассы.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    """Отрезок работы внутри трассы."""
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    start: float  # Unix time, секунды
+    duration_ms: float = 0.0
+    status: str = "ok"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def end(self) -> float:
+        """Момент окончания отрезка (Unix time, секунды)."""
+        return self.start + self.duration_ms / 1000.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразовать в словарь."""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Span":
+        """Создать из словаря."""
+        return cls(
+            trace_id=data["trace_id"],
+            span_id=data["span_id"],
+            parent_id=data.get("parent_id"),
+            name=data["name"],
+            start=data["start"],
+            duration_ms=data.get("duration_ms", 0.0),
+            status=data.get("status", "ok"),
+            attributes=data.get("attributes") or {}
+        )
+
+
+class _TraceBuffer:
+    """Накопитель отрезков одной трассы."""
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+
+# Текущая трасса и отрезок (у каждого потока свой контекст)
+_current: contextvars.ContextVar = contextvars.ContextVar("solipsist_trace", default=None)
+
+
+class SQLiteTraceSink:
+    """Приёмник трасс в отдельной SQLite базе."""
+
+    def __init__(self, db_path: str):
+        """Инициализация приёмника."""
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_database()
+
+    def _init_database(self):
+        """Инициализировать таблицы трасс."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS traces (
+                trace_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                start REAL NOT NULL,
+                duration_ms REAL NOT NULL,
+                status TEXT NOT NULL,
+                span_count INTEGER NOT NULL,
+                attributes TEXT
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_traces_duration ON traces (duration_ms)")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS spans (
+                span_id TEXT PRIMARY KEY,
+                trace_id TEXT NOT NULL,
+                parent_id TEXT,
+                name TEXT NOT NULL,
+                start REAL NOT NULL,
+                duration_ms REAL NOT NULL,
+                status TEXT NOT NULL,
+                attributes TEXT
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_spans_trace ON spans (trace_id)")
+
+        conn.commit()
+        conn.close()
+
+    def write(self, spans: List[Span]):
+        """Записать трассу целиком одной транзакцией."""
+        root = _find_root(spans)
+        if root is None:
+            return
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT OR REPLACE INTO traces
+            (trace_id, name, start, duration_ms, status, span_count, attributes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            root.trace_id,
+            root.name,
+            root.start,
+            root.duration_ms,
+            _trace_status(spans),
+            len(spans),
+            json.dumps(root.attributes, ensure_ascii=False, default=str)
+        ))
+        cursor.executemany("""
+            INSERT OR REPLACE INTO spans
+            (span_id, trace_id, parent_id, name, start, duration_ms, status, attributes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (
+                s.span_id, s.trace_id, s.parent_id, s.name, s.start, s.duration_ms, s.status,
+                json.dumps(s.attributes, ensure_ascii=False, default=str)
+            )
+            for s in spans
+        ])
+
+        conn.commit()
+        conn.close()
+
+    def slowest(self, limit: int = 20, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Получить самые медленные трассы."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        query = "SELECT trace_id, name, start, duration_ms, status, span_count, attributes FROM traces"
+        params: list = []
+        if name:
+            query += " WHERE name = ?"
+            params.append(name)
+        query += " ORDER BY duration_ms DESC LIMIT ?"
+        params.append(limit)
+
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [
+            {
+                "trace_id": row[0],
+                "name": row[1],
+                "start": row[2],
+                "duration_ms": row[3],
+                "status": row[4],
+                "span_count": row[5],
+                "attributes": json.loads(row[6]) if row[6] else {}
+            }
+            for row in rows
+        ]
+
+    def load_trace(self, trace_id: str) -> List[Span]:
+        """Загрузить все отрезки трассы."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT trace_id, span_id, parent_id, name, start, duration_ms, status, attributes
+            FROM spans
+            WHERE trace_id = ?
+            ORDER BY start ASC
+        """, (trace_id,))
+
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [
+            Span(
+                trace_id=row[0],
+                span_id=row[1],
+                parent_id=row[2],
+                name=row[3],
+                start=row[4],
+                duration_ms=row[5],
+                status=row[6],
+                attributes=json.loads(row[7]) if row[7] else {}
+            )
+            for row in rows
+        ]
+
+
+class NDJSONTraceSink:
+    """Приёмник трасс в NDJSON файле (одна строка на трассу)."""
+
+    def __init__(self, path: str):
+        """Инициализация приёмника."""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def write(self, spans: List[Span]):
+        """Дописать трассу в файл."""
+        root = _find_root(spans)
+        if root is None:
+            return
+
+        record = {
+            "trace_id": root.trace_id,
+            "name": root.name,
+            "start": root.start,
+            "duration_ms": root.duration_ms,
+            "status": _trace_status(spans),
+            "span_count": len(spans),
+            "attributes": root.attributes,
+            "spans": [s.to_dict() for s in spans]
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str)
+
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _records(self) -> Iterator[Dict[str, Any]]:
+        """Прочитать все записи файла."""
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def slowest(self, limit: int = 20, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Получить самые медленные трассы."""
+        records = [
+            {k: v for k, v in record.items() if k != "spans"}
+            for record in self._records()
+            if not name or record.get("name") == name
+        ]
+        records.sort(key=lambda r: r.get("duration_ms", 0.0), reverse=True)
+        return records[:limit]
+
+    def load_trace(self, trace_id: str) -> List[Span]:
+        """Загрузить все отрезки трассы."""
+        for record in self._records():
+            if record.get("trace_id") == trace_id:
+                spans = [Span.from_dict(s) for s in record.get("spans", [])]
+                spans.sort(key=lambda s: s.start)
+                return spans
+        return []
+
+
+class MemoryTraceSink:
+    """Приёмник трасс в памяти (для replay и нагрузочных прогонов)."""
+
+    def __init__(self):
+        """Инициализация приёмника."""
+        self.traces: List[List[Span]] = []
+        self._lock = threading.Lock()
+
+    def write(self, spans: List[Span]):
+        """Сохранить трассу."""
+        with self._lock:
+            self.traces.append(list(spans))
+
+    def spans_by_name(self) -> Dict[str, List[float]]:
+        """Длительности отрезков (мс), сгруппированные по имени."""
+        result: Dict[str, List[float]] = {}
+        with self._lock:
+            for spans in self.traces:
+                for s in spans:
+                    result.setdefault(s.name, []).append(s.duration_ms)
+        return result
+
+    def slowest(self, limit: int = 20, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Получить самые медленные трассы."""
+        with self._lock:
+            roots = [(_find_root(spans), spans) for spans in self.traces]
+        records = [
+            {
+                "trace_id": root.trace_id,
+                "name": root.name,
+                "start": root.start,
+                "duration_ms": root.duration_ms,
+                "status": _trace_status(spans),
+                "span_count": len(spans),
+                "attributes": root.attributes
+            }
+            for root, spans in roots
+            if root is not None and (not name or root.name == name)
+        ]
+        records.sort(key=lambda r: r["duration_ms"], reverse=True)
+        return records[:limit]
+
+    def load_trace(self, trace_id: str) -> List[Span]:
+        """Загрузить все отрезки трассы."""
+        with self._lock:
+            for spans in self.traces:
+                if spans and spans[0].trace_id == trace_id:
+                    return sorted(spans, key=lambda s: s.start)
+        return []
+
+
+class Tracer:
+    """Трассировщик с выборкой на уровне трассы."""
+
+    def __init__(
+        self,
+        sink: Optional[Any] = None,
+        sample_rate: float = 1.0,
+        slow_threshold_ms: Optional[float] = None
+    ):
+        """Инициализация трассировщика.
+
+        sample_rate - доля трасс, записываемых всегда;
+        slow_threshold_ms - трассы дольше порога записываются вне зависимости от выборки.
+        """
+        self.sink = sink
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.slow_threshold_ms = slow_threshold_ms
+
+    @property
+    def enabled(self) -> bool:
+        """Включена ли трассировка."""
+        return self.sink is not None
+
+    @contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Открыть трассу (внутри уже открытой трассы - вложенный отрезок)."""
+        if _current.get() is not None:
+            with self.span(name, **attributes) as s:
+                yield s
+            return
+
+        if not self.enabled:
+            yield None
+            return
+
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_threshold_ms is None:
+            yield None
+            return
+
+        buffer = _TraceBuffer(uuid.uuid4().hex, sampled)
+        root = Span(
+            trace_id=buffer.trace_id,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=None,
+            name=name,
+            start=time.time(),
+            attributes=dict(attributes)
+        )
+
+        token = _current.set((buffer, root))
+        started = time.perf_counter()
+        try:
+            yield root
+        except BaseException as e:
+            root.status = "error"
+            root.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            root.duration_ms = (time.perf_counter() - started) * 1000.0
+            _current.reset(token)
+            buffer.add(root)
+            self._finish(buffer, root)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Открыть вложенный отрезок в текущей трассе (без трассы ничего не делает)."""
+        current = _current.get()
+        if current is None:
+            yield None
+            return
+
+        buffer, parent = current
+        s = Span(
+            trace_id=buffer.trace_id,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id,
+            name=name,
+            start=time.time(),
+            attributes=dict(attributes)
+        )
+
+        token = _current.set((buffer, s))
+        started = time.perf_counter()
+        try:
+            yield s
+        except BaseException as e:
+            s.status = "error"
+            s.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            s.duration_ms = (time.perf_counter() - started) * 1000.0
+            _current.reset(token)
+            buffer.add(s)
+
+    def _finish(self, buffer: _TraceBuffer, root: Span):
+        """Записать трассу, если она попала в выборку или оказалась медленной."""
+        slow = self.slow_threshold_ms is not None and root.duration_ms >= self.slow_threshold_ms
+        if not (buffer.sampled or slow):
+            return
+
+        try:
+            self.sink.write(buffer.spans)
+        except Exception as e:
+            logger.warning(f"Failed to write trace {buffer.trace_id}: {e}")
+
+
+# Глобальный трассировщик (по умолчанию выключен)
+_tracer = Tracer()
+
+
+def create_sink(sink_type: str, path: str):
+    """Создать приёмник трасс по типу ("sqlite" или "ndjson")."""
+    if sink_type == "ndjson":
+        return NDJSONTraceSink(path)
+    return SQLiteTraceSink(path)
+
+
+def configure_tracing(config) -> Tracer:
+    """Настроить глобальный трассировщик по секции tracing конфигурации."""
+    global _tracer
+
+    if not config.get("tracing.enabled", False):
+        _tracer = Tracer()
+        return _tracer
+
+    sink_type = config.get("tracing.sink", "sqlite")
+    default_path = "memory/traces.ndjson" if sink_type == "ndjson" else "memory/traces.db"
+    sink = create_sink(sink_type, config.get("tracing.path", default_path))
+
+    _tracer = Tracer(
+        sink=sink,
+        sample_rate=config.get("tracing.sample_rate", 0.1),
+        slow_threshold_ms=config.get("tracing.slow_threshold_ms", 15000)
+    )
+    logger.info(f"Tracing enabled ({sink_type}, sample_rate={_tracer.sample_rate})")
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    """Заменить глобальный трассировщик."""
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer() -> Tracer:
+    """Получить глобальный трассировщик."""
+    return _tracer
+
+
+def trace(name: str, **attributes):
+    """Открыть трассу в глобальном трассировщике."""
+    return _tracer.trace(name, **attributes)
+
+
+def span(name: str, **attributes):
+    """Открыть вложенный отрезок в глобальном трассировщике."""
+    return _tracer.span(name, **attributes)
+
+
+def annotate(**attributes):
+    """Добавить атрибуты к текущему отрезку (если трасса открыта)."""
+    current = _current.get()
+    if current is not None:
+        current[1].attributes.update(attributes)
+
+
+def current_trace_id() -> Optional[str]:
+    """Идентификатор текущей трассы."""
+    current = _current.get()
+    return current[0].trace_id if current is not None else None
+
+
+def traced(name: str) -> Callable:
+    """Декоратор: обернуть вызов функции в отрезок."""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            # Отрезок покрывает выполнение корутины, а не только её создание
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _current.get() is None:
+                    return await func(*args, **kwargs)
+                with _tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with _tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _find_root(spans: List[Span]) -> Optional[Span]:
+    """Найти корневой отрезок трассы."""
+    for s in spans:
+        if s.parent_id is None:
+            return s
+    return None
+
+
+def _trace_status(spans: List[Span]) -> str:
+    """Итоговый статус трассы."""
+    return "error" if any(s.status == "error" for s in spans) else "ok"
+
+
+def critical_path(spans: List[Span]) -> List[Span]:
+    """Построить критический путь трассы.
+
+    От конца корня идём назад: берём дочерний отрезок, закончившийся последним,
+    затем тот, что закончился последним до его начала, и т.д. рекурсивно.
+    """
+    root = _find_root(spans)
+    if root is None:
+        return []
+
+    children: Dict[str, List[Span]] = {}
+    for s in spans:
+        if s.parent_id is not None:
+            children.setdefault(s.parent_id, []).append(s)
+
+    def walk(node: Span) -> List[Span]:
+        path = [node]
+        kids = sorted(children.get(node.span_id, []), key=lambda s: s.end, reverse=True)
+        chain: List[Span] = []
+        boundary = node.end
+        for kid in kids:
+            if kid.end <= boundary + 1e-6:
+                chain.append(kid)
+                boundary = kid.start
+        for kid in reversed(chain):
+            path.extend(walk(kid))
+        return path
+
+    return walk(root)
+
+
+def self_time_ms(node: Span, spans: List[Span]) -> float:
+    """Собственное время отрезка (без дочерних)."""
+    children_ms = sum(s.duration_ms for s in spans if s.parent_id == node.span_id)
+    return max(0.0, node.duration_ms - children_ms)
@@ -0,0 +1,42 @@
+"""Общие фикстуры: конфигурация, база данных во временном каталоге и бот поверх них."""
+import json
+
+import pytest
+
+from solipsist.config import loader
+from solipsist.config.loader import Config
+from solipsist.core.bot import SolipsistBot
+from solipsist.storage.database import Database
+
+
+@pytest.fixture
+def make_config(tmp_path, monkeypatch):
+    """Подставить вместо config.json конфигурацию из словаря."""
+    def make(data=None):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps(data or {}), encoding="utf-8")
+        config = Config(str(path))
+        monkeypatch.setattr(loader, "_config", config)
+        return config
+    return make
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "solipsist.db"))
+
+
+@pytest.fixture
+def make_bot(make_config, db):
+    """Бот поверх временной БД с поддельными сервисами; поток состояния закрывается после теста."""
+    bots = []
+
+    def make(vk=None, config=None):
+        make_config(config)
+        bot = SolipsistBot(llm=object(), vk=vk or object(), db=db)
+        bots.append(bot)
+        return bot
+
+    yield make
+    for bot in bots:
+        bot.state.close()
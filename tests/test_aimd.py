@@ -0,0 +1,116 @@
+"""Подстройка лимита параллельных запросов (solipsist.utils.aimd)."""
+import types
+
+import pytest
+
+from solipsist.utils import aimd
+from solipsist.utils.aimd import AIMDController
+from solipsist.utils.priority import PriorityGate
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Часы регулятора, которые двигает тест (начинаются с 0, как у только что запущенного хоста)."""
+    now = types.SimpleNamespace(value=0.0)
+    monkeypatch.setattr(aimd, "time", types.SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def controller(limit=4, reserve=0, **kwargs) -> AIMDController:
+    return AIMDController(PriorityGate(limit, reserve), **kwargs)
+
+
+def test_initial_limit_is_clamped_to_bounds():
+    assert controller(limit=40, max_limit=16).gate.limit == 16
+    assert controller(limit=1, min_limit=3).gate.limit == 3
+
+
+def test_floor_leaves_background_a_slot_above_the_reserve():
+    regulator = controller(limit=4, reserve=2, min_limit=1)
+    assert regulator.min_limit == 3
+
+
+def test_limit_grows_only_when_gate_is_saturated(clock):
+    regulator = controller(limit=4, max_limit=6)
+    for _ in range(20):
+        regulator.on_success("m", 1.0, in_flight=3)
+    assert regulator.gate.limit == 4
+
+    # Рост на increase за каждые limit успешных ответов при полной загрузке
+    for _ in range(3):
+        regulator.on_success("m", 1.0, in_flight=4)
+    assert regulator.gate.limit == 4
+    regulator.on_success("m", 1.0, in_flight=4)
+    assert regulator.gate.limit == 5
+
+    for _ in range(50):
+        regulator.on_success("m", 1.0, in_flight=regulator.gate.limit)
+    assert regulator.gate.limit == 6
+    assert regulator.stats()["increases"] == 2
+
+
+def test_first_overload_cuts_limit_even_right_after_start(clock):
+    regulator = controller(limit=8, cooldown=5.0)
+    regulator.on_overload("HTTP 503")
+    assert regulator.gate.limit == 4
+
+
+def test_cooldown_between_decreases(clock):
+    regulator = controller(limit=16, cooldown=5.0)
+    regulator.on_overload("HTTP 503")
+    clock.value = 4.9
+    regulator.on_overload("HTTP 503")
+    assert regulator.gate.limit == 8
+
+    clock.value = 5.0
+    regulator.on_overload("HTTP 503")
+    assert regulator.gate.limit == 4
+    stats = regulator.stats()
+    assert stats["overloads"] == 3
+    assert stats["decreases"] == 2
+
+
+def test_decrease_stops_at_min_limit(clock):
+    regulator = controller(limit=8, min_limit=2, cooldown=0)
+    for _ in range(10):
+        regulator.on_overload("timeout")
+    assert regulator.gate.limit == 2
+
+
+def test_overload_resets_progress_towards_increase(clock):
+    regulator = controller(limit=4, cooldown=0, decrease=1.0)
+    for _ in range(3):
+        regulator.on_success("m", 1.0, in_flight=4)
+    regulator.on_overload("HTTP 429")
+    regulator.on_success("m", 1.0, in_flight=4)
+    assert regulator.gate.limit == 4
+
+
+def test_retry_after_pauses_the_gate(clock):
+    regulator = controller(limit=4)
+    regulator.on_overload("HTTP 429", retry_after=30)
+    assert regulator.gate.paused_for() > 0
+
+
+def test_latency_spike_after_warmup(clock):
+    regulator = controller(limit=8, spike_factor=3.0, cooldown=0)
+    # До установления базовой задержки всплески не учитываются
+    regulator.on_success("m", 1.0, in_flight=1)
+    regulator.on_success("m", 10.0, in_flight=1)
+    assert regulator.gate.limit == 8
+
+    regulator = controller(limit=8, spike_factor=3.0, cooldown=0)
+    for _ in range(5):
+        regulator.on_success("m", 1.0, in_flight=1)
+    regulator.on_success("m", 2.9, in_flight=1)
+    assert regulator.gate.limit == 8
+    regulator.on_success("m", 10.0, in_flight=1)
+    assert regulator.gate.limit == 4
+    assert regulator.stats()["latency_spikes"] == 1
+
+    # Всплеск не сдвигает базовую задержку: следующий такой же - снова всплеск
+    regulator.on_success("m", 10.0, in_flight=1)
+    assert regulator.gate.limit == 2
+    # Базовая задержка - своя у каждого ключа
+    regulator.on_success("other", 10.0, in_flight=1)
+    assert regulator.gate.limit == 2
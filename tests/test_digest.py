@@ -0,0 +1,100 @@
+"""Свёртка монологов в дайджест и материал манифеста (solipsist.logic.digest)."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from solipsist.logic.digest import MonologueDigest
+from solipsist.storage.models import Monologue
+
+START = datetime(2026, 1, 1, 12, 0)
+
+
+class FakeLLM:
+    """Свёртка возвращает перечень свёрнутых мыслей; during_fold вызывается посреди запроса."""
+
+    def __init__(self):
+        self.during_fold = None
+
+    def max_tokens_for(self, role, default=500):
+        return default
+
+    def fit_context(self, role, items, reserved=0, share=1.0):
+        return list(items)
+
+    def think(self, prompt, temperature=0.7, role="thinking"):
+        if self.during_fold is not None:
+            during_fold, self.during_fold = self.during_fold, None
+            during_fold()
+        skeletons = [line[2:] for line in prompt.splitlines() if line.startswith("- ") and "мысль" in line]
+        return "свод: " + ", ".join(skeletons)
+
+
+@pytest.fixture
+def llm():
+    return FakeLLM()
+
+
+@pytest.fixture
+def digest(make_config, db, llm):
+    make_config({"digest": {"fold_batch": 10, "max_raw_monologues": 3}})
+    return MonologueDigest(llm, db)
+
+
+def add_monologues(db, *names):
+    for index, name in enumerate(names):
+        db.save_monologue(Monologue(
+            monologue_id=name,
+            thoughts=[f"мысль {name}"],
+            timestamp=START + timedelta(minutes=len(name) * 10 + index)
+        ))
+
+
+def test_manifest_material_is_used_once(digest, db):
+    add_monologues(db, "a", "b")
+    assert digest.fold_pending()
+    add_monologues(db, "cc")
+
+    material = digest.material()
+    assert material.digest == "свод: мысль a, мысль b"
+    assert [m.monologue_id for m in material.monologues] == ["cc"]
+    assert sorted(material.monologue_ids) == ["a", "b", "cc"]
+
+    digest.consume(material)
+    assert digest.material().empty
+    assert db.get_digest().content == ""
+
+
+def test_fold_loses_to_a_manifest_that_consumed_the_digest(digest, db, llm):
+    add_monologues(db, "a")
+    assert digest.fold_pending()
+    add_monologues(db, "bb")
+
+    # Пока модель сворачивает "bb", манифест забирает дайджест с "a"
+    llm.during_fold = lambda: digest.consume(digest.material())
+    assert not digest.fold_pending()
+
+    # Свёртка не записалась поверх очищенного дайджеста: "bb" уже ушёл в манифест
+    assert db.get_digest().content == ""
+    assert [m.monologue_id for m in db.get_unconsumed_monologues(digested=False, limit=10)] == []
+    add_monologues(db, "ccc")
+    assert digest.fold_pending()
+    assert db.get_digest().monologue_ids == ["ccc"]
+
+
+def test_material_folded_after_it_was_taken_is_not_lost(digest, db):
+    add_monologues(db, "a")
+    assert digest.fold_pending()
+    material = digest.material()
+
+    # Пока генерируется манифест, в дайджест сворачивается новый монолог
+    add_monologues(db, "bb")
+    assert digest.fold_pending()
+    assert db.get_digest().monologue_ids == ["a", "bb"]
+
+    digest.consume(material)
+    assert db.get_digest().content == ""
+    # "bb" не попал в манифест: он снова несвёрнутый и войдёт в следующий
+    following = digest.material()
+    assert [m.monologue_id for m in following.monologues] == ["bb"]
+    assert digest.fold_pending()
+    assert db.get_digest().content == "свод: мысль bb"
@@ -0,0 +1,145 @@
+"""Сбор комментариев с ответами в ветках и курсоры опроса (solipsist.core.ingest)."""
+import pytest
+
+from solipsist.core.ingest import ROOT_THREAD, CommentIngestor
+
+POST = "1"
+
+
+class FakeWall:
+    """wall.getComments одного поста: комментарии верхнего уровня и их ветки."""
+
+    def __init__(self):
+        self.threads = {}
+        self.calls = 0
+        self.fail_calls = set()
+
+    def add(self, root_id, replies=()):
+        self.threads[root_id] = list(replies)
+
+    def get_comments_page(self, post_id, count=100, offset=0, sort="asc", thread_items_count=0,
+                          comment_id=None, start_comment_id=None):
+        self.calls += 1
+        if self.calls in self.fail_calls:
+            return None
+
+        if comment_id:
+            replies = self.threads[int(comment_id)]
+            if start_comment_id:
+                # start_comment_id включает сам комментарий
+                replies = [r for r in replies if r >= int(start_comment_id)]
+            return {"count": len(self.threads[int(comment_id)]), "items": [{"id": r} for r in replies[:count]]}
+
+        roots = sorted(self.threads, reverse=(sort == "desc"))
+        items = [
+            {
+                "id": root,
+                "thread": {
+                    "count": len(self.threads[root]),
+                    "items": [{"id": r} for r in self.threads[root][:thread_items_count]]
+                }
+            }
+            for root in roots[offset:offset + count]
+        ]
+        total = len(roots) + sum(len(replies) for replies in self.threads.values())
+        return {"count": total, "current_level_count": len(roots), "items": items}
+
+    def parse_comment(self, comment, post_id, thread_id=None):
+        return {"id": str(comment["id"]), "post_id": post_id, "thread_id": thread_id}
+
+
+@pytest.fixture
+def wall():
+    return FakeWall()
+
+
+@pytest.fixture
+def make_ingestor(make_config, db, wall):
+    def make(page_size=100, thread_items_count=10, max_pages=5):
+        make_config({"comments": {
+            "page_size": page_size,
+            "thread_items_count": thread_items_count,
+            "max_pages_per_poll": max_pages
+        }})
+        return CommentIngestor(wall, db)
+    return make
+
+
+def ids(comments):
+    return [int(c["id"]) for c in comments]
+
+
+def test_inline_replies_come_with_their_roots(make_ingestor, wall):
+    wall.add(1, [2, 5])
+    wall.add(3, [4])
+    comments = make_ingestor().fetch(POST)
+    assert ids(comments) == [1, 2, 3, 4, 5]
+    assert {c["id"]: c["thread_id"] for c in comments if c["thread_id"]} == {"2": "1", "5": "1", "4": "3"}
+    assert wall.calls == 1
+
+
+def test_overflowing_thread_is_read_again_only_when_it_grows(make_ingestor, wall, db):
+    wall.add(1, list(range(10, 25)))
+    ingestor = make_ingestor(thread_items_count=3)
+
+    assert ids(ingestor.fetch(POST)) == [1] + list(range(10, 25))
+    assert wall.calls == 2
+    assert db.get_thread_cursors(POST)["1"] == (15, "24")
+
+    ingestor.fetch(POST)
+    assert wall.calls == 3
+
+    wall.threads[1].append(30)
+    assert 30 in ids(ingestor.fetch(POST))
+    assert wall.calls == 5
+    assert db.get_thread_cursors(POST)["1"] == (16, "30")
+
+
+def test_root_walk_stops_at_the_cursor(make_ingestor, wall, db):
+    for root in range(1, 6):
+        wall.add(root)
+    ingestor = make_ingestor(page_size=2)
+
+    assert ids(ingestor.fetch(POST)) == [1, 2, 3, 4, 5]
+    assert wall.calls == 3
+    assert db.get_thread_cursors(POST)[ROOT_THREAD] == (5, "5")
+
+    wall.add(6)
+    assert ids(ingestor.fetch(POST)) == [5, 6]
+    assert wall.calls == 4
+    assert db.get_thread_cursors(POST)[ROOT_THREAD] == (6, "6")
+
+
+def test_failed_first_page_fails_the_poll(make_ingestor, wall, db):
+    wall.add(1)
+    wall.fail_calls.add(1)
+    assert make_ingestor().fetch(POST) is None
+    assert db.get_thread_cursors(POST) == {}
+
+
+def test_failed_later_page_keeps_the_root_cursor(make_ingestor, wall, db):
+    for root in range(1, 4):
+        wall.add(root)
+    ingestor = make_ingestor(page_size=2)
+    ingestor.fetch(POST)
+
+    for root in range(4, 9):
+        wall.add(root)
+    wall.fail_calls.add(wall.calls + 2)
+    # Первая страница пришла, вторая нет: курсор на месте, пропуска 4-6 не будет
+    assert ids(ingestor.fetch(POST)) == [7, 8]
+    assert db.get_thread_cursors(POST)[ROOT_THREAD] == (3, "3")
+
+    assert ids(ingestor.fetch(POST)) == [3, 4, 5, 6, 7, 8]
+    assert db.get_thread_cursors(POST)[ROOT_THREAD] == (8, "8")
+
+
+def test_root_cursor_is_not_moved_when_page_limit_runs_out(make_ingestor, wall, db):
+    wall.add(1)
+    ingestor = make_ingestor(page_size=2, max_pages=2)
+    ingestor.fetch(POST)
+
+    for root in range(2, 8):
+        wall.add(root)
+    assert ids(ingestor.fetch(POST)) == [4, 5, 6, 7]
+    assert db.get_thread_cursors(POST)[ROOT_THREAD] == (1, "1")
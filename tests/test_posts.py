@@ -0,0 +1,136 @@
+"""Уровни активности постов и опрос комментариев по ним (solipsist.core.posts)."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from solipsist.core.posts import TIER_COLD, TIER_HOT, TIER_WARM, PostActivityTracker
+from solipsist.storage.models import Comment
+
+START = datetime(2026, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def tracker(make_config, db):
+    make_config({"posts": {
+        "poll_seconds": {"hot": 0, "warm": 600, "cold": 3600},
+        "hot_window_seconds": 1800,
+        "warm_window_seconds": 86400,
+        "hot_rate_per_hour": 2.0
+    }})
+    return PostActivityTracker(db)
+
+
+def test_new_post_is_hot_and_due(tracker):
+    tracker.observe_posts([{"id": 1, "comments_count": 0, "date": START}], now=START)
+    assert tracker.due_posts(now=START) == ["1"]
+    assert tracker.tier_counts()[TIER_HOT] == 1
+
+
+def test_quiet_post_cools_down_and_is_skipped_while_count_is_unchanged(tracker):
+    tracker.observe_posts([{"id": 1, "comments_count": 0, "date": START}], now=START)
+    tracker.record_poll("1", 0, now=START)
+
+    later = START + timedelta(hours=2)
+    tracker.record_poll("1", 0, now=later)
+    assert tracker.tier_counts()[TIER_WARM] == 1
+
+    much_later = later + timedelta(days=2)
+    tracker.record_poll("1", 0, now=much_later)
+    assert tracker.tier_counts()[TIER_COLD] == 1
+
+    # Счётчик в wall.get не изменился - опрос холодного поста ничего не даст
+    tracker.observe_posts([{"id": 1, "comments_count": 0}], now=much_later + timedelta(days=1))
+    assert tracker.due_posts(now=much_later + timedelta(days=1)) == []
+
+
+def test_grown_count_promotes_post_to_hot(tracker):
+    tracker.observe_posts([{"id": 1, "comments_count": 0, "date": START}], now=START)
+    tracker.record_poll("1", 0, now=START + timedelta(days=2))
+    assert tracker.tier_counts()[TIER_COLD] == 1
+
+    now = START + timedelta(days=2, minutes=1)
+    tracker.observe_posts([{"id": 1, "comments_count": 3}], now=now)
+    assert tracker.due_posts(now=now) == ["1"]
+    assert tracker.tier_counts()[TIER_HOT] == 1
+
+
+def test_unfinished_poll_keeps_post_due_and_old_count(tracker, db):
+    tracker.observe_posts([{"id": 1, "comments_count": 0, "date": START}], now=START)
+    tracker.record_poll("1", 0, now=START)
+    tracker.observe_posts([{"id": 1, "comments_count": 2}], now=START)
+
+    tracker.record_poll("1", 2, now=START, keep_due=True)
+    assert tracker.due_posts(now=START) == ["1"]
+    assert db.get_post_activities()[0].comments_count == 0
+
+    tracker.record_poll("1", 1, now=START)
+    assert db.get_post_activities()[0].comments_count == 2
+
+
+class FakeWall:
+    """Стена из одного поста для VKClient и CommentIngestor; fail - сколько опросов провалить."""
+
+    def __init__(self, comments):
+        self.comments = comments
+        self.fail = 0
+
+    def get_recent_posts(self, count=10):
+        return [{"id": 1, "comments_count": len(self.comments), "date": START}]
+
+    def fetch(self, post_id):
+        if self.fail:
+            self.fail -= 1
+            return None
+        return list(self.comments)
+
+
+@pytest.fixture
+def wall_bot(make_bot):
+    """Бот с поддельной стеной; process_comment сохраняет комментарий, если он не в failing."""
+    def make(comments):
+        bot = make_bot(vk=FakeWall(comments), config={"vk": {"group_id": 100}, "posts": {"poll_seconds": {"hot": 3600}}})
+        bot.ingestor = bot.vk
+        bot.failing = set()
+        bot.processed = []
+
+        def process_comment(comment_data):
+            comment_id = str(comment_data["id"])
+            bot.processed.append(comment_id)
+            if comment_id in bot.failing:
+                return None
+            bot.db.save_comment(Comment(comment_id=comment_id, post_id="1", author_id="5", text=comment_data["text"]))
+            return None
+
+        bot.process_comment = process_comment
+        return bot
+    return make
+
+
+def comment(comment_id):
+    return {"id": comment_id, "post_id": "1", "author_id": "5", "text": f"комментарий {comment_id}"}
+
+
+def test_failed_fetch_keeps_post_due(wall_bot, db):
+    bot = wall_bot([comment(10)])
+    bot.vk.fail = 1
+    assert bot.run_comment_check() == {}
+    assert db.get_post_activities()[0].last_polled is None
+
+    # Пост опрашивается в следующую проверку, хотя горячие посты - раз в час
+    assert bot.run_comment_check() == {"1": 1}
+    assert bot.processed == ["10"]
+
+
+def test_comment_that_failed_processing_is_retried(wall_bot, db):
+    bot = wall_bot([comment(10), comment(11)])
+    bot.failing.add("11")
+    assert bot.run_comment_check() == {"1": 2}
+    assert db.get_post_activities()[0].comments_count == 0
+
+    bot.failing.clear()
+    assert bot.run_comment_check() == {"1": 1}
+    assert bot.processed == ["10", "11", "11"]
+    assert db.get_post_activities()[0].comments_count == 2
+
+    # Всё обработано - до конца часового интервала пост не опрашивается
+    assert bot.run_comment_check() == {}
@@ -0,0 +1,109 @@
+"""Шлюз параллельных запросов с классами приоритета (solipsist.utils.priority)."""
+import asyncio
+import threading
+import time
+
+from solipsist.utils.priority import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_REPLY,
+    PriorityGate,
+    current_priority,
+    llm_priority
+)
+
+
+def test_llm_priority_context():
+    assert current_priority() == PRIORITY_INTERACTIVE
+    with llm_priority(PRIORITY_BACKGROUND):
+        assert current_priority() == PRIORITY_BACKGROUND
+        with llm_priority(PRIORITY_REPLY):
+            assert current_priority() == PRIORITY_REPLY
+        assert current_priority() == PRIORITY_BACKGROUND
+    assert current_priority() == PRIORITY_INTERACTIVE
+
+
+def test_background_does_not_take_reserved_slots():
+    gate = PriorityGate(limit=3, reserve=1)
+    assert gate.acquire(PRIORITY_BACKGROUND, timeout=0)
+    assert gate.acquire(PRIORITY_BACKGROUND, timeout=0)
+    assert not gate.acquire(PRIORITY_BACKGROUND, timeout=0.01)
+    # Последнее место - для ответов и восприятия
+    assert gate.acquire(PRIORITY_REPLY, timeout=0)
+    assert not gate.acquire(PRIORITY_REPLY, timeout=0.01)
+    assert gate.stats()["in_flight"] == 3
+
+
+def test_background_waits_when_limit_is_within_reserve():
+    gate = PriorityGate(limit=1, reserve=1)
+    assert not gate.acquire(PRIORITY_BACKGROUND, timeout=0.01)
+    assert gate.acquire(PRIORITY_INTERACTIVE, timeout=0)
+
+    gate.release()
+    gate.set_limit(2)
+    assert gate.acquire(PRIORITY_BACKGROUND, timeout=0)
+
+
+def test_free_slot_goes_to_the_most_urgent_waiter():
+    gate = PriorityGate(limit=1, reserve=0)
+    assert gate.acquire(PRIORITY_INTERACTIVE)
+    order = []
+
+    def wait(level):
+        assert gate.acquire(level, timeout=5)
+        order.append(level)
+        gate.release()
+
+    background = threading.Thread(target=wait, args=(PRIORITY_BACKGROUND,))
+    background.start()
+    time.sleep(0.05)
+    reply = threading.Thread(target=wait, args=(PRIORITY_REPLY,))
+    reply.start()
+    time.sleep(0.05)
+
+    gate.release()
+    background.join(timeout=5)
+    reply.join(timeout=5)
+    assert order == [PRIORITY_REPLY, PRIORITY_BACKGROUND]
+
+
+def test_waiting_urgent_request_blocks_less_urgent_ones():
+    gate = PriorityGate(limit=1, reserve=0)
+    assert gate.acquire(PRIORITY_BACKGROUND)
+    waiter = threading.Thread(target=gate.acquire, args=(PRIORITY_REPLY, 5))
+    waiter.start()
+    time.sleep(0.05)
+
+    # Место освободится для ответа, интерактивный запрос его не перехватит
+    assert not gate.acquire(PRIORITY_INTERACTIVE, timeout=0.01)
+    gate.release()
+    waiter.join(timeout=5)
+    assert gate.stats()["acquired"]["reply"] == 1
+    assert gate.stats()["waiting"] == {"reply": 0, "interactive": 0, "background": 0}
+
+
+def test_pause_delays_new_requests():
+    gate = PriorityGate(limit=2)
+    gate.pause(0.2)
+    assert gate.paused_for() > 0
+    assert not gate.acquire(PRIORITY_REPLY, timeout=0.05)
+    # Конец паузы никто не объявляет - ожидающий просыпается сам
+    assert gate.acquire(PRIORITY_REPLY, timeout=1)
+
+
+def test_acquire_async_shares_the_budget_with_threads():
+    gate = PriorityGate(limit=2, reserve=1)
+
+    async def scenario():
+        assert await gate.acquire_async(PRIORITY_BACKGROUND, timeout=0)
+        assert not await gate.acquire_async(PRIORITY_BACKGROUND, timeout=0.01)
+
+        waiter = asyncio.ensure_future(gate.acquire_async(PRIORITY_BACKGROUND, timeout=5))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        # Освобождение из другого потока будит корутину
+        threading.Thread(target=gate.release).start()
+        assert await waiter
+
+    asyncio.run(scenario())
+    assert gate.in_flight == 1
@@ -0,0 +1,74 @@
+"""Возобновление обработки комментария с последнего завершённого этапа (solipsist.core.bot)."""
+import pytest
+
+
+class Stage:
+    """Этап пайплайна: считает вызовы, первые fail вызовов падают."""
+
+    def __init__(self, result=None):
+        self.result = result
+        self.calls = 0
+        self.fail = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("stage failed")
+        return self.result
+
+
+class Fake:
+    """Объект с заданными методами-этапами."""
+
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+
+@pytest.fixture
+def bot(make_bot, monkeypatch):
+    bot = make_bot(vk=Fake(reply_to_comment=Stage(500)), config={"vk": {"group_id": 100}})
+    bot.reply = bot.vk.reply_to_comment
+    bot.perceive = Stage({"sentiment": "neutral"})
+    bot.classify = Stage("observer")
+    bot.update_state = Stage()
+    bot.respond = Stage("ответ")
+    bot.text_perception = Fake(analyze=bot.perceive)
+    bot.classifier = Fake(classify=bot.classify)
+    bot.response_generator = Fake(generate=bot.respond)
+    monkeypatch.setattr(bot.state, "update_after_comment", bot.update_state)
+    return bot
+
+
+COMMENT = {"id": 10, "post_id": "1", "author_id": "5", "text": "вопрос"}
+
+
+def test_comment_resumes_after_the_failed_stage(bot, db):
+    bot.respond.fail = 1
+    assert bot.process_comment(COMMENT) is None
+    assert db.get_comment("10") is None
+    assert db.get_comment_progress("10").stage == "state"
+
+    assert bot.process_comment(COMMENT) == "ответ"
+    # Восприятие, классификация и состояние не повторялись
+    assert (bot.perceive.calls, bot.classify.calls, bot.update_state.calls) == (1, 1, 1)
+    assert bot.respond.calls == 2
+    assert bot.reply.calls == 1
+
+    saved = db.get_comment("10")
+    assert saved.classified_as == "observer"
+    assert saved.response_text == "ответ"
+    progress = db.get_comment_progress("10")
+    assert progress.stage == "done"
+    assert progress.reply_id == "500"
+
+
+def test_interrupted_reply_is_not_published_twice(bot, db):
+    bot.reply.fail = 1
+    assert bot.process_comment(COMMENT) is None
+    assert db.get_comment_progress("10").stage == "reply_started"
+
+    assert bot.process_comment(COMMENT) == "ответ"
+    assert bot.reply.calls == 1
+    assert db.get_comment("10").responded
+    assert db.get_comment_progress("10").stage == "done"
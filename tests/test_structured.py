@@ -0,0 +1,164 @@
+"""Потоковый разбор JSON и проверка по схеме (solipsist.utils.structured)."""
+import pytest
+
+from solipsist.utils.structured import (
+    IncrementalJSONParser,
+    invalid_fields,
+    parse_json,
+    subschema,
+    valid_fields,
+    validate
+)
+
+
+def feed_in_chunks(text: str, size: int) -> IncrementalJSONParser:
+    parser = IncrementalJSONParser()
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+    return parser
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_fields_survive_any_chunking(size):
+    text = '{"sentiment": "negative", "score": 0.25, "tags": ["a", "b"], "meta": {"x": 1}}'
+    parser = feed_in_chunks(text, size)
+    assert parser.done
+    assert parser.fields == {"sentiment": "negative", "score": 0.25, "tags": ["a", "b"], "meta": {"x": 1}}
+    assert parser.broken == []
+
+
+def test_escapes_and_braces_inside_strings():
+    text = r'{"a": "кавычка \" и скобки } ] {, запятая", "b": "обратный слеш \\", "c": 2}'
+    parser = feed_in_chunks(text, 1)
+    assert parser.fields == {"a": 'кавычка " и скобки } ] {, запятая', "b": "обратный слеш \\", "c": 2}
+    assert parser.done
+
+
+def test_fields_are_available_before_the_object_closes():
+    parser = IncrementalJSONParser()
+    assert not parser.feed('{"first": 1, "second": [1, 2')
+    assert parser.fields == {"first": 1}
+    assert parser.feed('], "third": null}')
+    assert parser.fields == {"first": 1, "second": [1, 2], "third": None}
+
+
+def test_text_around_json_is_ignored():
+    text = 'Вот ответ:\n```json\n{"label": "observer"}\n```\nИ ещё {"label": "noise"}'
+    parser = IncrementalJSONParser()
+    assert parser.feed(text)
+    assert parser.fields == {"label": "observer"}
+    # После закрытия контейнера новые фрагменты не читаются
+    assert parser.feed('{"other": 1}')
+    assert parser.fields == {"label": "observer"}
+
+
+def test_broken_member_does_not_spoil_the_others():
+    parser = IncrementalJSONParser()
+    parser.feed('{"a": 1, "b": nope, "c": "ok"}')
+    assert parser.fields == {"a": 1, "c": "ok"}
+    assert parser.broken == ['"b": nope']
+
+
+def test_array_items():
+    parser = IncrementalJSONParser()
+    parser.feed('Классы: [1, {"x": [2, 3]}, "a,b", oops]')
+    assert parser.container == "["
+    assert parser.items == [1, {"x": [2, 3]}, "a,b"]
+    assert parser.broken == ["oops"]
+    assert parser.result() == parser.items
+
+
+def test_unterminated_object_keeps_finished_fields():
+    parser = IncrementalJSONParser()
+    assert not parser.feed('{"a": 1, "b": "обрыв на середи')
+    assert not parser.done
+    assert parser.result() == {"a": 1}
+
+
+@pytest.mark.parametrize("text", ["", None, "без JSON", "```\n```"])
+def test_parse_json_without_json(text):
+    assert parse_json(text) is None
+
+
+def test_parse_json_empty_containers():
+    assert parse_json("{}") == {}
+    assert parse_json("[]") == []
+
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "label": {"type": "string", "enum": ["observer", "echo", "noise"]},
+        "score": {"type": "number", "minimum": 0, "maximum": 1},
+        "count": {"type": "integer"},
+        "text": {"type": "string", "minLength": 2},
+        "tags": {"type": "array", "items": {"type": "string"}, "minItems": 1, "maxItems": 2},
+        "meta": {
+            "type": "object",
+            "properties": {"source": {"type": "string"}},
+            "required": ["source"]
+        }
+    },
+    "required": ["label", "score"]
+}
+
+
+def test_valid_object_has_no_errors():
+    value = {"label": "echo", "score": 0.5, "count": 3, "text": "ok", "tags": ["a"], "meta": {"source": "vk"}}
+    assert validate(value, SCHEMA) == []
+    assert invalid_fields(value, SCHEMA) == {}
+
+
+def test_type_mismatch_stops_further_checks():
+    assert validate("5", {"type": "integer", "minimum": 10}) == ["value: expected integer, got str"]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (True, "integer"),
+    (False, "number"),
+    (1.5, "integer")
+])
+def test_booleans_and_floats_are_not_integers(value, expected):
+    assert validate(value, {"type": expected})
+
+
+def test_union_types():
+    schema = {"type": ["string", "null"]}
+    assert validate(None, schema) == []
+    assert validate("x", schema) == []
+    assert validate(1, schema)
+
+
+def test_invalid_fields_are_reported_by_top_level_field():
+    value = {
+        "label": "unknown",
+        "score": 1.5,
+        "text": "x",
+        "tags": ["a", 2, "c"],
+        "meta": {},
+        "extra": "не в схеме"
+    }
+    errors = invalid_fields(value, SCHEMA)
+    assert set(errors) == {"label", "score", "text", "tags", "meta"}
+    assert errors["score"] == ["score: 1.5 > 1"]
+    assert "tags[1]: expected string, got int" in errors["tags"]
+    assert "tags: more than 2 items" in errors["tags"]
+    assert errors["meta"] == ["meta.source: missing"]
+
+
+def test_missing_required_fields():
+    assert invalid_fields({}, SCHEMA) == {"label": ["label: missing"], "score": ["score: missing"]}
+
+
+def test_valid_fields_keeps_only_known_valid_fields():
+    value = {"label": "noise", "score": -1, "extra": 1}
+    assert valid_fields(value, SCHEMA) == {"label": "noise"}
+
+
+def test_subschema_for_retry():
+    schema = subschema(SCHEMA, ["score", "tags", "unknown"])
+    assert set(schema["properties"]) == {"score", "tags"}
+    assert schema["required"] == ["score"]
+    assert schema["type"] == "object"
+    # Исходная схема не меняется
+    assert set(SCHEMA["properties"]) == {"label", "score", "count", "text", "tags", "meta"}
@@ -0,0 +1,100 @@
+"""Оценка токенов и подгонка контекста под бюджет (solipsist.utils.tokens)."""
+import pytest
+
+from solipsist.utils.tokens import TRUNCATION_MARK, OutputLengths, estimate_tokens, fit_tokens, truncate_tokens
+
+
+def test_estimate_tokens_by_script():
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("абв" * 10) == 10
+    assert estimate_tokens("思考" * 5) == 10
+    # Любой непустой текст - хотя бы токен
+    assert estimate_tokens("a") == 1
+
+
+def test_truncate_tokens_keeps_short_text():
+    text = "короткий текст"
+    assert truncate_tokens(text, 100) is text
+
+
+def test_truncate_tokens_to_zero():
+    assert truncate_tokens("какой-то текст", 0) == ""
+
+
+@pytest.mark.parametrize("max_tokens", [1, 2, 5, 17, 40])
+def test_truncate_tokens_fits_budget(max_tokens):
+    text = "слово " * 100 + "思考" * 30
+    result = truncate_tokens(text, max_tokens)
+    assert result.endswith(TRUNCATION_MARK)
+    assert estimate_tokens(result) <= max_tokens
+    assert text.startswith(result[:-len(TRUNCATION_MARK)])
+
+
+def test_truncate_tokens_cuts_at_word_boundary():
+    text = " ".join(f"word{i}" for i in range(100))
+    result = truncate_tokens(text, 20)
+    # Последнее слово не разрезано
+    assert result[:-len(TRUNCATION_MARK)].split()[-1] in text.split()
+
+
+def test_fit_tokens_under_budget_returns_copy():
+    items = ["a", "b"]
+    result = fit_tokens(items, 100)
+    assert result == items
+    assert result is not items
+
+
+def test_fit_tokens_trims_only_long_items():
+    short = "коротко"
+    long_a = "длинный текст " * 50
+    long_b = "ещё длиннее " * 80
+    budget = 60
+    result = fit_tokens([long_a, short, long_b], budget)
+
+    # Порядок сохранён, короткий текст не тронут, длинные обрезаны
+    assert result[1] == short
+    assert result[0].endswith(TRUNCATION_MARK) and result[2].endswith(TRUNCATION_MARK)
+    assert sum(estimate_tokens(item) for item in result) <= budget
+
+
+def test_fit_tokens_redistributes_unused_share():
+    small = "x" * 8   # 2 токена
+    medium = "y" * 60  # 15 токенов
+    large = "z" * 400  # 100 токенов
+    result = fit_tokens([small, medium, large], 45)
+    # Равная доля - 15: small и medium умещаются, large получает остаток 28
+    assert result[:2] == [small, medium]
+    assert estimate_tokens(result[2]) <= 28
+    assert estimate_tokens(result[2]) >= 25
+
+
+def test_fit_tokens_with_zero_budget():
+    assert fit_tokens(["текст", "ещё текст"], 0) == ["", ""]
+
+
+def test_fit_tokens_with_tiny_budget_keeps_something_of_each():
+    items = ["слово " * 20] * 3
+    result = fit_tokens(items, 3)
+    assert [estimate_tokens(item) for item in result] == [1, 1, 1]
+
+
+def test_output_lengths_uses_limit_until_enough_samples():
+    lengths = OutputLengths(min_samples=5, quantile=95, headroom=1.5, floor=10)
+    for _ in range(4):
+        lengths.observe("response", 20)
+    assert lengths.max_tokens("response", 200) == 200
+
+    lengths.observe("response", 20)
+    assert lengths.max_tokens("response", 200) == 30
+    # Не больше заданного предела
+    assert lengths.max_tokens("response", 25) == 25
+
+
+def test_output_lengths_floor():
+    lengths = OutputLengths(min_samples=1, floor=10)
+    lengths.observe("classification", 1)
+    assert lengths.max_tokens("classification", 200) == 10
+    # Предел ниже floor соблюдается
+    assert lengths.max_tokens("classification", 5) == 5